@@ -0,0 +1,9 @@
+#!/usr/bin/env bash
+if [ $# -eq 0 ]
+  then
+     echo usage: ./batch.sh jobs_dir_or_job.json [...]
+     exit 1
+fi
+cd $(dirname "$0")
+export PYTHONPATH=src
+python src/batch.py "$@"
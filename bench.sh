@@ -0,0 +1,15 @@
+#!/usr/bin/env bash
+# usage: ./bench.sh [micro-benchmark options], ./bench.sh e2e [end-to-end options] or ./bench.sh imports
+cd $(dirname "$0")
+export PYTHONPATH=src
+if [ "$1" == "e2e" ]
+  then
+     shift
+     python src/bench/e2e.py "$@"
+elif [ "$1" == "imports" ]
+  then
+     shift
+     python src/bench/imports.py "$@"
+  else
+     python src/bench/micro.py "$@"
+fi
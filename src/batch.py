@@ -0,0 +1,127 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from driver import Driver
+from ingest.downloader import set_download_slots
+from ingest.planner import RetrievalPlanner
+from utils.executor import configure
+from utils.resources import configure as configure_resources
+from utils.general import load_sys_cfg
+from utils.times import esmf_now
+
+import concurrent.futures
+import multiprocessing as mp
+import os.path as osp
+import sys,logging,traceback,json,glob,time
+
+def job_files(paths):
+    """
+    List of job files from job files and directories of job files.
+
+    :param paths: list of paths to job JSON files or directories with job JSON files
+    :return: list of job files
+    """
+    files = []
+    for path in paths:
+        if osp.isdir(path):
+            files += sorted(glob.glob(osp.join(path,'*.json')))
+        else:
+            files.append(path)
+    return files
+
+def init_worker(slots, jobs):
+    """
+    Initialize a batch worker process with the download slots shared by all the workers, a
+    resource plan with its share of the memory budget and the cores, and an executor with
+    the workers of the plan.
+
+    :param slots: multiprocessing semaphore limiting the concurrent downloads
+    :param jobs: number of jobs running at the same time
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    set_download_slots(slots)
+    sys_cfg = load_sys_cfg()
+    plan = configure_resources(**dict(sys_cfg.get('resources',{}), jobs=jobs))
+    settings = sys_cfg.get('executor',{})
+    configure(**dict(settings, workers=settings.get('workers') or plan.executor_workers))
+
+def run_job(job_file):
+    """
+    Run all the stages of one job. 
+
+    :param job_file: path to the job JSON file
+    :return: dictionary with the status, job path, elapsed time and error of the job
+    """
+    t_init = time.time()
+    result = {'job_file': job_file}
+    try:
+        dv = Driver(job_file)
+        result['job_path'] = dv.job.job_path
+        dv.run()
+        result['status'] = 'SUCCESS'
+    except Exception as e:
+        logging.error('run_job - job {} failed with exception {}'.format(job_file,repr(e)))
+        traceback.print_exc()
+        result.update({'status': 'FAILURE', 'error': repr(e)})
+    result['elapsed'] = time.time()-t_init
+    return result
+
+class BatchRunner(object):
+    """
+    Runs many jobs in a shared pool of worker processes with a global concurrency limit.
+
+    The workers share the imports of the parent process, a limit of concurrent downloads, 
+    the downloaded files (a file lock avoids downloading the same file twice) and the stage
+    and decoded granule checkpoints of the workspace. The executor of the parallel stages is
+    not shared: each worker has its own one, sized with the share of the cores and the memory 
+    budget of one job, so the executors of all the jobs running at once fit in the node.
+    """
+
+    def __init__(self, paths, max_jobs=None, max_downloads=4, merge_retrieval=True):
+        """
+        Initialize the batch runner.
+
+        :param paths: list of paths to job JSON files or directories with job JSON files
+        :param max_jobs: maximum number of jobs running at the same time, number of CPUs if None
+        :param max_downloads: maximum number of concurrent downloads of all the jobs
+        :param merge_retrieval: retrieve the jobs overlapping in space and time with union queries
+        """
+        self.job_files = job_files(paths)
+        self.max_jobs = max_jobs or mp.cpu_count()
+        self.max_downloads = max_downloads
+        self.merge_retrieval = merge_retrieval
+        self.results = {}
+
+    def run(self):
+        """
+        Run all the jobs and save a summary of the results in the workspace.
+
+        :return: dictionary from job file to result
+        """
+        if self.merge_retrieval:
+            logging.info('BatchRunner.run - retrieving satellite data of {} jobs with union queries'.format(len(self.job_files)))
+            RetrievalPlanner(self.job_files).run(self.max_downloads)
+        logging.info('BatchRunner.run - running {0} jobs with {1} workers'.format(len(self.job_files),self.max_jobs))
+        with mp.Manager() as manager:
+            slots = manager.BoundedSemaphore(self.max_downloads)
+            # the jobs running at the same time share the memory budget and the cores
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_jobs, initializer=init_worker, initargs=(slots,self.max_jobs)) as executor:
+                futures = {executor.submit(run_job, job_file): job_file for job_file in self.job_files}
+                for future in concurrent.futures.as_completed(futures):
+                    result = future.result()
+                    logging.info('BatchRunner.run - job {0} finished with status {1}'.format(futures[future],result['status']))
+                    self.results[futures[future]] = result
+        sys_cfg = load_sys_cfg()
+        summary = osp.join(sys_cfg.workspace_path,'batch_'+esmf_now()+'.json')
+        json.dump(self.results, open(summary,'w'), indent=4, separators=(',', ': '))
+        logging.info('BatchRunner.run - summary of the results saved as {}'.format(summary))
+        return self.results
+
+
+if __name__=='__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) < 2:
+        print('usage: python src/batch.py job.json|jobs_dir [job.json|jobs_dir ...]')
+        sys.exit(1)
+    BatchRunner(sys.argv[1:]).run()
@@ -0,0 +1,136 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from bench.server import ArchiveConfig, ArchiveServer, Catalog
+from bench.synthetic import modis_shape, viirs_shape, swath, write_modis, write_viirs
+from utils.general import ensure_dir
+
+from datetime import timedelta
+import os.path as osp
+import argparse, json, logging, os, shutil, sys, tempfile, time
+
+# synthetic products of each source: writer, swath shape, swath size in degrees and collection version
+products = {'Terra': (write_modis, modis_shape, (23.,20.), '061', '.hdf'),
+            'Aqua': (write_modis, modis_shape, (23.,20.), '061', '.hdf'),
+            'SNPP': (write_viirs, viirs_shape, (30.,27.), '001', '.nc')}
+
+def build_catalog(catalog, data_path, base_url, sources, start, end, ngranules=2, scale=1., seed=0):
+    """
+    Generate the synthetic granule files of each source in a time window and add them to a catalog.
+
+    :param catalog: Catalog object to fill
+    :param data_path: directory of the generated files
+    :param base_url: URL of the archive server
+    :param sources: list of satellite source names, ex: ['Terra','Aqua','SNPP']
+    :param start: start of the time window as datetime
+    :param end: end of the time window as datetime
+    :param ngranules: number of granules of each source
+    :param scale: scale of the along-track dimension of the swaths
+    :param seed: random seed of the synthetic data
+    :return: the Catalog object
+    """
+    from ingest.planner import sat_classes
+    # the granules of all the sources alternate in the time window
+    step = (end-start)/float(ngranules*len(sources)+1)
+    for s,source in enumerate(sources):
+        sat = sat_classes[source]
+        write,shape,size,version,ext = products[source]
+        shape = (int(shape[0]*scale),shape[1])
+        for k in range(ngranules):
+            t = start+(k*len(sources)+s+1)*step
+            t = t-timedelta(minutes=t.minute % 5, seconds=t.second, microseconds=t.microsecond)
+            tag = 'A{0:04d}{1:03d}.{2:02d}{3:02d}.{4}.synthetic{5}'.format(t.year,t.timetuple().tm_yday,t.hour,t.minute,version,ext)
+            names = (sat.geo_prefix+'.'+tag, sat.fire_prefix+'.'+tag)
+            geo_path,fire_path = write(osp.join(data_path,source), shape, seed+100*s+k, names)
+            lon,lat = swath(shape, size=size, seed=seed+100*s+k)
+            bbox = (float(lon.min()),float(lon.max()),float(lat.min()),float(lat.max()))
+            times = (t.strftime('%Y-%m-%dT%H:%M:%S.000Z'),(t+timedelta(minutes=5)).strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+            catalog.add(sat.geo_prefix, sat.geo_collection_id, geo_path, times[0], times[1], bbox, base_url)
+            catalog.add(sat.fire_prefix, sat.fire_collection_id, fire_path, times[0], times[1], bbox, base_url)
+    return catalog
+
+def run_e2e(path, job, config, ngranules=2, scale=1., max_retries=3, seed=0):
+    """
+    Run the Driver end-to-end against a local archive server with synthetic granules.
+
+    A sandbox with its own etc/sys.json, workspace and ingest directories is created in path
+    and used as working directory, so the configuration is loaded from there.
+
+    :param path: sandbox directory
+    :param job: job dictionary with at least bbox, start_utc, end_utc and sat_sources
+    :param config: ArchiveConfig object of the server
+    :param ngranules: number of granules of each source
+    :param scale: scale of the along-track dimension of the swaths
+    :param max_retries: download retries of the downloader
+    :param seed: random seed of the synthetic data
+    :return: dictionary with the overall and per-stage times and the server statistics
+    """
+    path = osp.abspath(path)
+    cwd = os.getcwd()
+    os.chdir(ensure_dir(osp.join(path,'')))
+    try:
+        from utils.times import str_to_dt
+        catalog = Catalog()
+        with ArchiveServer(catalog, config) as server:
+            sys_cfg = {'workspace_path': osp.join(path,'work'), 'ingest_path': osp.join(path,'ingest'),
+                        'sleep_seconds': 0, 'download_sleep_seconds': 0, 'max_retries': max_retries,
+                        'wget': shutil.which('wget') or '/usr/bin/wget', 'wget_options': ['--read-timeout=10','--tries=1'],
+                        'cmr_url': server.url+'/search/', 'archive_url': server.url+'/archive',
+                        'archive_url_nrt': server.url+'/archive'}
+            json.dump(sys_cfg, open(ensure_dir(osp.join(path,'etc','sys.json')),'w'), indent=4)
+            # the configuration is loaded from etc/sys.json of the working directory
+            from driver import Driver
+            t = time.time()
+            build_catalog(catalog, osp.join(path,'archive'), server.url, job['sat_sources'],
+                            str_to_dt(job['start_utc']), str_to_dt(job['end_utc']), ngranules, scale, seed)
+            logging.info('run_e2e - {0} synthetic files generated in {1:.2f} seconds'.format(len(catalog.files),time.time()-t))
+            job_file = osp.join(path,'job.json')
+            json.dump(dict(job, resume=False), open(job_file,'w'), indent=4)
+            t = time.time()
+            dv = Driver(job_file)
+            status = 'SUCCESS'
+            try:
+                dv.run()
+            except Exception as e:
+                logging.error('run_e2e - Driver failed with exception {}'.format(repr(e)))
+                status = 'FAILURE'
+            total = time.time()-t
+            summary = json.load(open(osp.join(dv.job.job_path,'metrics.json')))
+            return {'status': status, 'total': total, 'job_path': dv.job.job_path,
+                    'stages': {k: v['wall'] for k,v in summary['stages'].items()},
+                    'data_centers': summary['data_centers'], 'server': dict(server.stats)}
+    finally:
+        os.chdir(cwd)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='End-to-end Driver benchmark against a local CMR and archive stand-in.')
+    parser.add_argument('--sources', nargs='+', default=['Terra','Aqua','SNPP'], help='satellite sources')
+    parser.add_argument('--granules', type=int, default=2, help='number of granules of each source')
+    parser.add_argument('--scale', type=float, default=1., help='scale of the along-track dimension of the swaths')
+    parser.add_argument('--latency', type=float, default=0., help='seconds before answering each file request')
+    parser.add_argument('--search-latency', type=float, default=0., help='seconds before answering each search')
+    parser.add_argument('--bandwidth', type=float, default=None, help='bytes per second of each connection')
+    parser.add_argument('--total-bandwidth', type=float, default=None, help='bytes per second of all the connections')
+    parser.add_argument('--error-rate', type=float, default=0., help='probability of a 503 error on file requests')
+    parser.add_argument('--search-error-rate', type=float, default=0., help='probability of a 503 error on searches')
+    parser.add_argument('--no-ranges', action='store_true', help='disable the HTTP Range support')
+    parser.add_argument('--max-retries', type=int, default=3, help='download retries of the downloader')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic data and errors')
+    parser.add_argument('--path', default=None, help='sandbox directory, a temporary directory if not provided')
+    parser.add_argument('--output', default=None, help='path of the JSON results')
+    args = parser.parse_args()
+    job = {'case_name': 'e2e', 'bbox': [-122.04251098632812,-120.97007751464844,39.3486213684082,40.169677734375],
+            'start_utc': '2018-11-08_19:55:00', 'end_utc': '2018-11-08_21:30:02', 'sat_sources': args.sources}
+    config = ArchiveConfig(args.latency, args.search_latency, args.bandwidth, args.total_bandwidth, args.error_rate,
+                            args.search_error_rate, not args.no_ranges, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        res = run_e2e(args.path or tmp, job, config, args.granules, args.scale, args.max_retries, args.seed)
+    print('status: {0}, total time: {1:.2f} s'.format(res['status'],res['total']))
+    for stage,wall in sorted(res['stages'].items(), key=lambda x: -x[1]):
+        print('  {:<20} {:>10.2f} s'.format(stage,wall))
+    print('server: {}'.format({k: v for k,v in res['server'].items() if not k.startswith('/')}))
+    if args.output:
+        json.dump(res, open(ensure_dir(args.output),'w'), indent=4, separators=(',', ': '))
+    sys.exit(0 if res['status'] == 'SUCCESS' else 1)
@@ -0,0 +1,83 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import os.path as osp
+import argparse, json, os, subprocess, sys
+
+# modules loaded by each entry point
+entry_points = {
+    'driver.sh': 'driver',
+    'batch.sh': 'batch',
+    'retrieve_sat.sh': 'ingest.retrieve_sat',
+    'job.py': 'job',
+    'planner': 'ingest.planner',
+    'svm': 'ml.svm'
+}
+
+def import_time(module, repeat=5, src=None):
+    """
+    Wall time of importing a module in a fresh interpreter, without the interpreter startup.
+
+    :param module: module name
+    :param repeat: number of fresh interpreters
+    :param src: source directory added to PYTHONPATH, the parent of this package if None
+    :return: dictionary with the best and median times in seconds
+    """
+    src = src or osp.dirname(osp.dirname(osp.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=src)
+    code = 'import time; t = time.perf_counter(); import {}; print(time.perf_counter()-t)'.format(module)
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True)
+        if out.returncode:
+            return {'error': out.stderr.strip().splitlines()[-1]}
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    times.sort()
+    return {'best': times[0], 'median': times[len(times)//2]}
+
+def heavy_modules(module, src=None, top=10):
+    """
+    Direct imports of a module with the largest cumulative import time from python -X importtime.
+
+    :param module: module name
+    :param src: source directory added to PYTHONPATH
+    :param top: number of modules to return
+    :return: list of (cumulative microseconds, module name)
+    """
+    src = src or osp.dirname(osp.dirname(osp.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=src)
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)], env=env, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        # imports are listed before the module importing them, indented by two spaces per level
+        level = (len(parts[2])-len(parts[2].lstrip()))//2
+        if level == 0 and parts[2].strip() == module:
+            break
+        elif level == 0:
+            rows = []
+        elif level == 1:
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time of each entry point in a fresh interpreter.')
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh interpreters of each entry point')
+    parser.add_argument('--detail', action='store_true', help='list the heaviest top-level imports of each entry point')
+    parser.add_argument('--output', default=None, help='path of the JSON results')
+    args = parser.parse_args()
+    results = {}
+    for name,module in entry_points.items():
+        results[name] = import_time(module, args.repeat)
+        if 'error' in results[name]:
+            print('{:<16} {}'.format(name,results[name]['error']))
+            continue
+        print('{:<16} {:>8.3f} s'.format(name,results[name]['median']))
+        if args.detail:
+            for us,mod in heavy_modules(module):
+                print('    {:<30} {:>8.3f} s'.format(mod,us*1e-6))
+    if args.output:
+        json.dump(results, open(args.output,'w'), indent=4, separators=(',', ': '))
@@ -0,0 +1,246 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from bench.synthetic import modis_shape, viirs_shape, swath, write_modis, write_viirs, granule_manifest, training_set, fitted_svm
+from utils.general import ensure_dir
+from utils.times import esmf_now
+
+import numpy as np
+import os.path as osp
+import argparse, json, logging, platform, sys, tempfile, time
+
+# default sizes of each benchmark, the size meaning depends on the benchmark
+sizes = {
+    'pixel_dims_modis': [10000, 100000, 1000000],
+    'pixel_dims_viirs': [10000, 100000, 1000000],
+    'compute_mask': [100000, 1000000, modis_shape[0]*modis_shape[1]],
+    'read_granule_modis': [.25, .5, 1.],
+    'read_granule_viirs': [.25, .5, 1.],
+    'preprocess': [2000, 10000, 50000],
+    'fit': [2000, 5000, 20000],
+    'grid_cv_grid': [2000, 5000],
+    'grid_cv_gram': [2000, 5000],
+    'grid_cv_halving': [2000, 5000],
+    'decision_function': [10000, 100000, 1000000],
+    'find_roots': [1000, 10000, 40000],
+    'estimate_tign_g': [100, 200, 400]
+}
+quick_sizes = {name: values[:1] for name,values in sizes.items()}
+
+class Context(object):
+    """
+    Shared inputs of the benchmarks, created once and reused by all the sizes and repeats.
+    """
+
+    def __init__(self, data_path, seed=0):
+        """
+        :param data_path: directory where the synthetic granule files are generated
+        :param seed: random seed of the synthetic data
+        """
+        self.data_path = data_path
+        self.seed = seed
+        self.cache = {}
+
+    def get(self, key, func, *args):
+        if key not in self.cache:
+            self.cache[key] = func(*args)
+        return self.cache[key]
+
+    def granule(self, granule_class, size):
+        """
+        Synthetic granule object with files of a swath scaled by size in the along-track dimension.
+        """
+        from vis.sat_granule import TerraGranule, SNPPGranule
+        if granule_class == 'modis':
+            gclass,shape,write = TerraGranule,modis_shape,write_modis
+        else:
+            gclass,shape,write = SNPPGranule,viirs_shape,write_viirs
+        shape = (int(shape[0]*size),shape[1])
+        path = osp.join(self.data_path,'{0}_{1}x{2}'.format(granule_class,shape[0],shape[1]))
+        files = self.get(('files',granule_class,shape), write, path, shape, self.seed)
+        return gclass(granule_manifest(*files), (-123.,-120.,38.5,41.))
+
+    def svm(self):
+        """
+        Fitted SVM shared by the evaluation benchmarks.
+        """
+        return self.get('svm', fitted_svm, 5000, .2, self.seed)
+
+def bench_pixel_dims(granule_class):
+    def bench(ctx, size):
+        from vis.sat_granule import TerraGranule, SNPPGranule
+        gclass = TerraGranule if granule_class == 'modis' else SNPPGranule
+        granule = gclass.__new__(gclass)
+        sample = np.random.default_rng(ctx.seed).integers(0, gclass.num_cols, size).astype(np.int16)
+        return lambda: granule.pixel_dims(sample)
+    return bench
+
+def bench_compute_mask(ctx, size):
+    from vis.sat_granule import TerraGranule
+    granule = TerraGranule.__new__(TerraGranule)
+    granule.bounds = (-123.,-120.,38.5,41.)
+    lon,lat = swath((size//modis_shape[1]+1,modis_shape[1]), seed=ctx.seed)
+    lon,lat = np.ravel(lon)[:size],np.ravel(lat)[:size]
+    return lambda: granule.compute_mask(lat,lon)
+
+def bench_read_granule(granule_class):
+    def bench(ctx, size):
+        granule = ctx.granule(granule_class, size)
+        return granule.read_granule
+    return bench
+
+def bench_preprocess(ctx, size):
+    from ml.svm import SVM
+    X,y = training_set(size, seed=ctx.seed)
+    def run():
+        svm = SVM()
+        svm.hyper_opt(X)
+        svm.preprocess(X,y)
+    return run
+
+def bench_fit(ctx, size):
+    from ml.svm import SVM
+    X,y = training_set(size, .2, seed=ctx.seed)
+    return lambda: SVM().fit(X,y)
+
+def bench_grid_cv(search):
+    def bench(ctx, size):
+        from ml.svm import SVM
+        X,y = training_set(size, .2, seed=ctx.seed)
+        return lambda: SVM().grid_cv(X,y,search=search)
+    return bench
+
+def bench_decision_function(ctx, size):
+    svm = ctx.svm()
+    G = np.random.default_rng(ctx.seed).uniform(size=(size,len(svm.scale_dims)))*svm.scale_dims
+    return lambda: svm.decision_function(G)
+
+def bench_find_roots(ctx, size):
+    from ml.svm_eval import first_roots
+    nz = 40
+    zr = np.linspace(0,1,nz)
+    rng = np.random.default_rng(ctx.seed)
+    # decision function columns decreasing in time with a single root
+    Z = rng.uniform(.2,.8,(size,1))-zr[np.newaxis,:]+.01*rng.standard_normal((size,nz))
+    return lambda: first_roots(zr,Z)
+
+def bench_estimate_tign_g(ctx, size):
+    svm = ctx.svm()
+    return lambda: svm.estimate_tign_g((size,size,40))
+
+benchmarks = {
+    'pixel_dims_modis': bench_pixel_dims('modis'),
+    'pixel_dims_viirs': bench_pixel_dims('viirs'),
+    'compute_mask': bench_compute_mask,
+    'read_granule_modis': bench_read_granule('modis'),
+    'read_granule_viirs': bench_read_granule('viirs'),
+    'preprocess': bench_preprocess,
+    'fit': bench_fit,
+    'grid_cv_grid': bench_grid_cv('grid'),
+    'grid_cv_gram': bench_grid_cv('gram'),
+    'grid_cv_halving': bench_grid_cv('halving'),
+    'decision_function': bench_decision_function,
+    'find_roots': bench_find_roots,
+    'estimate_tign_g': bench_estimate_tign_g
+}
+
+def time_call(func, repeat=3):
+    """
+    Time a function several times.
+
+    :param func: function without arguments
+    :param repeat: number of calls
+    :return: dictionary with the best and median wall times and the number of calls
+    """
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter()-t)
+    return {'best': min(times), 'median': float(np.median(times)), 'repeat': repeat}
+
+def run_benchmarks(names=None, bench_sizes=sizes, repeat=3, data_path=None, seed=0):
+    """
+    Run the benchmarks on synthetic data.
+
+    :param names: list of benchmark names, all if None
+    :param bench_sizes: dictionary with the sizes of each benchmark
+    :param repeat: number of timed calls of each benchmark and size
+    :param data_path: directory of the synthetic granule files, a temporary directory if None
+    :param seed: random seed of the synthetic data
+    :return: dictionary with the environment and the results by benchmark and size
+    """
+    names = names or list(benchmarks.keys())
+    with tempfile.TemporaryDirectory() as tmp:
+        ctx = Context(data_path or tmp, seed)
+        results = {}
+        for name in names:
+            results[name] = {}
+            for size in bench_sizes[name]:
+                logging.info('run_benchmarks - running {} with size {}'.format(name,size))
+                func = benchmarks[name](ctx, size)
+                res = time_call(func, repeat)
+                logging.info('run_benchmarks - {} with size {}: {}'.format(name,size,res))
+                results[name][str(size)] = res
+    return {'time': esmf_now(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'node': platform.node(), 'seed': seed, 'results': results}
+
+def compare(results, baseline, threshold=1.2):
+    """
+    Compare the best times of a run against a baseline run.
+
+    :param results: output of run_benchmarks
+    :param baseline: output of run_benchmarks to compare to
+    :param threshold: ratio of the times from which a benchmark is considered a regression
+    :return: list of dictionaries with the benchmark, size, times, ratio and regression flag
+    """
+    rows = []
+    for name,res in results['results'].items():
+        for size,r in res.items():
+            b = baseline['results'].get(name,{}).get(size)
+            if b is None:
+                continue
+            ratio = r['best']/b['best'] if b['best'] > 0 else np.inf
+            rows.append({'benchmark': name, 'size': size, 'best': r['best'], 'baseline': b['best'],
+                        'ratio': ratio, 'regression': ratio > threshold})
+    return rows
+
+def print_comparison(rows):
+    print('{:<20} {:>10} {:>12} {:>12} {:>8}'.format('benchmark','size','best (s)','baseline (s)','ratio'))
+    for r in rows:
+        print('{:<20} {:>10} {:>12.4f} {:>12.4f} {:>8.2f}{}'.format(r['benchmark'],r['size'],r['best'],r['baseline'],
+                                                            r['ratio'],' REGRESSION' if r['regression'] else ''))
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the hot paths on synthetic data.')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all if none: {}'.format(', '.join(benchmarks.keys())))
+    parser.add_argument('--quick', action='store_true', help='run only the smallest size of each benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed calls of each benchmark and size')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic data')
+    parser.add_argument('--data', default=None, help='directory where to keep the synthetic granule files')
+    parser.add_argument('--output', default=None, help='path of the JSON results, bench/bench_<time>.json if not provided')
+    parser.add_argument('--baseline', default='bench/baseline.json', help='path of the JSON baseline to compare to')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=1.2, help='time ratio considered a regression')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in benchmarks]
+    if unknown:
+        print('unknown benchmarks {}, available: {}'.format(unknown,list(benchmarks.keys())))
+        sys.exit(1)
+    results = run_benchmarks(args.names, quick_sizes if args.quick else sizes, args.repeat, args.data, args.seed)
+    output = args.output or osp.join('bench','bench_{}.json'.format(results['time'].replace(':','-')))
+    json.dump(results, open(ensure_dir(output),'w'), indent=4, separators=(',', ': '))
+    logging.info('benchmark results saved as {}'.format(output))
+    regressions = []
+    if osp.exists(args.baseline):
+        rows = compare(results, json.load(open(args.baseline)), args.threshold)
+        print_comparison(rows)
+        regressions = [r for r in rows if r['regression']]
+    else:
+        logging.info('no baseline {} to compare to'.format(args.baseline))
+    if args.save_baseline:
+        json.dump(results, open(ensure_dir(args.baseline),'w'), indent=4, separators=(',', ': '))
+        logging.info('baseline saved as {}'.format(args.baseline))
+    sys.exit(1 if regressions and not args.save_baseline else 0)
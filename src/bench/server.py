@@ -0,0 +1,270 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs
+from utils.times import str_to_dt
+
+import os.path as osp
+import json, logging, random, re, threading, time
+
+class ArchiveConfig(object):
+    """
+    Behavior of the local archive server.
+    """
+
+    def __init__(self, latency=0., search_latency=0., bandwidth=None, total_bandwidth=None,
+                    error_rate=0., search_error_rate=0., ranges=True, chunk=1<<16, seed=0):
+        """
+        :param latency: seconds before answering each file request
+        :param search_latency: seconds before answering each search request
+        :param bandwidth: maximum bytes per second of each connection, no limit if None
+        :param total_bandwidth: maximum bytes per second of all the connections together, no limit if None
+        :param error_rate: probability of answering a file request with a 503 error
+        :param search_error_rate: probability of answering a search request with a 503 error
+        :param ranges: support HTTP Range requests
+        :param chunk: size of the chunks written to the sockets
+        :param seed: random seed of the error injection
+        """
+        self.latency = latency
+        self.search_latency = search_latency
+        self.bandwidth = bandwidth
+        self.total_bandwidth = total_bandwidth
+        self.error_rate = error_rate
+        self.search_error_rate = search_error_rate
+        self.ranges = ranges
+        self.chunk = chunk
+        self.rng = random.Random(seed)
+
+class TokenBucket(object):
+    """
+    Bandwidth limit shared by several threads.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next = time.time()
+
+    def consume(self, nbytes):
+        if self.rate is None:
+            return
+        with self.lock:
+            now = time.time()
+            start = max(self.next, now)
+            self.next = start+nbytes/float(self.rate)
+        wait = start-now
+        if wait > 0:
+            time.sleep(wait)
+
+class Catalog(object):
+    """
+    Granules served by the archive server, searchable like the CMR granule search.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.files = {}
+
+    def add(self, short_name, collection, path, time_start, time_end, bbox, base_url=''):
+        """
+        Add a granule file to the catalog.
+
+        :param short_name: short name of the product, ex: 'MOD03'
+        :param collection: CMR collection concept id, ex: 'C1379767668-LAADS'
+        :param path: local path of the file, its basename is the granule id
+        :param time_start: start time as '%Y-%m-%dT%H:%M:%S.000Z'
+        :param time_end: end time as '%Y-%m-%dT%H:%M:%S.000Z'
+        :param bbox: bounding box (lonmin,lonmax,latmin,latmax) of the granule
+        :param base_url: URL of the server the links point to
+        """
+        name = osp.basename(path)
+        self.files[name] = path
+        self.entries.append({'producer_granule_id': name, 'title': name, 'short_name': short_name,
+                            'collection_concept_id': collection, 'data_center': collection.split('-')[-1],
+                            'dataset_id': short_name+' synthetic', 'time_start': time_start, 'time_end': time_end,
+                            'bbox': list(bbox), 'links': [{'href': base_url.rstrip('/')+'/archive/'+name}]})
+
+    def search(self, params):
+        """
+        Granule search with the parameters of cmr.GranuleQuery: short_name, polygon and temporal.
+
+        :param params: dictionary of query parameters to lists of values
+        :return: list of matching entries
+        """
+        entries = self.entries
+        if 'short_name' in params:
+            entries = [e for e in entries if e['short_name'] == params['short_name'][0]]
+        polygon = params.get('polygon') or params.get('polygon[]')
+        if polygon:
+            c = [float(v) for v in polygon[0].split(',')]
+            lons,lats = c[0::2],c[1::2]
+            entries = [e for e in entries if e['bbox'][0] <= max(lons) and e['bbox'][1] >= min(lons)
+                                            and e['bbox'][2] <= max(lats) and e['bbox'][3] >= min(lats)]
+        temporal = params.get('temporal[]') or params.get('temporal')
+        if temporal:
+            t0,t1 = [str_to_dt(t.replace('Z',''), fmt='%Y-%m-%dT%H:%M:%S') for t in temporal[0].split(',')]
+            parse = lambda t: str_to_dt(t, fmt='%Y-%m-%dT%H:%M:%S.000Z')
+            entries = [e for e in entries if parse(e['time_start']) <= t1 and parse(e['time_end']) >= t0]
+        return entries
+
+class ArchiveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Requests of the archive server: /search/granules.json and /archive/<granule file>.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        logging.debug('ArchiveServer - '+fmt % args)
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def handle_request(self, head=False):
+        server = self.server
+        url = urlparse(self.path)
+        server.count(url.path)
+        if url.path.startswith('/search/granules'):
+            self.search(url, head)
+        elif url.path.startswith('/archive/'):
+            self.send_archive_file(osp.basename(url.path), head)
+        else:
+            self.send_error(404)
+
+    def fail(self, rate):
+        cfg = self.server.config
+        with self.server.lock:
+            fail = cfg.rng.random() < rate
+        if fail:
+            self.server.count('errors')
+            self.send_response(503)
+            self.send_header('Content-Length','0')
+            self.end_headers()
+        return fail
+
+    def search(self, url, head):
+        cfg = self.server.config
+        time.sleep(cfg.search_latency)
+        if self.fail(cfg.search_error_rate):
+            return
+        params = parse_qs(url.query)
+        entries = self.server.catalog.search(params)
+        page_size = int(params.get('page_size',[10])[0])
+        body = json.dumps({'feed': {'entry': entries[:page_size]}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(body)))
+        self.send_header('CMR-Hits',str(len(entries)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_archive_file(self, name, head):
+        cfg = self.server.config
+        time.sleep(cfg.latency)
+        path = self.server.catalog.files.get(name)
+        if path is None or not osp.exists(path):
+            self.send_error(404)
+            return
+        if self.fail(cfg.error_rate):
+            return
+        size = osp.getsize(path)
+        start,end = 0,size-1
+        m = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range',''))
+        if cfg.ranges and m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                start = int(m.group(1))
+                end = min(int(m.group(2)),size-1) if m.group(2) else size-1
+            else:
+                start = max(size-int(m.group(2)),0)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range','bytes */{}'.format(size))
+                self.send_header('Content-Length','0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range','bytes {0}-{1}/{2}'.format(start,end,size))
+        else:
+            self.send_response(200)
+        if cfg.ranges:
+            self.send_header('Accept-Ranges','bytes')
+        self.send_header('Content-Type','application/octet-stream')
+        self.send_header('Content-Length',str(end-start+1))
+        self.end_headers()
+        if head:
+            return
+        bucket = TokenBucket(cfg.bandwidth)
+        with open(path,'rb') as f:
+            f.seek(start)
+            left = end-start+1
+            while left > 0:
+                data = f.read(min(cfg.chunk,left))
+                bucket.consume(len(data))
+                self.server.bucket.consume(len(data))
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                left -= len(data)
+                self.server.count('bytes', len(data))
+
+class ArchiveServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local stand-in of the CMR granule search and of the LAADS/LANCE archives, serving a catalog
+    of local granule files with configurable latency, bandwidth, errors and Range support.
+
+    The CMR search is answered at <url>/search/, to be used as the cmr_url of the jobs.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, catalog, config=None, host='127.0.0.1', port=0):
+        """
+        :param catalog: Catalog of granules to serve
+        :param config: ArchiveConfig object, default behavior if None
+        :param host: host to bind
+        :param port: port to bind, any free port if 0
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, (host,port), ArchiveHandler)
+        self.catalog = catalog
+        self.config = config or ArchiveConfig()
+        self.bucket = TokenBucket(self.config.total_bandwidth)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server_address[:2])
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] = self.stats.get(key,0)+value
+
+    def handle_error(self, request, client_address):
+        # clients closing streamed connections early are expected
+        logging.debug('ArchiveServer.handle_error - connection from {} closed'.format(client_address))
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info('ArchiveServer.start - serving {0} granules at {1}'.format(len(self.catalog.entries),self.url))
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,165 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from utils.general import ensure_dir
+
+import numpy as np
+import os.path as osp
+
+# realistic swath shapes (rows,cols) of one granule
+modis_shape = (2030,1354)
+viirs_shape = (3232,3200)
+
+def swath(shape, center=(-121.5,39.75), size=(23.,20.), seed=0):
+    """
+    Synthetic swath geolocation, a rotated and slightly curved grid around a center.
+
+    :param shape: swath shape (rows,cols)
+    :param center: (lon,lat) of the center of the swath
+    :param size: (lon,lat) extent in degrees
+    :param seed: random seed
+    :return lon,lat: float32 arrays of the swath shape
+    """
+    rng = np.random.default_rng(seed)
+    r,c = np.meshgrid(np.linspace(-.5,.5,shape[0]), np.linspace(-.5,.5,shape[1]), indexing='ij')
+    a = np.deg2rad(rng.uniform(-15,15))
+    lon = center[0]+size[0]*(np.cos(a)*c-np.sin(a)*r+.05*r**2)
+    lat = center[1]+size[1]*(np.sin(a)*c+np.cos(a)*r)
+    return lon.astype(np.float32), lat.astype(np.float32)
+
+def fire_mask(lon, lat, center=(-121.5,39.75), radius=.2, seed=0):
+    """
+    Synthetic fire mask with MODIS/VIIRS classes: 3 water, 4 cloud, 5 land, 7-9 fire.
+
+    :param lon: swath longitudes
+    :param lat: swath latitudes
+    :param center: (lon,lat) of the fire
+    :param radius: radius of the fire in degrees
+    :param seed: random seed
+    :return mask: uint8 fire mask of the swath shape
+    """
+    rng = np.random.default_rng(seed)
+    mask = np.full(lon.shape, 5, dtype=np.uint8)
+    mask[rng.random(lon.shape) < .1] = 4
+    mask[rng.random(lon.shape) < .02] = 3
+    d = np.hypot(lon-center[0], lat-center[1])
+    fire = np.logical_and(d < radius, rng.random(lon.shape) < .3)
+    mask[fire] = rng.choice([7,8,9], size=fire.sum()).astype(np.uint8)
+    return mask
+
+def fire_pixels(lon, lat, mask, seed=0):
+    """
+    Synthetic FP_* arrays of the fire pixels of a fire mask.
+
+    :return: dictionary of FP_* arrays
+    """
+    rng = np.random.default_rng(seed)
+    rows,cols = np.where(mask >= 7)
+    n = len(rows)
+    return {'FP_latitude': lat[rows,cols], 'FP_longitude': lon[rows,cols],
+            'FP_line': rows.astype(np.int16), 'FP_sample': cols.astype(np.int16),
+            'FP_confidence': rng.integers(0,100,n).astype(np.uint8),
+            'FP_T21': rng.uniform(300,400,n).astype(np.float32), 'FP_T31': rng.uniform(280,320,n).astype(np.float32),
+            'FP_T13': rng.uniform(300,400,n).astype(np.float32), 'FP_T15': rng.uniform(280,320,n).astype(np.float32),
+            'FP_power': rng.uniform(1,500,n).astype(np.float32)}
+
+def write_modis(path, shape=modis_shape, seed=0, names=('MOD03.A2018312.2000.061.synthetic.hdf','MOD14.A2018312.2000.061.synthetic.hdf')):
+    """
+    Write synthetic MODIS MOD03 and MOD14 HDF4 files.
+
+    :param path: directory of the files
+    :param names: file names of the geolocation and fire files
+    :return geo_path,fire_path: paths to the geolocation and fire files
+    """
+    from pyhdf.SD import SD, SDC
+    lon,lat = swath(shape, seed=seed)
+    mask = fire_mask(lon, lat, seed=seed)
+    fp = fire_pixels(lon, lat, mask, seed=seed)
+    geo_path = ensure_dir(osp.join(path,names[0]))
+    fire_path = ensure_dir(osp.join(path,names[1]))
+    types = {np.dtype(np.float32): SDC.FLOAT32, np.dtype(np.uint8): SDC.UINT8, np.dtype(np.int16): SDC.INT16}
+    for file_path,fields in ((geo_path,{'Latitude': lat, 'Longitude': lon}),
+                            (fire_path,dict({'fire mask': mask}, **{k: v for k,v in fp.items() if k not in ('FP_T13','FP_T15')}))):
+        sd = SD(file_path, SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+        for name,data in fields.items():
+            data = np.ascontiguousarray(data)
+            ds = sd.create(name, types[data.dtype], data.shape if data.size else (1,))
+            ds[:] = data if data.size else np.zeros(1, dtype=data.dtype)
+            ds.endaccess()
+        sd.end()
+    return geo_path,fire_path
+
+def write_viirs(path, shape=viirs_shape, seed=0, names=('VNP03MOD.A2018312.2000.001.synthetic.nc','VNP14.A2018312.2000.001.synthetic.nc')):
+    """
+    Write synthetic VIIRS VNP03MOD and VNP14 netCDF4 (HDF5) files.
+
+    :param path: directory of the files
+    :param names: file names of the geolocation and fire files
+    :return geo_path,fire_path: paths to the geolocation and fire files
+    """
+    import netCDF4 as nc4
+    lon,lat = swath(shape, size=(30.,27.), seed=seed)
+    mask = fire_mask(lon, lat, seed=seed)
+    fp = fire_pixels(lon, lat, mask, seed=seed)
+    geo_path = ensure_dir(osp.join(path,names[0]))
+    fire_path = ensure_dir(osp.join(path,names[1]))
+    with nc4.Dataset(geo_path,'w') as d:
+        g = d.createGroup('geolocation_data')
+        g.createDimension('number_of_lines',shape[0])
+        g.createDimension('number_of_pixels',shape[1])
+        for name,data in (('latitude',lat),('longitude',lon)):
+            g.createVariable(name,'f4',('number_of_lines','number_of_pixels'))[:] = data
+    with nc4.Dataset(fire_path,'w') as d:
+        d.createDimension('nlines',shape[0])
+        d.createDimension('ncols',shape[1])
+        d.createDimension('nfire',len(fp['FP_power']))
+        d.createVariable('fire mask','u1',('nlines','ncols'))[:] = mask
+        for name,data in fp.items():
+            d.createVariable(name,data.dtype,('nfire',))[:] = data
+    return geo_path,fire_path
+
+def granule_manifest(geo_path, fire_path, time_start_iso='2018-11-08T20:00:00.000Z', time_end_iso='2018-11-08T20:05:00.000Z'):
+    """
+    Manifest entry of a synthetic granule, as created by SatSource.retrieve_metas.
+    """
+    return {'time_start_iso': time_start_iso, 'time_end_iso': time_end_iso,
+            'geo_local_path': geo_path, 'fire_local_path': fire_path}
+
+def training_set(n, fire_prop=.05, bounds=(-121.,-120.5,39.,39.5), days=3., ros=3., noise=.5, seed=0):
+    """
+    Synthetic (lon,lat,time) training set of a fire spreading radially from the domain center.
+
+    :param n: number of points
+    :param fire_prop: approximate proportion of fire points (imbalance)
+    :param bounds: domain bounds (lonmin,lonmax,latmin,latmax)
+    :param days: time interval in days
+    :param ros: rate of spread in km/day
+    :param noise: noise in the spread distance in km
+    :param seed: random seed
+    :return X,y: points and labels (1 fire, -1 ground)
+    """
+    rng = np.random.default_rng(seed)
+    lonc,latc = (bounds[0]+bounds[1])/2,(bounds[2]+bounds[3])/2
+    # fire points inside the burned region and ground points anywhere
+    nf = int(n*fire_prop)
+    t = rng.uniform(0,days,n)
+    a = rng.uniform(0,2*np.pi,n)
+    rad = np.r_[rng.uniform(0,1,nf)*ros*t[:nf], rng.uniform(0,1,n-nf)*111*(bounds[1]-bounds[0])/2]
+    lon = lonc+rad*np.cos(a)/111
+    lat = latc+rad*np.sin(a)/111
+    d = np.hypot(lon-lonc,lat-latc)*111+rng.normal(0,noise,n)
+    y = np.where(d < ros*t, 1, -1)
+    return np.c_[lon,lat,t], y
+
+def fitted_svm(n=5000, fire_prop=.2, seed=0, **kwargs):
+    """
+    SVM fitted to a synthetic training set.
+
+    :return: fitted SVM object
+    """
+    from ml.svm import SVM
+    X,y = training_set(n, fire_prop, seed=seed)
+    svm = SVM(**kwargs)
+    svm.fit(X,y)
+    return svm
@@ -4,14 +4,17 @@
 
 from job import Job
 from ingest.MODIS import Terra,Aqua
-from ingest.VIIRS import SNPP
+from ingest.VIIRS import SNPP, SNPPHR, NOAA20, NOAA20HR
+from ingest.manager import IngestManager
 from utils.general import json_join
-from vis.sat_collection import SatCollection
-from ml.svm import SVM
+from utils.checkpoint import Checkpoint, hash_inputs, file_identity, retrieve_key
+from utils.executor import get_executor
+from utils.metrics import metrics, timer
+from vis.detection_store import DetectionStore, granule_id
 
-from multiprocessing import Process,Queue
 import os.path as osp
-import sys,logging,traceback,json
+import os,sys,logging,traceback,json
+import numpy as np
 
 class DriverError(Exception):
     """
@@ -24,8 +27,16 @@ class Driver(object):
     def __init__(self,job_file):
         # create Job class
         self.job = Job(job_file)
+        # record the performance metrics next to job.json
+        metrics.configure(osp.join(self.job.job_path,'metrics.jsonl'), self.job.get('profile',[]))
         # resolve satellite sources
         self.sat_sources = self.resolve_sat_sources()
+        # stage checkpoints shared by all the jobs in the workspace
+        self.checkpoint = Checkpoint(osp.join(self.job.workspace_path,'checkpoints'), self.job.get('resume',True))
+        # per-pixel records of the granules shared by all the jobs in the workspace
+        self.detections = DetectionStore(osp.join(self.job.workspace_path,'detections')) if self.job.get('detection_store',True) else None
+        # disk quota of the ingest directory shared by all the jobs
+        self.ingest = IngestManager.from_job(self.job)
 
     def resolve_sat_sources(self):
         """
@@ -40,41 +51,166 @@ class Driver(object):
             sat_objs.append(Aqua(js))
         if 'SNPP' in sat_list:
             sat_objs.append(SNPP(js))
+        if 'SNPPHR' in sat_list:
+            sat_objs.append(SNPPHR(js))
+        if 'NOAA20' in sat_list:
+            sat_objs.append(NOAA20(js))
+        if 'NOAA20HR' in sat_list:
+            sat_objs.append(NOAA20HR(js))
         return sat_objs
 
     def retrieve_sat_data(self):
         """
         This function retrieves all satellite data sources.
         """
-        # create queue
-        proc_q = Queue()
-        sat_proc = {}
-        # create process for each sat source
-        for sat_source in self.sat_sources:
-            sat_proc[sat_source.id] = Process(target=retrieve_sat_source, args=(self.job, sat_source, proc_q))
-        # start processes
-        for sat_source in self.sat_sources:
-            sat_proc[sat_source.id].start()
-        # wait processes
-        for sat_source in self.sat_sources:
-            sat_proc[sat_source.id].join()
-        # ensure processes
-        for sat_source in self.sat_sources:
-            if proc_q.get() != 'SUCCESS':
-                return
-        # close queue
-        proc_q.close()
+        # the retrievals of all the sources wait on the archives at the same time
+        status = get_executor().map(retrieve_sat_source, [self.job]*len(self.sat_sources), self.sat_sources,
+                                    threads=len(self.sat_sources))
+        return all(s == 'SUCCESS' for s in status)
 
     def read_sat_data(self):
         """
         This function reads all satellite data retrieved and saved in JSON files.
         """
+        from vis.sat_collection import SatCollection
         self.job.manifest = json_join(self.job.job_path, self.job.sat_sources)
         data = SatCollection(self.job).process_data()
         return data
 
+    def fit_svm(self, data, granules=None):
+        """
+        This function fits the SVM model to the satellite data. The svm_model key of the job 
+        selects a single SVM, independent SVMs in tiles of the domain or a bagged ensemble.
+
+        :param data: processed granules, or None to read the training data from the detection store
+        :param granules: identifiers of the granules to read from the detection store
+        """
+        js = self.job
+        kind = js.get('svm_model','single')
+        if kind not in ('single','tiled','bagged'):
+            raise DriverError('Driver.fit_svm - unknown svm_model {}, use single, tiled or bagged'.format(kind))
+        mode = js.get('search_mode','grid') if js.get('search',False) else None
+        if mode not in (None,'grid','gram','halving'):
+            raise DriverError('Driver.fit_svm - unknown search_mode {}, use grid, gram or halving'.format(mode))
+        if data is None:
+            X,y,sample_weight = self.detections.training_data(bounds=js.bounds, granules=granules)
+        else:
+            from vis.sat_collection import training_data
+            X,y,sample_weight = training_data(data)
+        if js.get('perim_path') or js.get('igns'):
+            Xp,yp,swp = self.perimeter_data()
+            X,y,sample_weight = np.r_[X,Xp],np.r_[y,yp],np.r_[sample_weight,swp]
+        if len(np.unique(y)) < 2:
+            raise DriverError('Driver.fit_svm - fire and ground satellite data are needed to fit the SVM')
+        if kind == 'tiled':
+            from ml.ensemble import TiledSVM
+            svm = TiledSVM(ntiles=tuple(js.get('ntiles',(2,2))), search=mode, max_error=js.get('max_error'), C=js.get('C'))
+            svm.fit(X, y, sample_weight=sample_weight)
+            return svm
+        if kind == 'bagged':
+            from ml.ensemble import BaggedSVM
+            svm = BaggedSVM(n_estimators=js.get('n_estimators',8), max_error=js.get('max_error'))
+        else:
+            from ml.svm import SVM
+            svm = SVM(max_error=js.get('max_error'))
+        if js.get('C') is not None:
+            svm.model.C = js.C
+        if mode is None:
+            svm.fit(X, y, sample_weight=sample_weight)
+        else:
+            svm.grid_cv(X, y, sample_weight=sample_weight, search=mode)
+        return svm
+
+    def perimeter_data(self):
+        """
+        This function builds the training data of the fire perimeters and ignitions of the job.
+        """
+        from vis.perimeters import read_perimeters, training_data
+        from utils.times import dt_to_num
+        js = self.job
+        perims = read_perimeters(js.perim_path) if js.get('perim_path') else []
+        return training_data(perims, js.get('igns'), js.bounds, tmax=dt_to_num(js.to_utc), res=js.get('perim_res',.005),
+                                buffer=js.get('perim_buffer_m',5000.), radius=js.get('ign_radius',.005),
+                                perim_weight=js.get('perim_weight',1.), ign_weight=js.get('ign_weight',1.))
+
+    def run(self):
+        """
+        Run all the stages of the job. Each stage is skipped and its output loaded if a previous
+        run completed it with the same inputs, so a rerun or a crashed run resumes at the first 
+        stage whose inputs changed.
+        """
+        try:
+            return self.run_stages()
+        finally:
+            self.ingest.release(self.job.job_path)
+            metrics.write_summary(osp.join(self.job.job_path,'metrics.json'))
+
+    def run_stages(self):
+        js = self.job
+        ckpt = self.checkpoint
+        # retrieval stage: depends on the domain, the time window and the sources
+        key = retrieve_key(js)
+        manifest = ckpt.load('retrieve', key)
+        if manifest is not None and not self.ingest.acquire(manifest, js.bounds, js.job_path):
+            logging.info('Driver.run - granules of the retrieval checkpoint were evicted, retrieving them again')
+            manifest = None
+        if manifest is None:
+            with timer('retrieve'):
+                if not self.retrieve_sat_data():
+                    raise DriverError('Driver.run - satellite retrieval failed')
+                manifest = ckpt.save('retrieve', key, json_join(js.job_path, js.sat_sources))
+        else:
+            json.dump(manifest, open(osp.join(js.job_path,'granules.json'),'w'), indent=4, separators=(',', ': '))
+        js.manifest = manifest
+        # processing stage: depends on the domain and the identity of the granule files
+        files = sorted([file_identity(g[k]) for m in manifest.values() for g in m.values() 
+                                            for k in ('geo_local_path','fire_local_path')])
+        key = hash_inputs('process', js.bounds, files)
+        granules = [granule_id(g) for m in manifest.values() for g in m.values()]
+        data = None
+        if ckpt.enabled and self.detections is not None and self.detections.covers(granules, js.bounds):
+            # the training data is a range read of the detection store
+            logging.info('Driver.run - all the granules are in the detection store, skipping processing')
+        else:
+            data = ckpt.load('process', key)
+            if data is None:
+                from vis.sat_collection import SatCollection
+                with timer('process'):
+                    data = ckpt.save('process', key, SatCollection(js, ckpt, self.detections).process_data())
+        # machine learning stage: depends on the processed data and the SVM settings
+        svm_settings = {k: js.get(k) for k in ('dyn_pen','search','search_mode','fire_interp','minconf','C','kgam','max_error',
+                                                'svm_model','ntiles','n_estimators')}
+        perim_settings = {k: js.get(k) for k in ('igns','perim_res','perim_buffer_m','ign_radius','perim_weight','ign_weight')}
+        key = hash_inputs('ml', key, svm_settings, perim_settings, perimeter_files(js.get('perim_path')))
+        svm = ckpt.load('ml', key)
+        if svm is None:
+            with timer('ml'):
+                svm = ckpt.save('ml', key, self.fit_svm(data, granules))
+        svm.save_model(osp.join(js.job_path,'svm.pkl'))
+        with timer('estimate_tign_g'):
+            Fx,Fy,Fz = svm.estimate_tign_g()
+        np.savez(osp.join(js.job_path,'tign_g.npz'), lon=Fx, lat=Fy, tign_g=Fz)
+        return Fx,Fy,Fz
+
+
+def perimeter_files(perim_path):
+    """
+    Identity of the perimeter files of a job.
+
+    :param perim_path: path or list of paths of perimeter files or directories, or None
+    """
+    if not perim_path:
+        return []
+    from vis.perimeters import extensions
+    paths = []
+    for p in ([perim_path] if isinstance(perim_path, str) else perim_path):
+        if osp.isdir(p):
+            paths += [osp.join(p,f) for f in sorted(os.listdir(p)) if f.lower().endswith(extensions)]
+        else:
+            paths.append(p)
+    return [file_identity(p) for p in paths]
 
-def retrieve_sat_source(js, sat_source, q):
+def retrieve_sat_source(js, sat_source):
     """
     This function retrieves satellite data from sat_source.
 
@@ -82,7 +218,6 @@ def retrieve_sat_source(js, sat_source, q):
 
     :param js: the Job object
     :param sat_source: the SatSource object
-    :param q: the multiprocessing Queue into which we will send either 'SUCCESS' or 'FAILURE'
     """
     try:
         logging.info('retrieve_sat_source - retrieving satellite files from {}'.format(sat_source.id))
@@ -92,20 +227,16 @@ def retrieve_sat_source(js, sat_source, q):
         sat_file = sat_source.id+'.json'
         json.dump(manifest, open(osp.join(js.job_path,sat_file),'w'), indent=4, separators=(',', ': '))
         logging.info('retrieve_sat_source - satellite retrieval complete for {}'.format(sat_source.id))
-        q.put('SUCCESS')
+        return 'SUCCESS'
 
     except Exception as e:
         logging.error('retrieve_sat_source - satellite retrieving step failed with exception {}'.format(repr(e)))
         traceback.print_exc()
-        q.put('FAILURE')
+        return 'FAILURE'
     
     
 if __name__=='__main__':
     # create driver
     dv = Driver(sys.argv[1])
-    # retrieve satellite data
-    dv.retrieve_sat_data()
-    # read satellite data
-    data = dv.read_sat_data()
-    # run ML estimation
-    svm = SVM()
+    # run all the stages resuming from checkpoints
+    dv.run()
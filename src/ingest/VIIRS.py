@@ -89,19 +89,23 @@ class NOAA20(VIIRS):
     geo_nrt_collection_id='C1604697279-LANCEMODIS'
     fire_nrt_collection_id=''
     platform='NOAA-20'
+    geo_col='5200'
+    fire_col='5200'
+    geo_nrt_col='5200'
+    fire_nrt_col='5200'
 
 class NOAA20HR(VIIRS):
     """
-    NOAA-20 VIIRS (Visible Infrared Imaging Radiometer Suite) satellite source.
+    High Resolution NOAA-20 VIIRS (Visible Infrared Imaging Radiometer Suite) satellite source.
     """
 
     def __init__(self, arg):
-        super(NOAA20, self).__init__(arg)
+        super(NOAA20HR, self).__init__(arg)
 
     # instance variables
     id='NOAA20HR'
     info_url=''
-    info='NOAA-20 Visible Infrared Imaging Radiometer Suite (VIIRS)'
+    info='High Resolution NOAA-20 Visible Infrared Imaging Radiometer Suite (VIIRS)'
     prefix='VJ1HR'
     geo_prefix='VJ103IMG'
     fire_prefix='VJ114IMG'
@@ -112,3 +116,7 @@ class NOAA20HR(VIIRS):
     geo_nrt_collection_id='C1604644159-LANCEMODIS'
     fire_nrt_collection_id=''
     platform='NOAA-20'
+    geo_col='5200'
+    fire_col='5200'
+    geo_nrt_col='5200'
+    fire_nrt_col='5200'
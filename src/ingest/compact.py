@@ -0,0 +1,212 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+import os.path as osp
+import logging, os
+
+class CompactError(Exception):
+    """
+    Raised when a granule cannot be compacted.
+    """
+    pass
+
+def swath_window(lon, lat, boxes, margin=0.):
+    """
+    Window of along-track lines of a swath with pixels inside some boxes.
+
+    :param lon: swath longitudes of shape (lines,pixels)
+    :param lat: swath latitudes of shape (lines,pixels)
+    :param boxes: list of boxes (lonmin,lonmax,latmin,latmax)
+    :param margin: margin in degrees added to each box
+    :return: (first,last+1) lines of the window, a single line if no pixel is inside
+    """
+    inside = np.zeros(lon.shape[0], dtype=bool)
+    for b in boxes:
+        m = (lon >= b[0]-margin) & (lon <= b[1]+margin) & (lat >= b[2]-margin) & (lat <= b[3]+margin)
+        inside |= m.any(axis=1)
+    lines = np.nonzero(inside)[0]
+    if not len(lines):
+        return (0,1)
+    return (int(lines[0]),int(lines[-1])+1)
+
+def read_geolocation(path):
+    """
+    Read the longitudes and latitudes of a geolocation file.
+
+    :param path: MODIS HDF4 or VIIRS netCDF4 geolocation file
+    :return lon,lat: arrays of shape (lines,pixels)
+    """
+    ext = osp.splitext(path)[1]
+    if ext == '.hdf':
+        from pyhdf.SD import SD, SDC
+        sd = SD(path, SDC.READ)
+        try:
+            return np.array(sd.select('Longitude').get()),np.array(sd.select('Latitude').get())
+        finally:
+            sd.end()
+    elif ext == '.nc':
+        import netCDF4 as nc4
+        with nc4.Dataset(path,'r') as d:
+            g = d.groups['geolocation_data']
+            return np.array(g.variables['longitude'][:]),np.array(g.variables['latitude'][:])
+    raise CompactError('read_geolocation - unrecognized extension {}'.format(ext))
+
+def compact_hdf(src, dst, window, shape, level=4):
+    """
+    Rewrite a MODIS HDF4 file keeping only a window of lines of the swath fields, with the
+    fire pixel (FP_*) fields of the lines in the window. The fields are deflate-compressed,
+    pyhdf does not support chunking.
+
+    :param src: path of the original file
+    :param dst: path of the compacted file
+    :param window: (first,last+1) lines to keep
+    :param shape: (lines,pixels) of the swath fields
+    :param level: deflate compression level
+    """
+    from pyhdf.SD import SD, SDC
+    r0,r1 = window
+    sd = SD(src, SDC.READ)
+    out = SD(dst, SDC.WRITE | SDC.CREATE | SDC.TRUNC)
+    try:
+        names = list(sd.datasets().keys())
+        keep = None
+        if 'FP_line' in names:
+            line = np.array(sd.select('FP_line').get())
+            keep = (line >= r0) & (line < r1)
+        for name,(value,_,typ,_) in sd.attributes(full=1).items():
+            out.attr(name).set(typ, value)
+        for name in names:
+            ds = sd.select(name)
+            data = np.array(ds.get())
+            typ = ds.info()[3]
+            if data.shape[:2] == tuple(shape):
+                data = data[r0:r1]
+            elif name.startswith('FP_') and keep is not None and data.shape == keep.shape:
+                data = data[keep]
+                if name == 'FP_line':
+                    data = data-r0
+            if not data.size:
+                # empty fields are not supported by HDF4, readers treat missing fields as empty
+                ds.endaccess()
+                continue
+            dims = ds.dimensions()
+            nds = out.create(name, typ, data.shape)
+            nds.setcompress(SDC.COMP_DEFLATE, value=level)
+            nds[:] = data
+            for k,dim in enumerate(dims):
+                if not dim.startswith('fakeDim'):
+                    try:
+                        nds.dim(k).setname(dim)
+                    except Exception:
+                        pass
+            for aname,(value,_,atyp,_) in ds.attributes(full=1).items():
+                nds.attr(aname).set(atyp, value)
+            nds.endaccess()
+            ds.endaccess()
+    finally:
+        sd.end()
+        out.end()
+
+def copy_group(src, dst, window, shape, keep, level=4, chunk=256):
+    """
+    Copy a netCDF4 group keeping only a window of lines of the swath fields and the fire
+    pixels (FP_*) in keep, with compressed and chunked variables.
+    """
+    r0,r1 = window
+    dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+    # dimensions of the lines of the swath fields and of the fire pixels
+    sizes = {name: len(dim) for name,dim in src.dimensions.items()}
+    for var in src.variables.values():
+        if var.shape[:2] == tuple(shape):
+            sizes[var.dimensions[0]] = r1-r0
+        elif var.name.startswith('FP_') and keep is not None and var.shape == keep.shape:
+            sizes[var.dimensions[0]] = int(keep.sum())
+    for name,size in sizes.items():
+        dst.createDimension(name, size)
+    for var in src.variables.values():
+        var.set_auto_maskandscale(False)
+        data = var[:]
+        if var.shape[:2] == tuple(shape):
+            data = data[r0:r1]
+        elif var.name.startswith('FP_') and keep is not None and var.shape == keep.shape:
+            data = data[keep]
+            if var.name == 'FP_line':
+                data = data-r0
+        attrs = {k: var.getncattr(k) for k in var.ncattrs()}
+        fill = attrs.pop('_FillValue', None)
+        chunks = None
+        if data.ndim > 1 and data.shape[0] > 0:
+            chunks = [min(chunk,data.shape[0])]+list(data.shape[1:])
+        nvar = dst.createVariable(var.name, var.dtype, var.dimensions, zlib=data.size > 0, complevel=level,
+                                    chunksizes=chunks, fill_value=fill)
+        nvar.set_auto_maskandscale(False)
+        nvar.setncatts(attrs)
+        nvar[:] = data
+    for name,group in src.groups.items():
+        copy_group(group, dst.createGroup(name), window, shape, keep, level, chunk)
+
+def compact_nc(src, dst, window, shape, level=4, chunk=256):
+    """
+    Rewrite a VIIRS netCDF4 file keeping only a window of lines of the swath fields, with the
+    fire pixel (FP_*) fields of the lines in the window. The variables are zlib-compressed
+    and the swath fields are chunked by lines.
+
+    :param src: path of the original file
+    :param dst: path of the compacted file
+    :param window: (first,last+1) lines to keep
+    :param shape: (lines,pixels) of the swath fields
+    :param level: zlib compression level
+    :param chunk: lines of each chunk of the swath fields
+    """
+    import netCDF4 as nc4
+    with nc4.Dataset(src,'r') as d, nc4.Dataset(dst,'w') as out:
+        keep = None
+        if 'FP_line' in d.variables:
+            line = np.array(d.variables['FP_line'][:])
+            keep = (line >= window[0]) & (line < window[1])
+        copy_group(d, out, window, shape, keep, level, chunk)
+
+def compact_file(path, window, shape, level=4):
+    """
+    Rewrite a MODIS HDF4 or VIIRS netCDF4 file in place keeping only a window of lines.
+
+    :param path: path of the file
+    :param window: (first,last+1) lines to keep
+    :param shape: (lines,pixels) of the swath fields of the original file
+    :param level: compression level
+    """
+    ext = osp.splitext(path)[1]
+    if ext not in ('.hdf','.nc'):
+        raise CompactError('compact_file - cannot compact file {}'.format(path))
+    tmp = path+'.tmp'+ext
+    try:
+        (compact_hdf if ext == '.hdf' else compact_nc)(path, tmp, window, shape, level)
+        os.replace(tmp, path)
+    finally:
+        if osp.exists(tmp):
+            os.remove(tmp)
+
+def compact_granule(geo_path, fire_path, boxes, margin=.5, level=4):
+    """
+    Rewrite the geolocation and fire files of a granule in place, keeping only the lines of
+    the swath around some boxes. The compacted files keep the format, field names and full
+    width of the original ones, so SatGranule reads them like the original files and the
+    FP_sample columns and pixel dimensions are unchanged.
+
+    :param geo_path: path of the geolocation file
+    :param fire_path: path of the fire file
+    :param boxes: list of boxes (lonmin,lonmax,latmin,latmax) to keep
+    :param margin: margin in degrees added to each box
+    :param level: compression level
+    :return: dictionary with the window of lines and the swath shape of the original files
+    """
+    lon,lat = read_geolocation(geo_path)
+    window = swath_window(lon, lat, boxes, margin)
+    before = osp.getsize(geo_path)+osp.getsize(fire_path)
+    for path in (geo_path,fire_path):
+        compact_file(path, window, lon.shape, level)
+    after = osp.getsize(geo_path)+osp.getsize(fire_path)
+    logging.info('compact_granule - lines {0} of {1} kept, {2} bytes compacted to {3}'.format(window,lon.shape[0],before,after))
+    return {'window': list(window), 'shape': list(lon.shape)}
@@ -2,18 +2,56 @@
 # Angel Farguell, CU Denver
 #
 
-import logging, time, subprocess, requests, random, os
-from six.moves.urllib import request as urequest
+import logging, time, subprocess, random, os
+from contextlib import contextmanager
 import os.path as osp
 
 from utils.general import ensure_dir, load_sys_cfg, remove
 
-cfg = load_sys_cfg()
-sleep_seconds=cfg.get('sleep_seconds', 20)
-max_retries=cfg.get('max_retries', 3)
-wget=cfg.get('wget','/usr/bin/wget')
-wget_options=cfg.get('wget_options',["--read-timeout=1"])
-download_sleep_seconds=cfg.get('download_sleep_seconds', 5)
+# system configuration of the downloader, loaded on first use
+cfg=None
+
+def config():
+    """
+    Downloader settings from the system configuration, loaded once on first use.
+
+    :return: dictionary with sleep_seconds, max_retries, wget, wget_options and download_sleep_seconds
+    """
+    global cfg
+    if cfg is None:
+        sys_cfg = load_sys_cfg()
+        cfg = {'sleep_seconds': sys_cfg.get('sleep_seconds', 20),
+                'max_retries': sys_cfg.get('max_retries', 3),
+                'wget': sys_cfg.get('wget','/usr/bin/wget'),
+                'wget_options': sys_cfg.get('wget_options',["--read-timeout=1"]),
+                'download_sleep_seconds': sys_cfg.get('download_sleep_seconds', 5)}
+    return cfg
+
+# optional semaphore shared by processes to limit the concurrent downloads
+download_slots=None
+
+def set_download_slots(slots):
+    """
+    Set a semaphore shared by several processes to limit the number of concurrent downloads.
+
+    :param slots: multiprocessing semaphore or None for no limit
+    """
+    global download_slots
+    download_slots = slots
+
+@contextmanager
+def download_slot():
+    """
+    Wait for a free download slot if a limit of concurrent downloads was set.
+    """
+    if download_slots is None:
+        yield
+    else:
+        download_slots.acquire()
+        try:
+            yield
+        finally:
+            download_slots.release()
 
 class DownloadError(Exception):
     """
@@ -28,13 +66,17 @@ def request_url(url,use_urllib2=False,token=None):
     :param url: the remote URL
     :param url: the remote URL
     """
+    if use_urllib2:
+        from six.moves.urllib import request as urequest
+    else:
+        import requests
     if token:
         r = urequest.urlopen(urequest.Request(url,headers={'Authorization': 'Bearer {}'.format(token)})) if use_urllib2 else requests.get(url, stream=True, headers={'Authorization': 'Bearer {}'.format(token)})   
     else:
         r = urequest.urlopen(url) if use_urllib2 else requests.get(url, stream=True)
     return r
 
-def download_url(url, local_path, max_retries=max_retries, sleep_seconds=sleep_seconds, token=None):
+def download_url(url, local_path, max_retries=None, sleep_seconds=None, token=None):
     """
     Download a remote URL to the location local_path with retries.
 
@@ -44,13 +86,16 @@ def download_url(url, local_path, max_retries=max_retries, sleep_seconds=sleep_s
 
     :param url: the remote URL
     :param local_path: the path to the local file
-    :param max_retries: how many times we may retry to download the file
-    :param sleep_seconds: sleep seconds between retries
+    :param max_retries: how many times we may retry to download the file, from the configuration if None
+    :param sleep_seconds: sleep seconds between retries, from the configuration if None
     :param token: use a header token if specified
     """
+    cfg = config()
+    max_retries = cfg['max_retries'] if max_retries is None else max_retries
+    sleep_seconds = cfg['sleep_seconds'] if sleep_seconds is None else sleep_seconds
     logging.info('download_url - {0} as {1}'.format(url, local_path))
     logging.debug('download_url - if download fails, will try {0} times and wait {1} seconds each time'.format(max_retries, sleep_seconds))
-    sec = random.random() * download_sleep_seconds
+    sec = random.random() * cfg['download_sleep_seconds']
     logging.info('download_url - sleeping {} seconds'.format(sec))
     time.sleep(sec)
 
@@ -68,8 +113,8 @@ def download_url(url, local_path, max_retries=max_retries, sleep_seconds=sleep_s
 
     logging.info('download_url - {0} as {1}'.format(url,local_path))
     remove(local_path)
-    command=[wget,'-O',ensure_dir(local_path),url]
-    for opt in wget_options:
+    command=[cfg['wget'],'-O',ensure_dir(local_path),url]
+    for opt in cfg['wget_options']:
         command.insert(1,opt)
     if token:
         command.insert(1,'--header=\'Authorization: Bearer {}\''.format(token))
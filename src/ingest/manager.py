@@ -0,0 +1,329 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from ingest.compact import compact_file, compact_granule
+from utils.general import available_locally, file_lock, make_dir
+
+from contextlib import contextmanager, ExitStack
+import os.path as osp
+import json, logging, os, sys, time
+
+class IngestManagerError(Exception):
+    """
+    Raised when the ingest manager is misconfigured.
+    """
+    pass
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] >= inner[1] and outer[2] <= inner[2] and outer[3] >= inner[3]
+
+class IngestManager(object):
+    """
+    Disk quota of the ingest directory shared by all the jobs.
+
+    An index next to the satellite files keeps the size, last use, jobs and running processes
+    of each granule. When the ingest directory exceeds the quota, the granules not used by a
+    running job are evicted, least recently used first ('lru' policy), or only the granules
+    not referenced by an existing job directory ('reference' policy).
+
+    Optionally, each downloaded granule is compacted: its files are rewritten keeping only the
+    swath lines around the monitored regions and the domain of the job, with compressed and
+    chunked fields. A granule is downloaded again for a job outside its compacted subset.
+    """
+
+    def __init__(self, root, quota_gb=None, policy='lru', compact=False, regions=[], margin=.5, level=4):
+        """
+        Initialize the ingest manager.
+
+        :param root: ingest directory
+        :param quota_gb: maximum size of the satellite files in GB, no limit if None
+        :param policy: eviction policy, 'lru' or 'reference'
+        :param compact: compact the downloaded granules
+        :param regions: list of monitored regions (lonmin,lonmax,latmin,latmax) kept by the compaction
+        :param margin: margin in degrees of the compacted regions
+        :param level: compression level of the compacted files
+        """
+        if policy not in ('lru','reference'):
+            raise IngestManagerError('IngestManager - unknown eviction policy {}'.format(policy))
+        self.root = make_dir(osp.abspath(root))
+        self.index_path = osp.join(self.root,'ingest_index.json')
+        self.quota = None if quota_gb is None else quota_gb*(1<<30)
+        self.policy = policy
+        self.compact = compact
+        self.regions = [list(r) for r in regions]
+        self.margin = margin
+        self.level = level
+
+    @classmethod
+    def from_job(cls, js):
+        """
+        Ingest manager of a job from the ingest_path and ingest_manager settings.
+        """
+        return cls(js.get('ingest_path','ingest'), **js.get('ingest_manager',{}))
+
+    def load_index(self):
+        if osp.exists(self.index_path):
+            return json.load(open(self.index_path))
+        return {'files': {}}
+
+    @contextmanager
+    def update(self):
+        """
+        Context to update the index, locked against the other processes.
+        """
+        with file_lock(osp.join(self.root,'ingest_index.lock')):
+            index = self.load_index()
+            yield index
+            tmp = self.index_path+'.tmp'
+            json.dump(index, open(tmp,'w'), indent=1)
+            os.replace(tmp, self.index_path)
+
+    def key(self, path):
+        return osp.relpath(osp.abspath(path), self.root)
+
+    def entry(self, index, path):
+        """
+        Entry of a file in the index, reset if the file was replaced since it was indexed.
+        """
+        k = self.key(path)
+        e = index['files'].get(k)
+        mtime = osp.getmtime(path) if osp.exists(path) else None
+        if e is None or e.get('mtime') != mtime:
+            e = {'size': osp.getsize(path) if mtime else 0, 'mtime': mtime, 'last_access': time.time(),
+                'jobs': [], 'pins': {}}
+            index['files'][k] = e
+        return e
+
+    def covers(self, path, bounds):
+        """
+        Check if a local file covers some bounds, which is always the case if it is not compacted.
+
+        :param path: path of the satellite file
+        :param bounds: bounds (lonmin,lonmax,latmin,latmax)
+        """
+        e = self.load_index()['files'].get(self.key(path))
+        if e is None or 'subset' not in e or e.get('mtime') != (osp.getmtime(path) if osp.exists(path) else None):
+            return True
+        return any(contains(box, bounds) for box in e['subset'])
+
+    def add_granule(self, geo_path, fire_path, bounds, pin=None):
+        """
+        Index a retrieved granule, compact it if enabled and enforce the quota.
+
+        :param geo_path: path of the geolocation file
+        :param fire_path: path of the fire file
+        :param bounds: bounds (lonmin,lonmax,latmin,latmax) of the job
+        :param pin: name of the job or process using the granule, protected from eviction while it runs
+        """
+        pin = pin or 'pid{}'.format(os.getpid())
+        if self.compact:
+            self.compact_granule(geo_path, fire_path, bounds)
+        with self.update() as index:
+            for path,other in ((geo_path,fire_path),(fire_path,geo_path)):
+                e = self.entry(index, path)
+                e['pair'] = self.key(other)
+                e['last_access'] = time.time()
+                e['pins'][pin] = os.getpid()
+                if not pin.startswith('pid') and pin not in e['jobs']:
+                    e['jobs'].append(pin)
+        self.enforce()
+
+    def compact_granule(self, geo_path, fire_path, bounds):
+        """
+        Compact the files of a granule not compacted yet around the monitored regions and some bounds.
+        """
+        # the granule files are locked like when they are downloaded
+        with file_lock(geo_path+'.lock'), file_lock(fire_path+'.lock'):
+            index = self.load_index()
+            geo,fire = self.entry(index, geo_path),self.entry(index, fire_path)
+            if 'subset' in geo and 'subset' in fire:
+                return
+            boxes = self.regions+[[float(b) for b in bounds]]
+            try:
+                if 'subset' in geo:
+                    # the fire file was downloaded again, it is compacted like its geolocation file
+                    compact_file(fire_path, geo['window'], geo['shape'], self.level)
+                    info = {'window': geo['window'], 'shape': geo['shape']}
+                    boxes = geo['subset']
+                elif 'subset' in fire:
+                    compact_file(geo_path, fire['window'], fire['shape'], self.level)
+                    info = {'window': fire['window'], 'shape': fire['shape']}
+                    boxes = fire['subset']
+                else:
+                    info = compact_granule(geo_path, fire_path, boxes, self.margin, self.level)
+            except Exception as e:
+                logging.warning('IngestManager.compact_granule - cannot compact {0} with exception {1}'.format(geo_path,repr(e)))
+                return
+            # the size files validate the compacted files when they are reused
+            for path in (geo_path,fire_path):
+                open(path+'.size','w').write(str(osp.getsize(path)))
+            with self.update() as index:
+                for path in (geo_path,fire_path):
+                    e = self.entry(index, path)
+                    e.update(info, subset=boxes)
+
+    def touch(self, paths):
+        """
+        Update the last use of some files.
+
+        :param paths: list of paths of satellite files
+        """
+        with self.update() as index:
+            for path in paths:
+                if osp.exists(path):
+                    self.entry(index, path)['last_access'] = time.time()
+
+    def acquire(self, manifest, bounds, pin):
+        """
+        Check that the granules of a manifest are still available for some bounds and protect
+        them from eviction while the job runs.
+
+        :param manifest: dictionary of manifests of each source
+        :param bounds: bounds (lonmin,lonmax,latmin,latmax) of the job
+        :param pin: name of the job using the granules
+        :return: True if all the granule files are available
+        """
+        paths = [g[k] for m in manifest.values() for g in m.values() for k in ('geo_local_path','fire_local_path')]
+        if not all(available_locally(p) and self.covers(p, bounds) for p in paths):
+            return False
+        with self.update() as index:
+            for path in paths:
+                e = self.entry(index, path)
+                e['last_access'] = time.time()
+                e['pins'][pin] = os.getpid()
+        return True
+
+    def release(self, pin):
+        """
+        Stop protecting the granules used by a job.
+
+        :param pin: name of the job
+        """
+        with self.update() as index:
+            for e in index['files'].values():
+                e['pins'].pop(pin, None)
+
+    def side_files(self):
+        """
+        Info and lock files of the satellite files in the ingest directory.
+
+        :return: list of (path of the side file, path of its satellite file)
+        """
+        sides = []
+        for dirpath,_,files in os.walk(self.root):
+            for name in files:
+                if name.endswith(('.size','.lock')) and not name.startswith('ingest_index'):
+                    sides.append((osp.join(dirpath,name), osp.join(dirpath,name[:-5])))
+        return sides
+
+    def scan(self, index):
+        """
+        Index the satellite files of the ingest directory missing in the index, for instance
+        files downloaded before the index existed, with their modification time as last use.
+        The info files left by satellite files that do not exist are removed. The lock files are
+        kept: removing a lock file while a process waits on it would give the lock to two processes.
+        """
+        for dirpath,_,files in os.walk(self.root):
+            for name in files:
+                # skip the info, lock and index files and the files being compacted
+                if name.endswith(('.size','.lock')) or '.tmp' in name or name.startswith('ingest_index'):
+                    continue
+                path = osp.join(dirpath,name)
+                k = self.key(path)
+                if k not in index['files']:
+                    e = self.entry(index, path)
+                    e['last_access'] = e['mtime']
+        for k in [k for k in index['files'] if not osp.exists(osp.join(self.root,k))]:
+            index['files'].pop(k)
+        for side,path in self.side_files():
+            if side.endswith('.size') and not osp.exists(path):
+                try:
+                    # files being downloaded do not exist yet and are locked
+                    with file_lock(path+'.lock', blocking=False):
+                        self.remove_files([side])
+                except BlockingIOError:
+                    continue
+
+    def remove_files(self, paths):
+        for p in paths:
+            if osp.exists(p):
+                os.remove(p)
+
+    def usage(self):
+        """
+        Total size in bytes of the indexed satellite files and their info and lock files.
+        """
+        sides = sum(osp.getsize(side) for side,_ in self.side_files() if osp.exists(side))
+        return sum(e['size'] for e in self.load_index()['files'].values())+sides
+
+    def enforce(self, quota_gb=None):
+        """
+        Evict granules until the ingest directory is under the quota. The files of a granule
+        are evicted together, and files used by running jobs or being downloaded are kept.
+
+        :param quota_gb: quota in GB, the quota of the manager if None
+        :return: list of evicted files
+        """
+        quota = self.quota if quota_gb is None else quota_gb*(1<<30)
+        if quota is None:
+            return []
+        evicted = []
+        with self.update() as index:
+            self.scan(index)
+            files = index['files']
+            total = sum(e['size'] for e in files.values())+sum(osp.getsize(side) for side,_ in self.side_files() if osp.exists(side))
+            if total <= quota:
+                return []
+            # granules as units of eviction
+            units = set(tuple(sorted([k,e['pair']])) if e.get('pair') in files else (k,) for k,e in files.items())
+            candidates = []
+            for unit in units:
+                entries = [files[k] for k in unit]
+                if any(pid_alive(pid) for e in entries for pid in e['pins'].values()):
+                    continue
+                if self.policy == 'reference' and any(osp.exists(j) for e in entries for j in e['jobs']):
+                    continue
+                candidates.append((max(e['last_access'] for e in entries), unit))
+            for _,unit in sorted(candidates):
+                if total <= quota:
+                    break
+                paths = [osp.join(self.root,k) for k in unit]
+                try:
+                    # files being downloaded or compacted are skipped
+                    with ExitStack() as stack:
+                        for path in paths:
+                            stack.enter_context(file_lock(path+'.lock', blocking=False))
+                        for k,path in zip(unit,paths):
+                            # the lock is held, so nobody else is using its file, and the lock file is kept
+                            total -= files.pop(k)['size']+(osp.getsize(path+'.size') if osp.exists(path+'.size') else 0)
+                            self.remove_files([path,path+'.size'])
+                            evicted.append(path)
+                except BlockingIOError:
+                    continue
+            if total > quota:
+                logging.warning('IngestManager.enforce - {0:.2f} GB over the quota in files used by jobs'.format((total-quota)/float(1<<30)))
+        if evicted:
+            logging.info('IngestManager.enforce - {} files evicted'.format(len(evicted)))
+        return evicted
+
+if __name__ == '__main__':
+    from utils.general import load_sys_cfg
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys_cfg = load_sys_cfg()
+    manager = IngestManager.from_job(sys_cfg)
+    quota_gb = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    if quota_gb is None and manager.quota is None:
+        print('usage: python src/ingest/manager.py [quota_gb]')
+        sys.exit(1)
+    manager.enforce(quota_gb)
+    print('{0:.2f} GB in {1}'.format(manager.usage()/float(1<<30),manager.root))
@@ -0,0 +1,142 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from ingest.MODIS import Terra, Aqua
+from ingest.VIIRS import SNPP, SNPPHR, NOAA20, NOAA20HR
+from utils.general import Dict, load_sys_cfg, process_arguments, process_bounds
+from utils.checkpoint import Checkpoint, retrieve_key
+from utils.executor import get_executor
+from utils.times import str_to_dt
+
+import os.path as osp
+import logging
+
+sat_classes = {'Terra': Terra, 'Aqua': Aqua, 'SNPP': SNPP, 'SNPPHR': SNPPHR, 'NOAA20': NOAA20, 'NOAA20HR': NOAA20HR}
+
+def job_args(job_file):
+    """
+    Job arguments of a job file without creating the job directory.
+
+    :param job_file: path to the job JSON file
+    :return: dictionary with the job arguments, bounds and times
+    """
+    js = Dict(process_arguments(load_sys_cfg(), job_file))
+    js.bounds = process_bounds(js.bbox)
+    js.from_utc = str_to_dt(js.start_utc)
+    js.to_utc = str_to_dt(js.end_utc)
+    return js
+
+def overlap(js1, js2):
+    """
+    Check if two jobs overlap in space and time.
+    """
+    b1,b2 = js1.bounds,js2.bounds
+    return (b1[0] <= b2[1] and b2[0] <= b1[1] and b1[2] <= b2[3] and b2[2] <= b1[3]
+            and js1.from_utc <= js2.to_utc and js2.from_utc <= js1.to_utc)
+
+def union_retrieval(source, js):
+    """
+    Run a union query of a satellite source.
+
+    :param source: satellite source name
+    :param js: union job arguments
+    :return: manifest of the union query, None if the retrieval failed
+    """
+    try:
+        return sat_classes[source](js).retrieve_data()
+    except Exception as e:
+        logging.error('union_retrieval - {0} union retrieval failed with exception {1}'.format(source,repr(e)))
+        return None
+
+def in_window(granule, js):
+    """
+    Check if a granule from a manifest intersects the time window of a job.
+    """
+    g_start = str_to_dt(granule['time_start_iso'],'%Y-%m-%dT%H:%M:%S.%fZ')
+    g_end = str_to_dt(granule['time_end_iso'],'%Y-%m-%dT%H:%M:%S.%fZ')
+    return g_start <= js.to_utc and g_end >= js.from_utc
+
+class RetrievalPlanner(object):
+    """
+    Plans the satellite retrieval of several jobs, merging the jobs overlapping in space and time
+    into union queries so each granule is searched and downloaded once. The union manifests are
+    fanned out to each job, keeping the granules in its time window, and saved as the retrieval
+    stage checkpoint of each job. The bounding box of each job is clipped later by 
+    SatGranule.compute_mask.
+    """
+
+    def __init__(self, job_files):
+        """
+        Initialize the planner.
+
+        :param job_files: list of paths to job JSON files
+        """
+        self.job_files = job_files
+        self.jobs = [job_args(job_file) for job_file in job_files]
+
+    def groups(self, source):
+        """
+        Groups of jobs requesting a source and connected by space-time overlaps.
+
+        :param source: satellite source name
+        :return: list of lists of job indices
+        """
+        idx = [k for k,js in enumerate(self.jobs) if source in js.get('sat_sources',[])]
+        parent = {k: k for k in idx}
+        def find(k):
+            while parent[k] != k:
+                k = parent[k]
+            return k
+        for i,k1 in enumerate(idx):
+            for k2 in idx[i+1:]:
+                if overlap(self.jobs[k1],self.jobs[k2]):
+                    parent[find(k2)] = find(k1)
+        groups = {}
+        for k in idx:
+            groups.setdefault(find(k),[]).append(k)
+        return list(groups.values())
+
+    def plan(self):
+        """
+        Union queries of all the sources.
+
+        :return: list of tuples (source, union job arguments, job indices)
+        """
+        plan = []
+        for source in sat_classes.keys():
+            for group in self.groups(source):
+                js = Dict(self.jobs[group[0]])
+                bounds = [self.jobs[k].bounds for k in group]
+                js.bounds = (min(b[0] for b in bounds),max(b[1] for b in bounds),
+                             min(b[2] for b in bounds),max(b[3] for b in bounds))
+                js.from_utc = min(self.jobs[k].from_utc for k in group)
+                js.to_utc = max(self.jobs[k].to_utc for k in group)
+                logging.info('RetrievalPlanner.plan - {0} union query {1} {2} for {3} jobs'.format(source,js.bounds,(js.from_utc,js.to_utc),len(group)))
+                plan.append((source,js,group))
+        return plan
+
+    def run(self, max_workers=4):
+        """
+        Run the union queries and save the retrieval stage checkpoint of each job.
+
+        :param max_workers: number of union queries running at the same time
+        :return: list of manifests of each job
+        """
+        plan = self.plan()
+        manifests = [Dict({s: {} for s in js.get('sat_sources',[])}) for js in self.jobs]
+        failed = set()
+        unions = get_executor().map(union_retrieval, [p[0] for p in plan], [p[1] for p in plan], threads=max_workers)
+        for (source,js,group),union in zip(plan,unions):
+            if union is None:
+                failed.update(group)
+                continue
+            for k in group:
+                manifests[k][source] = {g_id: g for g_id,g in union.items() if in_window(g,self.jobs[k])}
+        # jobs with failed retrievals are retrieved again by their Driver
+        for k,(js,manifest) in enumerate(zip(self.jobs,manifests)):
+            if k in failed:
+                continue
+            ckpt = Checkpoint(osp.join(js.workspace_path,'checkpoints'))
+            ckpt.save('retrieve', retrieve_key(js), manifest)
+        return manifests
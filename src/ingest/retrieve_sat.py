@@ -5,7 +5,7 @@
 import logging, sys
 from job import Job
 from ingest.MODIS import Terra, Aqua
-from ingest.VIIRS import SNPP, SNPPHR, NOAA20
+from ingest.VIIRS import SNPP, SNPPHR, NOAA20, NOAA20HR
 
 if __name__ == '__main__':
     # create job
@@ -32,15 +32,19 @@ if __name__ == '__main__':
         snpp=SNPP(jb)
         # retrieve granules
         m_snpp=snpp.retrieve_data()
-    if 'SNPP_HR' in sat_sources:
+    if 'SNPPHR' in sat_sources:
         logging.info('>> High resolution S-NPP VIIRS <<')
         snpphr=SNPPHR(jb)
         # retrieve granules
         m_snpphr=snpphr.retrieve_data()
-        print(m_snpphr)
-    if 'NOAA-20' in sat_sources:
+    if 'NOAA20' in sat_sources:
         logging.info('>> NOAA-20 VIIRS <<')
         noaa20=NOAA20(jb)
         # retrieve granules
         m_noaa20=noaa20.retrieve_data()
+    if 'NOAA20HR' in sat_sources:
+        logging.info('>> High resolution NOAA-20 VIIRS <<')
+        noaa20hr=NOAA20HR(jb)
+        # retrieve granules
+        m_noaa20hr=noaa20hr.retrieve_data()
 
@@ -2,13 +2,13 @@
 # Angel Farguell, CU Denver
 #
 
-import re, datetime, logging, requests
+import re, datetime, logging, os
 import os.path as osp
-import numpy as np
-from cmr import GranuleQuery
-from utils.general import Dict, available_locally, duplicates
+from utils.general import Dict, available_locally, duplicates, file_lock
 from utils.times import dt_to_esmf, str_to_dt
-from .downloader import download_url, DownloadError
+from utils.metrics import timer
+from .downloader import download_url, download_slot, DownloadError
+from .manager import IngestManager
 
 class SatSourceError(Exception):
     """
@@ -36,37 +36,48 @@ class SatSource(object):
         self.tokens=js.get('tokens')
         self.bounds=js.get('bounds')
         self.times=(js.get('from_utc'),js.get('to_utc'))
+        # optional CMR search and archive endpoints, for instance a local stand-in server
+        self.cmr_url=js.get('cmr_url')
+        self.base_url=js.get('archive_url',self.base_url)
+        self.base_url_nrt=js.get('archive_url_nrt',self.base_url_nrt)
+        # disk quota and compaction of the ingest directory, the granules are protected while the job runs
+        self.ingest=IngestManager.from_job(js)
+        self.pin=js.get('job_path') or 'pid{}'.format(os.getpid())
         lonmin,lonmax,latmin,latmax = self.bounds
         self.bbox = [(lonmin,latmax),(lonmin,latmin),(lonmax,latmin),(lonmax,latmax),(lonmin,latmax)]
 
     @staticmethod
-    def search_api(sname, bbox, time, collection=None):
+    def search_api(sname, bbox, time, collection=None, cmr_url=None):
         """
         API search of the different satellite granules and return metadata dictionary
 
         :param sname: short name satellite product, ex: 'MOD03'
         :param bbox: polygon with the search bounding box
         :param time: time interval as datetime (init_time_datetime,final_time_datetime)
+        :param collection: optional collection concept id to keep
+        :param cmr_url: optional CMR search URL, the operational CMR if None
 
         :return metas: a dictionary with all the metadata for the API search
         """
+        from cmr import GranuleQuery
         logging.info('search_api - CMR API search for {0} collection {1}'.format(sname,collection))
         maxg=1000
         time_esmf=(dt_to_esmf(time[0]),dt_to_esmf(time[1]))
-        api = GranuleQuery()
-        search = api.parameters(
-                    short_name=sname,
-                    downloadable=True,
-                    polygon=bbox,
-                    temporal=time_esmf)
-        sh=search.hits()
-        if sh>maxg:
-            logging.warning('search_api - the number of hits {0} is larger than the limit {1}'.format(sh,maxg))
-            logging.warning('search_api - any satellite data with prefix {} used'.format(sname))
-            logging.warning('search_api - use a reduced bounding box or a reduced time interval')
-            metas = []
-        else:
-            metas = api.get(sh)
+        with timer('cmr_search', item=sname):
+            api = GranuleQuery(cmr_url) if cmr_url else GranuleQuery()
+            search = api.parameters(
+                        short_name=sname,
+                        downloadable=True,
+                        polygon=bbox,
+                        temporal=time_esmf)
+            sh=search.hits()
+            if sh>maxg:
+                logging.warning('search_api - the number of hits {0} is larger than the limit {1}'.format(sh,maxg))
+                logging.warning('search_api - any satellite data with prefix {} used'.format(sname))
+                logging.warning('search_api - use a reduced bounding box or a reduced time interval')
+                metas = []
+            else:
+                metas = api.get(sh)
         if collection:
             metas = [m for m in metas if m['collection_concept_id'] == collection]
         logging.info('search_api - {} hits in this range'.format(len(metas)))
@@ -100,10 +111,10 @@ class SatSource(object):
         :return metas: dictionary with the metadata of all the products
         """
         metas=Dict({})
-        metas.geo=self.search_api(self.geo_prefix,self.bbox,self.times,collection=self.geo_collection_id)
-        metas.fire=self.search_api(self.fire_prefix,self.bbox,self.times,collection=self.fire_collection_id)
-        metas.geo_nrt=self.search_api(self.geo_nrt_prefix,self.bbox,self.times,collection=self.geo_nrt_collection_id)
-        metas.fire_nrt=self.search_api(self.fire_nrt_prefix,self.bbox,self.times,collection=self.fire_nrt_collection_id)
+        metas.geo=self.search_api(self.geo_prefix,self.bbox,self.times,collection=self.geo_collection_id,cmr_url=self.cmr_url)
+        metas.fire=self.search_api(self.fire_prefix,self.bbox,self.times,collection=self.fire_collection_id,cmr_url=self.cmr_url)
+        metas.geo_nrt=self.search_api(self.geo_nrt_prefix,self.bbox,self.times,collection=self.geo_nrt_collection_id,cmr_url=self.cmr_url)
+        metas.fire_nrt=self.search_api(self.fire_nrt_prefix,self.bbox,self.times,collection=self.fire_nrt_collection_id,cmr_url=self.cmr_url)
         return metas
 
     def group_metas(self,metas):
@@ -154,26 +165,31 @@ class SatSource(object):
 
         return gmetas
 
-    def download_data(self, urls, token):
+    def download_data(self, urls, token, data_center=None):
         """
         Download a satellite file from a satellite service
 
         :param urls: the URLs of the file
         :param token: key to use for the download or None if not
+        :param data_center: data center name for the metrics
         """
         for url in urls:
             logging.info('download_sat - downloading {0} satellite data from {1}'.format(self.prefix, url))
             sat_name = osp.basename(url)
             sat_path = osp.join(self.ingest_dir,sat_name)
-            if available_locally(sat_path):
-                logging.info('download_sat - {} is available locally'.format(sat_path))
-                return {'url': urls[0],'local_path': sat_path}
-            else:
-                try:
-                    download_url(url, sat_path, token=token)
-                    return {'url': url,'local_path': sat_path,'downloaded': datetime.datetime.now}
-                except DownloadError as e:
-                    logging.warning('download_sat - {0} cannot download satellite file {1}'.format(self.prefix, url))
+            # jobs running at the same time wait for each other instead of downloading twice
+            with file_lock(sat_path+'.lock'):
+                if available_locally(sat_path) and self.ingest.covers(sat_path, self.bounds):
+                    logging.info('download_sat - {} is available locally'.format(sat_path))
+                    return {'url': urls[0],'local_path': sat_path}
+                else:
+                    try:
+                        with download_slot(), timer('download', item=url, data_center=data_center) as rec:
+                            download_url(url, sat_path, token=token)
+                            rec['bytes'] = osp.getsize(sat_path) if osp.exists(sat_path) else 0
+                        return {'url': url,'local_path': sat_path,'downloaded': datetime.datetime.now}
+                    except DownloadError as e:
+                        logging.warning('download_sat - {0} cannot download satellite file {1}'.format(self.prefix, url))
 
         logging.error('download_sat - {} cannot download satellite file'.format(self.prefix))
         logging.warning('download_sat - please check {0} for {1}'.format(self.info_url, self.info))
@@ -194,13 +210,14 @@ class SatSource(object):
                 fire_meta = metas['fire'][g_id]
                 logging.info('retrieve_metas - downloading product id {}'.format(g_id))
                 urls = [geo_meta['links'][0]['href'],geo_meta.get('archive_url')]
-                m_geo = self.download_data(urls,self.datacenter_to_token(geo_meta['data_center']))
+                m_geo = self.download_data(urls,self.datacenter_to_token(geo_meta['data_center']),geo_meta['data_center'])
                 if m_geo:
                     geo_meta.update(m_geo)
                     urls = [fire_meta['links'][0]['href'],fire_meta.get('archive_url')]
-                    m_fire = self.download_data(urls,self.datacenter_to_token(fire_meta['data_center']))
+                    m_fire = self.download_data(urls,self.datacenter_to_token(fire_meta['data_center']),fire_meta['data_center'])
                     if m_fire:
                         fire_meta.update(m_fire)
+                        self.ingest.add_granule(geo_meta['local_path'], fire_meta['local_path'], self.bounds, self.pin)
                         manifest.update({g_id: {
                             'time_start_iso' : geo_meta['time_start'],
                             'time_end_iso' : geo_meta['time_end'],
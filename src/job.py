@@ -2,7 +2,7 @@
 # Angel Farguell, CU Denver
 #
 
-from utils.general import Dict, load_sys_cfg, make_dir, process_arguments, process_bounds
+from utils.general import Dict, load_sys_cfg, make_unique_dir, process_arguments, process_bounds
 from utils.times import esmf_now, str_to_dt
 
 import logging,json
@@ -23,11 +23,10 @@ class Job(Dict):
         sys_cfg = load_sys_cfg()
         # process arguments
         self.update(process_arguments(sys_cfg,job_file))
+        # job path, unique for jobs of the same case started at the same time
+        self.job_path = make_unique_dir(osp.join(self.workspace_path,self.case_name+'_'+esmf_now()))
         # define job name
-        self.job_name = self.case_name+'_'+esmf_now()
-        # job path
-        self.job_path = osp.join(self.workspace_path,self.job_name)
-        make_dir(self.job_path)	
+        self.job_name = osp.basename(self.job_path)
         # save job state in work directory
         json.dump(self, open(osp.join(self.job_path,'job.json'),'w'), indent=4, separators=(',', ': '))
         # add new attributes
@@ -0,0 +1,374 @@
+import numpy as np
+import logging
+import pickle
+import sklearn
+from ml.svm import SVM, reduce_svc
+from scipy.spatial import cKDTree
+from ml.svm_eval import make_meshgrid, RBFExpansion
+from utils.executor import get_executor
+from utils.resources import get_plan
+
+def fit_svm(X, y, sample_weight=None, param_grid={}, search=None, plan=None, max_error=None, C=None):
+    """
+    Fit an independent SVM, used as a task of the executor.
+
+    :param X: training points (lon,lat,time)
+    :param y: training labels
+    :param sample_weight: optional sample weights
+    :param param_grid: parameter grid of the SVM
+    :param search: None to fit with the default hyperparameters, or the search mode of SVM.grid_cv
+    :param plan: resource plan of the task, the one of the process if None
+    :param max_error: maximum decision function error for support vector reduction, None to not reduce
+    :param C: regularization parameter of the fit without search, the default one if None
+    :return: fitted SVM or None if there are not two classes
+    """
+    if len(np.unique(y)) < 2:
+        return None
+    svm = SVM(dict(param_grid), max_error)
+    svm.plan = plan
+    if C is not None:
+        svm.model.C = C
+    if search is None:
+        svm.fit(X, y, sample_weight=sample_weight)
+    else:
+        svm.grid_cv(X, y, sample_weight=sample_weight, search=search)
+    # the share of the task is only for the fit
+    svm.plan = None
+    return svm
+
+def fit_member(estimator, X, y, sample_weight=None, max_error=None, cache_size=None, max_mb=None):
+    """
+    Fit a clone of a RBF SVC, used as a worker of the process pools.
+
+    :param estimator: RBF sklearn.svm.SVC
+    :param X: scaled training points
+    :param y: training labels
+    :param sample_weight: optional sample weights
+    :param max_error: maximum decision function error for support vector reduction, None to not reduce
+    :param cache_size: libsvm kernel cache in MB, the one of the estimator if None
+    :param max_mb: memory budget in MB of the support vector reduction, the one of the resource plan if None
+    :return: RBFExpansion of the fitted model and indices of its support vectors in X
+    """
+    model = sklearn.base.clone(estimator)
+    if cache_size is not None:
+        model.cache_size = cache_size
+    model.fit(X, y, sample_weight=sample_weight)
+    if max_error is None:
+        return RBFExpansion.from_svc(model), model.support_
+    return reduce_svc(model, max_error, max_mb=max_mb), model.support_
+
+def smooth_weight(x, lo, hi, ramp):
+    """
+    Weight 1 in [lo+ramp,hi-ramp], 0 outside [lo,hi] and smoothstep in between.
+
+    :param x: coordinates
+    :param lo: lower bound of the support
+    :param hi: upper bound of the support
+    :param ramp: length of the transition
+    :return: weights in [0,1]
+    """
+    if ramp <= 0:
+        return np.logical_and(x >= lo, x <= hi).astype(float)
+    s = np.clip(np.minimum(x-lo, hi-x)/ramp, 0., 1.)
+    return s*s*(3-2*s)
+
+class TiledSVM(object):
+    """
+    Independent SVM models fitted in parallel in overlapping lon/lat tiles of the domain. The
+    fire arrival time of each tile is blended with smooth weights in the overlaps.
+    """
+
+    def __init__(self, ntiles=(2,2), overlap=.25, param_grid={}, search=None, max_error=None, C=None):
+        """
+        Initialize the tiled model.
+
+        :param ntiles: number of tiles in longitude and latitude
+        :param overlap: overlap of each tile with its neighbors, relative to the tile size
+        :param param_grid: parameter grid of each SVM
+        :param search: None to fit with the default hyperparameters, or the search mode of SVM.grid_cv
+        :param max_error: maximum decision function error for support vector reduction of each SVM, None to not reduce
+        :param C: regularization parameter of each SVM fitted without search, the default one if None
+        """
+        self.ntiles = ntiles
+        self.overlap = overlap
+        self.param_grid = param_grid
+        self.search = search
+        self.max_error = max_error
+        self.C = C
+        self.tiles = []
+        self.models = []
+        self.constant = []
+
+    def make_tiles(self, X):
+        """
+        Compute the overlapping tiles covering the lon/lat extent of X.
+
+        :param X: points (lon,lat,time)
+        :return: list of tuples (lonmin,lonmax,latmin,latmax,ramp_lon,ramp_lat) of extended tiles
+        """
+        self.bounds = (X[:,0].min(), X[:,0].max(), X[:,1].min(), X[:,1].max())
+        ex = np.linspace(self.bounds[0], self.bounds[1], self.ntiles[0]+1)
+        ey = np.linspace(self.bounds[2], self.bounds[3], self.ntiles[1]+1)
+        ox = self.overlap*(ex[1]-ex[0])
+        oy = self.overlap*(ey[1]-ey[0])
+        return [(ex[i]-ox, ex[i+1]+ox, ey[j]-oy, ey[j+1]+oy, 2*ox, 2*oy)
+                    for i in range(self.ntiles[0]) for j in range(self.ntiles[1])]
+
+    def fit(self, X, y, sample_weight=None):
+        self.tiles = self.make_tiles(X)
+        self.time_bounds = (X[:,2].min(), X[:,2].max())
+        executor = get_executor()
+        logging.info('TiledSVM.fit - fitting {} tiles with {} workers'.format(len(self.tiles),executor.workers))
+        Xs,ys,sws = [],[],[]
+        for tile in self.tiles:
+            mask = np.logical_and(np.logical_and(X[:,0] >= tile[0], X[:,0] <= tile[1]),
+                                    np.logical_and(X[:,1] >= tile[2], X[:,1] <= tile[3]))
+            logging.info('TiledSVM.fit - tile {} with {} points'.format(tile[:4],mask.sum()))
+            Xs.append(X[mask])
+            ys.append(y[mask])
+            sws.append(None if sample_weight is None else sample_weight[mask])
+        n = len(self.tiles)
+        # each tile is fitted within its share of the budget of the tiles fitted at the same time
+        plan = get_plan().share(min(n, executor.workers))
+        self.models = executor.map(fit_svm, Xs, ys, sws, [self.param_grid]*n, [self.search]*n, [plan]*n,
+                                    [self.max_error]*n, [self.C]*n)
+        # tiles with a single class burned at the beginning if only fire, or never if only ground or empty
+        self.constant = [self.time_bounds[0] if len(yt) and (yt == 1).all() else self.time_bounds[1] for yt in ys]
+        logging.info('TiledSVM.fit - {} of {} tiles fitted'.format(sum(m is not None for m in self.models),len(self.tiles)))
+
+    def estimate_tign_points(self, lon, lat, nz=40):
+        """
+        Estimate tign_g at arbitrary (lon,lat) points blending the tiles covering each point.
+        Tiles with a single class contribute the beginning of the time interval if they only
+        have fire detections and the end otherwise, and points outside of all the tiles are nan.
+
+        :param lon: longitudes of the target points, any shape
+        :param lat: latitudes of the target points, same shape than lon
+        :param nz: number of time levels of each column
+        :return tign: fire arrival time with the same shape than lon
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        num = np.zeros(lon.shape)
+        den = np.zeros(lon.shape)
+        # models saved before the constant tiles were recorded had no fire-only tiles
+        constant = getattr(self, 'constant', None) or [self.time_bounds[1]]*len(self.tiles)
+        for tile,model,tc in zip(self.tiles,self.models,constant):
+            w = smooth_weight(lon, tile[0], tile[1], tile[4])*smooth_weight(lat, tile[2], tile[3], tile[5])
+            mask = w > 0
+            if not mask.any():
+                continue
+            if model is None:
+                t = tc
+            else:
+                t = model.estimate_tign_points(lon[mask], lat[mask], nz)
+            num[mask] += w[mask]*t
+            den[mask] += w[mask]
+        tign = np.full(lon.shape, np.nan)
+        tign[den > 0] = num[den > 0]/den[den > 0]
+        return tign
+
+    def estimate_tign_g(self, n=(400,400,40)):
+        """
+        Estimate tign_g in a regular lon/lat grid of the domain.
+
+        :param n: grid size (nx,ny,nz)
+        :return Fx,Fy,Fz: longitude, latitude and fire arrival time arrays
+        """
+        logging.info('TiledSVM.estimate_tign_g - estimating tign_g')
+        gx,gy,_ = make_meshgrid((n[0],n[1],1))
+        Fx = self.bounds[0]+gx[:,:,0]*(self.bounds[1]-self.bounds[0])
+        Fy = self.bounds[2]+gy[:,:,0]*(self.bounds[3]-self.bounds[2])
+        return Fx, Fy, self.estimate_tign_points(Fx, Fy, n[2])
+
+    def save_model(self, path):
+        logging.info('TiledSVM.save_model - saving the model into {}'.format(path))
+        with open(path,'wb') as f:
+            pickle.dump(self,f)
+
+class BaggedSVM(SVM):
+    """
+    Ensemble of RBF SVC models fitted in parallel on disjoint or bootstrap subsamples of the data.
+
+    The hyperparameter approximation and the preprocessing are done once, so all the members share
+    the same scaled space and the ensemble decision function, the average of the members, is a 
+    single kernel expansion used by decision_function, estimate_tign_g and export_model. The
+    members are kept as kernel expansions, so self.model is only the estimator cloned by them.
+    """
+
+    def __init__(self, n_estimators=8, bootstrap=False, max_samples=None, param_grid={}, max_error=None):
+        """
+        Initialize the ensemble.
+
+        :param n_estimators: number of members
+        :param bootstrap: draw the subsamples with replacement instead of disjoint subsamples
+        :param max_samples: proportion of the data of each bootstrap subsample, 1/n_estimators if None
+        :param param_grid: parameter grid of the SVM
+        :param max_error: maximum decision function error for support vector reduction of each member, None to not reduce
+        """
+        super(BaggedSVM, self).__init__(param_grid, max_error)
+        self.n_estimators = n_estimators
+        self.bootstrap = bootstrap
+        self.max_samples = max_samples or 1./n_estimators
+        self.members = []
+
+    def subsamples(self, y, seed=0):
+        """
+        Indices of the subsample of each member, stratified by class if disjoint.
+
+        :param y: training labels
+        :param seed: random seed
+        :return: list of arrays of indices
+        """
+        rng = np.random.default_rng(seed)
+        if self.bootstrap:
+            size = max(1, int(self.max_samples*len(y)))
+            return [np.sort(rng.choice(len(y), size=size, replace=True)) for _ in range(self.n_estimators)]
+        splits = [np.array_split(rng.permutation(np.where(y == c)[0]), self.n_estimators) for c in np.unique(y)]
+        return [np.sort(np.concatenate([s[k] for s in splits])) for k in range(self.n_estimators)]
+
+    def prepare(self, X, y, sample_weight=None):
+        """
+        Hyperparameter approximation and preprocessing of the training data shared by the members.
+
+        :return X,y,sample_weight: scaled training points, labels and sample weights
+        """
+        self.hyper_opt(X)
+        logging.info('BaggedSVM.prepare - preprocessing the data')
+        X, y = self.preprocess(X, y)
+        X *= self.scale_dims
+        self.model.gamma = self.gamma
+        if sample_weight is not None:
+            sample_weight = sample_weight[self.sample_indices]
+        self.sw_train = sample_weight
+        return X, y, sample_weight
+
+    def fit_members(self, X, y, sample_weight=None, samples=None, members=None):
+        """
+        Fit members in parallel on samples of the scaled training data, each one within its share
+        of the budget of the fits running at the same time, and average all the members.
+
+        :param X: scaled training points
+        :param y: training labels
+        :param sample_weight: optional sample weights
+        :param samples: indices of the points fitted by each member, new subsamples of all the members if None
+        :param members: indices of the members to fit with samples, all the members if None
+        """
+        executor = get_executor()
+        if samples is None:
+            samples = self.subsamples(y)
+            self.member_samples_ = samples
+        if members is None:
+            members = list(range(len(samples)))
+            self.members = [None]*len(samples)
+            self.member_support_ = [None]*len(samples)
+        n = len(members)
+        logging.info('BaggedSVM.fit_members - fitting {} members with {} workers'.format(n,executor.workers))
+        plan = self.resources().share(min(n,executor.workers))
+        cache = plan.cache_mb(max(len(idx) for idx in samples))
+        fits = executor.map(fit_member, [self.model]*n, [X[idx] for idx in samples], [y[idx] for idx in samples],
+                                    [None if sample_weight is None else sample_weight[idx] for idx in samples], 
+                                    [self.max_error]*n, [cache]*n, [plan.memory_mb]*n)
+        # support vectors of each member referred to the whole training data
+        for k,idx,(member,support) in zip(members,samples,fits):
+            self.members[k] = member
+            self.member_support_[k] = idx[support]
+        K = float(len(self.members))
+        self.reduced = RBFExpansion(np.concatenate([m.support_vectors_ for m in self.members]),
+                                    np.concatenate([m.dual_coef_ for m in self.members])/K,
+                                    np.mean([m.intercept_ for m in self.members]), self.members[0].gamma)
+        logging.info('BaggedSVM.fit_members - ensemble with {} support vectors'.format(len(self.reduced)))
+
+    def fit(self, X, y, sample_weight=None):
+        X, y, sample_weight = self.prepare(X, y, sample_weight)
+        self.fit_members(X, y, sample_weight)
+
+    def grid_cv(self, X, y, sample_weight=None, search='grid'):
+        """
+        Tune C and gamma on the subsample of the first member, which has the size of the data of 
+        each member, and fit the ensemble with the best parameters.
+
+        :param X: training points (lon,lat,time)
+        :param y: training labels
+        :param sample_weight: optional sample weights
+        :param search: search mode of SVM.grid_cv
+        """
+        X, y, sample_weight = self.prepare(X, y, sample_weight)
+        idx = self.subsamples(y)[0]
+        self.tune(X[idx], y[idx], None if sample_weight is None else sample_weight[idx], search)
+        # the members only need the parameters of the best estimator
+        self.model = sklearn.base.clone(self.model)
+        self.fit_members(X, y, sample_weight)
+
+    def update(self, X, y, sample_weight=None, radius=3.):
+        """
+        Update the ensemble with new points. The new points are split among the members like the
+        training data, and only the members receiving new points are refitted, each one with a
+        working set made of its support vectors, its new points and its training history close to
+        them, as SVM.update. If the new points extend the scaling, the kernel expansions of the 
+        members are not valid anymore and all of them are refitted with their subsamples.
+
+        :param X: new points (lon,lat,time)
+        :param y: new labels
+        :param sample_weight: optional sample weights of the new points
+        :param radius: radius of the history around the new points in kernel widths
+        """
+        logging.info('BaggedSVM.update - updating the ensemble with {} new points'.format(len(y)))
+        gamma_factor = self.model.gamma/self.gamma
+        scaling = (self.gamma, self.scale_dims, self.scaler.data_min_, self.scaler.data_max_)
+        Xs,y_all,sw_all = self.extend(X, y, sample_weight)
+        self.model.gamma = self.gamma*gamma_factor
+        sigma = 1/np.sqrt(2*self.model.gamma)
+        nold = len(y_all)-len(y)
+        new = np.arange(nold, len(y_all))
+        parts = [new[p] for p in self.subsamples(y, seed=nold)]
+        self.member_samples_ = [np.r_[idx, p] for idx,p in zip(self.member_samples_, parts)]
+        if not all(np.array_equal(a, b) for a,b in zip(scaling, (self.gamma, self.scale_dims, self.scaler.data_min_, self.scaler.data_max_))):
+            logging.info('BaggedSVM.update - scaling extended, refitting all the members')
+            self.fit_members(Xs, y_all, sw_all, self.member_samples_)
+        else:
+            members = [k for k,p in enumerate(parts) if len(p)]
+            work = []
+            for k in members:
+                old = self.member_samples_[k][self.member_samples_[k] < nold]
+                dist,_ = cKDTree(Xs[parts[k]]).query(Xs[old], distance_upper_bound=radius*sigma)
+                work.append(np.unique(np.r_[self.member_support_[k], old[np.isfinite(dist)], parts[k]]))
+            logging.info('BaggedSVM.update - refitting {} of {} members'.format(len(members),len(self.members)))
+            self.fit_members(Xs, y_all, sw_all, work, members)
+        self.affected_region(X, radius*sigma)
+
+    def compress(self):
+        pass
+
+    def expansion(self, reduced=True):
+        return self.reduced
+
+    def decision_function(self, G, mthreads=True, blas=True, dtype=np.float64):
+        """
+        Evaluate the decision function of the ensemble.
+
+        :param G: scaled points to evaluate
+        :param mthreads: not used, the members are evaluated with the blocked BLAS evaluator
+        :param blas: evaluate the averaged kernel expansion at once, or average the members
+        :param dtype: floating point type of the BLAS evaluator, np.float64 or np.float32
+        :return Z: decision function at each point of G
+        """
+        if blas:
+            return super(BaggedSVM, self).decision_function(G, blas=True, dtype=dtype)
+        logging.info('BaggedSVM.decision_function - averaging {} members for {} points'.format(len(self.members),len(G)))
+        return np.mean([m.decision_function(G) for m in self.members], axis=0)
+
+    def __getstate__(self):
+        # the subsamples of the members refer to the training history, not saved with the model
+        state = super(BaggedSVM, self).__getstate__()
+        state['member_samples_'] = state['member_support_'] = None
+        return state
+
+    def decision_spread(self, G):
+        """
+        Standard deviation of the members decision functions.
+
+        :param G: scaled points to evaluate
+        :return: standard deviation at each point of G
+        """
+        return np.std([m.decision_function(G) for m in self.members], axis=0)
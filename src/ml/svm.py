@@ -3,53 +3,362 @@ import sklearn
 import numpy as np
 import logging
 import pickle
-import psutil
-import concurrent.futures
-from multiprocessing import Pool
+import joblib
+import tempfile
 import os.path as osp
 from collections import Counter
-from scipy import interpolate
-
-def make_meshgrid(n):
-    logging.info('making meshgrid with size={}'.format(n))
-    nx, ny, nz = n
-    gx, gy, gz = np.meshgrid(np.linspace(0., 1., ny),
-                         np.linspace(0., 1., nx),
-                         np.linspace(0., 1., nz))
-    return gx, gy, gz
-
-def find_roots(Fx,Fy,zr,Z):
-    logging.info('finding roots of the decision function')
-    Fz = np.zeros(Fx.shape)
-    for k1 in range(Fx.shape[0]):
-        for k2 in range(Fx.shape[1]):
-            pz = interpolate.CubicSpline(zr, Z[k1,k2])
-            rr = pz.roots()
-            realr = rr.real[np.logical_and(abs(rr.imag) < 1e-5, np.logical_and(rr.real > zr.min(), rr.real < zr.max()))]
-            if len(realr) > 0:
-                Fz[k1,k2] = realr.min()
-            else:
-                Fz[k1,k2] = np.nan
-    return Fz
+from scipy.spatial import cKDTree
+from ml.svm_eval import make_meshgrid, find_roots, rbf_decision, RBFExpansion, SVMModel, estimate_tign, estimate_tign_points
+from utils.executor import get_executor
+from utils.resources import get_plan
+from utils.metrics import timed
+
+def reduce_svc(model, max_error=1e-2, n_check=4000, max_mb=None, seed=0):
+    """
+    Compress a fitted binary RBF SVC selecting a subset of its support vectors greedily (kernel
+    matching pursuit). The decision function is projected into the span of the kernels of the
+    selected support vectors in the kernel feature space, and the next support vector is the one 
+    reducing the most the norm of the residual, using a pivoted Cholesky factorization of the kernel
+    matrix of the support vectors built one column at a time. Since the RBF kernel is bounded by 1,
+    the norm of the residual bounds the error of the decision function everywhere, and it goes to
+    zero when all the support vectors are selected.
+
+    Each time the number of selected support vectors grows by 25%, the reduced model is accepted if
+    the bound is below max_error, or if the maximum absolute error at the support vectors and at a 
+    held-out sample of the domain (points uniformly distributed in the box of the support vectors and
+    jittered support vectors) is below 3/4 of max_error, a margin for the peaks of the error between
+    the sampled points.
+    The cost is O(nsv*m^2) for m selected support vectors, and the factorization of nsv*m doubles 
+    is kept within half of max_mb. The original support vectors are kept if no reduced set of 
+    at most half of them reaches max_error.
+
+    :param model: fitted sklearn.svm.SVC
+    :param max_error: maximum absolute error allowed on the decision function
+    :param n_check: number of held-out check points
+    :param max_mb: memory budget in MB, the one of the resource plan if None
+    :param seed: random seed
+    :return: RBFExpansion with the reduced set of support vectors
+    """
+    from scipy.linalg import solve_triangular
+    full = RBFExpansion.from_svc(model)
+    sv,coef,gamma = full.support_vectors_,full.dual_coef_,full.gamma
+    n = len(sv)
+    max_mb = get_plan().memory_mb if max_mb is None else max_mb
+    m_max = min(n//2, int(.5*max_mb*(1<<20)//(8*max(n,1))))
+    # decision function without intercept at the support vectors, computed blockwise
+    r = rbf_decision(sv, sv, coef, 0., gamma)
+    err2 = float(np.dot(coef, r))
+    sigma = 1/np.sqrt(2*gamma)
+    rng = np.random.default_rng(seed)
+    lo,hi = sv.min(axis=0)-sigma,sv.max(axis=0)+sigma
+    near = sv[rng.choice(n, size=n_check-n_check//2)]
+    check = np.r_[rng.uniform(lo, hi, size=(n_check//2,sv.shape[1])), near+rng.normal(scale=sigma, size=near.shape)]
+    Z = full.decision_function(check)
+    L = np.zeros((n,m_max))
+    d = np.ones(n)
+    pivots,c = [],[]
+    m,target = 0,16
+    while m < m_max:
+        gain = np.where(d > 1e-10, r**2/np.maximum(d,1e-10), 0.)
+        p = int(np.argmax(gain))
+        if gain[p] <= 0:
+            break
+        l = np.exp(-gamma*np.sum((sv-sv[p])**2,axis=1))
+        l -= np.dot(L[:,:m], L[p,:m])
+        l /= np.sqrt(d[p])
+        cm = r[p]/np.sqrt(d[p])
+        L[:,m] = l
+        d -= l**2
+        d[p] = 0.
+        r -= cm*l
+        err2 -= cm*cm
+        pivots.append(p)
+        c.append(cm)
+        m += 1
+        if m == target or m == m_max:
+            target = int(1.25*target)
+            beta = solve_triangular(L[pivots,:m].T, np.array(c), lower=False)
+            reduced = RBFExpansion(sv[pivots], beta, full.intercept_, gamma)
+            bound = np.sqrt(max(err2,0.))
+            err = max(np.abs(reduced.decision_function(check)-Z).max(),np.abs(r).max())
+            logging.info('reduce_svc - {} of {} support vectors with error bound {:.3g} and max error {:.3g}'.format(m,n,bound,err))
+            if bound <= max_error or err <= .75*max_error:
+                return reduced
+    logging.warning('reduce_svc - not able to reduce the support vectors under error {}'.format(max_error))
+    return full
+
+def sq_distances(X, max_mb=1024, folder=None, block=2048):
+    """
+    Compute the matrix of squared euclidean distances of X blockwise. If it is larger than max_mb, 
+    it is stored as a memory mapped array in folder.
+
+    :param X: points of shape (n,d)
+    :param max_mb: maximum size in MB to keep the matrix in memory
+    :param folder: folder for the memory mapped file, temporary directory if None
+    :param block: number of rows computed at once
+    :return D: squared distances matrix of shape (n,n)
+    """
+    n = len(X)
+    if n*n*8/float(1<<20) > max_mb:
+        path = osp.join(folder or tempfile.mkdtemp(), 'sq_distances.mmap')
+        logging.info('sq_distances - memory mapping {}x{} distance matrix into {}'.format(n,n,path))
+        D = np.memmap(path, dtype=np.float64, mode='w+', shape=(n,n))
+    else:
+        D = np.empty((n,n))
+    X_norm = np.sum(X**2,axis=1)
+    for k in range(0,n,block):
+        x = X[k:k+block]
+        D[k:k+block] = np.maximum(X_norm[k:k+block,None]+X_norm[None,:]-2*np.dot(x,X.T),0.)
+    return D
+
+def rbf_gram(D, gamma, out=None, block=2048):
+    """
+    Compute the RBF Gram matrix exp(-gamma*D) blockwise from the squared distances D.
+
+    :param D: squared distances matrix of shape (n,n), can be memory mapped
+    :param gamma: RBF kernel parameter
+    :param out: optional output array with the same shape than D, can be memory mapped
+    :param block: number of rows computed at once
+    :return K: Gram matrix
+    """
+    K = np.empty(D.shape) if out is None else out
+    for k in range(0,len(D),block):
+        K[k:k+block] = np.exp(-gamma*D[k:k+block])
+    return K
+
+def fit_score_gram(K, y, train, test, C, sample_weight=None, class_weight="balanced"):
+    """
+    Fit a precomputed kernel SVC in a train fold and score it in a test fold. The kernel blocks
+    of the folds are copied from K in the worker, see GramSearchCV.fold_mb.
+
+    :param K: Gram matrix of all the points, can be memory mapped
+    :param y: labels of all the points
+    :param train: indices of the training fold
+    :param test: indices of the test fold
+    :param C: regularization parameter
+    :param sample_weight: optional sample weights of all the points
+    :param class_weight: class weight of the SVC
+    :return: weighted F1 score in the test fold
+    """
+    model = sklearn.svm.SVC(kernel='precomputed', C=C, class_weight=class_weight)
+    sw = None if sample_weight is None else sample_weight[train]
+    model.fit(K[np.ix_(train,train)], y[train], sample_weight=sw)
+    y_pred = model.predict(K[np.ix_(test,train)])
+    return sklearn.metrics.f1_score(y[test], y_pred, average='weighted')
+
+class GramSearchCV(object):
+    """
+    Grid search of C and gamma for a RBF SVC reusing the Gram matrix for all the C values.
+
+    The squared distances are computed once, the Gram matrix once per gamma (memory mapped if 
+    it is too large) and shared with the joblib workers through memory mapping. Each worker fits
+    a precomputed kernel SVC for one fold and one C. The best parameters are refitted with the
+    original RBF estimator, so best_estimator_ can be used as a GridSearchCV one.
+    """
+
+    def __init__(self, estimator, param_grid, cv=3, n_jobs=None, max_mb=1024, verbose=0):
+        """
+        Initialize the grid search.
+
+        :param estimator: RBF sklearn.svm.SVC to refit with the best parameters
+        :param param_grid: dictionary with C and gamma arrays
+        :param cv: number of stratified folds
+        :param n_jobs: number of joblib workers, the workers of the joblib context if None
+        :param max_mb: maximum size in MB of the matrices kept in memory
+        :param verbose: joblib verbosity
+        """
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.max_mb = max_mb
+        self.verbose = verbose
+
+    @staticmethod
+    def fold_mb(n_points, cv=3):
+        """
+        Memory in MB of the kernel block of a training fold copied by each fit of the search.
+
+        :param n_points: number of points
+        :param cv: number of folds
+        """
+        n_train = n_points*(cv-1)/float(cv)
+        return n_train*n_train*8/float(1<<20)
+
+    def fit(self, X, y, sample_weight=None):
+        C_grid = np.ravel(self.param_grid.get('C',[self.estimator.C]))
+        g_grid = np.ravel(self.param_grid.get('gamma',[self.estimator.gamma]))
+        folds = list(sklearn.model_selection.StratifiedKFold(n_splits=self.cv).split(X, y))
+        folder = tempfile.mkdtemp()
+        params,scores = [],[]
+        try:
+            D = sq_distances(X, self.max_mb, folder)
+            for gamma in g_grid:
+                logging.info('GramSearchCV.fit - computing Gram matrix for gamma={}'.format(gamma))
+                out = np.memmap(osp.join(folder,'gram.mmap'), dtype=np.float64, mode='w+', shape=D.shape) if isinstance(D,np.memmap) else None
+                K = rbf_gram(D, gamma, out=out)
+                if isinstance(K,np.memmap):
+                    K.flush()
+                cw = self.estimator.class_weight
+                # a new parallel context for each Gram matrix, the memmaps of the arrays sent to the 
+                # workers are reused inside a context even if the arrays change
+                with joblib.Parallel(n_jobs=self.n_jobs, verbose=self.verbose, temp_folder=folder) as parallel:
+                    res = parallel(joblib.delayed(fit_score_gram)(K, y, train, test, C, sample_weight, cw) 
+                                    for C in C_grid for train,test in folds)
+                del K,out
+                for k,C in enumerate(C_grid):
+                    params.append({'C': C, 'gamma': gamma})
+                    scores.append(res[k*self.cv:(k+1)*self.cv])
+                    logging.info('GramSearchCV.fit - C={} gamma={} score={:.4f}'.format(C,gamma,np.mean(scores[-1])))
+            del D
+        finally:
+            joblib.disk.delete_folder(folder)
+        scores = np.array(scores)
+        self.cv_results_ = {'params': params, 'mean_test_score': scores.mean(axis=1), 'std_test_score': scores.std(axis=1)}
+        self.best_index_ = int(np.argmax(self.cv_results_['mean_test_score']))
+        self.best_params_ = params[self.best_index_]
+        self.best_score_ = self.cv_results_['mean_test_score'][self.best_index_]
+        self.best_estimator_ = sklearn.base.clone(self.estimator).set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y, sample_weight=sample_weight)
+        return self
+
+def stratified_subsample(X, y, n, bins=4, seed=0):
+    """
+    Random subsample of size n stratified by class and space-time tiles. Each dimension is split
+    into bins quantile intervals, and each (tile,class) stratum keeps its proportion of points.
+
+    :param X: points of shape (N,d)
+    :param y: labels of shape (N,)
+    :param n: size of the subsample
+    :param bins: number of quantile intervals in each dimension
+    :param seed: random seed
+    :return idx: sorted indices of the subsample
+    """
+    N = len(y)
+    if n >= N:
+        return np.arange(N)
+    qs = np.linspace(0, 1, bins+1)[1:-1]
+    cells = np.c_[tuple(np.searchsorted(np.quantile(X[:,k],qs), X[:,k]) for k in range(X.shape[1]))]
+    _,strata = np.unique(np.c_[cells, np.unique(y, return_inverse=True)[1]], axis=0, return_inverse=True)
+    strata = np.ravel(strata)
+    counts = np.bincount(strata)
+    quota = np.maximum(np.round(counts*n/float(N)), 1).astype(int)
+    perm = np.random.default_rng(seed).permutation(N)
+    perm = perm[np.argsort(strata[perm], kind='stable')]
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    rank = np.arange(N)-np.repeat(starts, counts)
+    return np.sort(perm[rank < quota[strata[perm]]])
+
+def fit_score(estimator, params, X, y, train, test, sample_weight=None):
+    """
+    Fit a clone of the estimator with params in a train fold and score it in a test fold.
+
+    :param estimator: sklearn estimator
+    :param params: dictionary of parameters to set
+    :param X: all the points
+    :param y: labels of all the points
+    :param train: indices of the training fold
+    :param test: indices of the test fold
+    :param sample_weight: optional sample weights of all the points
+    :return: weighted F1 score in the test fold
+    """
+    model = sklearn.base.clone(estimator).set_params(**params)
+    sw = None if sample_weight is None else sample_weight[train]
+    model.fit(X[train], y[train], sample_weight=sw)
+    return sklearn.metrics.f1_score(y[test], model.predict(X[test]), average='weighted')
+
+class HalvingSearchCV(object):
+    """
+    Successive halving search of hyperparameters on space-time stratified subsamples.
+
+    All the candidates are scored with cross-validation on a small stratified subsample, and only
+    the best 1/factor of them are promoted to a subsample factor times larger, until one candidate
+    remains, which is not scored again, or the whole data is used. The best parameters are 
+    refitted with all the data, so best_estimator_ can be used as a GridSearchCV one.
+    """
+
+    def __init__(self, estimator, param_grid, cv=3, factor=3, min_resources=1000, n_jobs=None, verbose=0):
+        """
+        Initialize the successive halving search.
+
+        :param estimator: sklearn estimator to refit with the best parameters
+        :param param_grid: dictionary with the arrays of parameters to search
+        :param cv: number of stratified folds
+        :param factor: proportion of candidates eliminated and resources increase at each round
+        :param min_resources: minimum number of points of the first round
+        :param n_jobs: number of joblib workers, the workers of the joblib context if None
+        :param verbose: joblib verbosity
+        """
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.factor = factor
+        self.min_resources = min_resources
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+
+    def fit(self, X, y, sample_weight=None):
+        candidates = list(sklearn.model_selection.ParameterGrid(self.param_grid))
+        n_rounds = int(np.ceil(np.log(len(candidates))/np.log(self.factor))) if len(candidates) > 1 else 0
+        n = max(self.min_resources, len(y)//self.factor**n_rounds)
+        self.cv_results_ = {'params': [], 'mean_test_score': [], 'n_resources': [], 'iter': []}
+        it = 0
+        with joblib.Parallel(n_jobs=self.n_jobs, verbose=self.verbose) as parallel:
+            while True:
+                idx = stratified_subsample(X, y, n, seed=it)
+                Xs, ys = X[idx], y[idx]
+                sws = None if sample_weight is None else sample_weight[idx]
+                logging.info('HalvingSearchCV.fit - iteration {} with {} candidates and {} points'.format(it,len(candidates),len(idx)))
+                folds = list(sklearn.model_selection.StratifiedKFold(n_splits=self.cv).split(Xs, ys))
+                res = parallel(joblib.delayed(fit_score)(self.estimator, p, Xs, ys, train, test, sws) 
+                                for p in candidates for train,test in folds)
+                scores = np.reshape(res, (len(candidates),self.cv)).mean(axis=1)
+                for p,sc in zip(candidates,scores):
+                    logging.info('HalvingSearchCV.fit - {} score={:.4f}'.format(p,sc))
+                self.cv_results_['params'] += candidates
+                self.cv_results_['mean_test_score'] += list(scores)
+                self.cv_results_['n_resources'] += [len(idx)]*len(candidates)
+                self.cv_results_['iter'] += [it]*len(candidates)
+                # the best candidates go first, so a single candidate left is the winner
+                order = np.argsort(-scores, kind='stable')
+                keep = max(1, int(np.ceil(len(candidates)/float(self.factor))))
+                candidates = [candidates[k] for k in order[:keep]]
+                self.best_score_ = scores[order[0]]
+                if len(candidates) == 1 or len(idx) == len(y):
+                    break
+                n *= self.factor
+                it += 1
+        self.best_params_ = candidates[0]
+        self.best_estimator_ = sklearn.base.clone(self.estimator).set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y, sample_weight=sample_weight)
+        return self
 
 class SVM(object):
-    def __init__(self, param_grid = {}):
+    def __init__(self, param_grid = {}, max_error = None):
         C_grid = np.array([.5,1.,2.])
         g_grid = np.array([.5,1.,2.])
         self.param_grid = param_grid if len(param_grid) else {'C': C_grid, 'gamma': g_grid} 
-        self.total_cache = int(psutil.virtual_memory().total)/float(1<<20) # in MB
-        self.nproc = psutil.cpu_count()
-        self.model = sklearn.svm.SVC(class_weight="balanced", cache_size=(self.total_cache//(2*self.nproc)))
+        self.unit_grid = self.param_grid # gamma grid relative to the approximated gamma
+        self.model = sklearn.svm.SVC(class_weight="balanced")
+        self.max_error = max_error # maximum decision function error for support vector reduction, None to not reduce
+        self.reduced = None
+        self.plan = None # resource plan of the fits, the one of the process if None
         logging.info('SVM - {}'.format(self.model))
 
+    def resources(self):
+        # models saved before the plan attribute existed use the plan of the process
+        return getattr(self, 'plan', None) or get_plan()
+
+    @timed('preprocess')
     def preprocess(self, X, y):
         logging.info('SVM.preprocess - {}'.format(Counter(y)))
         logging.info('SVM.preprocess - performing MinMaxScaler')
         X = np.ascontiguousarray(X)
         Xs = sklearn.preprocessing.MinMaxScaler().fit(X).transform(X)
         logging.info('SVM.preprocess - performing OneSidedSelection')
-        oss = imblearn.under_sampling.OneSidedSelection(sampling_strategy='majority', n_neighbors=1, n_seeds_S=10000, n_jobs=-2)
-        X_oss, y_oss = oss.fit_resample(Xs, y)
+        oss = imblearn.under_sampling.OneSidedSelection(sampling_strategy='majority', n_neighbors=1, n_seeds_S=10000)
+        with get_executor().parallel():
+            X_oss, y_oss = oss.fit_resample(Xs, y)
         counter = Counter(y_oss)
         logging.info('SVM.preprocess - {}'.format(counter))
         prop = min(counter.values())/max(counter.values())
@@ -63,16 +372,24 @@ class SVM(object):
             self.sample_indices = oss.sample_indices_
         X = X[self.sample_indices,:]
         y = y[self.sample_indices]
+        # keep the training data for incremental updates
+        self.X_train, self.y_train = X, y
+        self.support_history_ = None
         self.scaler = sklearn.preprocessing.MinMaxScaler().fit(X)
         return self.scaler.transform(X),y
 
     def hyper_opt(self, X):
+        self.scaling(X)
+        # new grid, so neither the grid of the caller nor the grid of a previous fit are scaled again
+        self.param_grid = dict(self.unit_grid, gamma=np.asarray(self.unit_grid['gamma'])*self.gamma)
+
+    def scaling(self, X):
+        self.scaling_bounds = np.array([X.min(axis=0), X.max(axis=0)]) # extended by the updates
         influ_km = 2 # influence in kilometers
         self.domain_size = (X[:,0].max()-X[:,0].min())*111 # domain size x in kilometers
         sigma = influ_km/self.domain_size # sigma scaled to [0,1]
         self.gamma = 1/(2*sigma**2) # gamma scaled to [0,1]
         logging.info('SVM.hyper_opt - gamma={}'.format(self.gamma))
-        self.param_grid['gamma'] *= self.gamma 
         size_y = (X[:,1].max()-X[:,1].min())*111 # domain size y in kilometers
         freq_ros = 2 # frequent ROS in km/h
         influ_days = influ_km/freq_ros/24 # influence in days
@@ -82,6 +399,7 @@ class SVM(object):
 				sigma/(influ_days/total_days)]) # scale days
         logging.info('SVM.hyper_opt - scale_dims={}'.format(self.scale_dims))
 
+    @timed('fit')
     def fit(self, X, y, sample_weight=None):
         # hyper-parameter approximation
         self.hyper_opt(X)
@@ -92,10 +410,24 @@ class SVM(object):
         self.model.gamma = self.gamma
         if sample_weight is not None:
             sample_weight = sample_weight[self.sample_indices]
+        self.sw_train = sample_weight
+        # libsvm kernel cache within the memory budget
+        self.model.cache_size = self.resources().cache_mb(len(y))
         logging.info('SVM.fit - fitting the model with C={} and gamma={}'.format(self.model.C,self.model.gamma))
         self.model.fit(X, y, sample_weight=sample_weight)
+        self.compress()
 
-    def grid_cv(self, X, y, sample_weight=None):
+    @timed('grid_cv')
+    def grid_cv(self, X, y, sample_weight=None, search='grid'):
+        """
+        Tune C and gamma hyperparameters and fit the best model.
+
+        :param X: training points (lon,lat,time)
+        :param y: training labels
+        :param sample_weight: optional sample weights
+        :param search: 'grid' for sklearn GridSearchCV, 'gram' for GramSearchCV reusing the Gram matrices,
+                       or 'halving' for HalvingSearchCV on stratified subsamples
+        """
         # hyper-parameter approximation
         self.hyper_opt(X)
         # compute min-max lon-lat to estimate size of domain and proportion in time
@@ -104,49 +436,246 @@ class SVM(object):
         X *= self.scale_dims
         if sample_weight is not None:
             sample_weight = sample_weight[self.sample_indices]
-        logging.info('SVM.grid_cv - tunning hyperparameters')
-        logging.info('SVM.grid_cv - parameter grid: {}'.format(self.param_grid))
+        self.sw_train = sample_weight
+        self.tune(X, y, sample_weight, search)
+        self.compress()
+
+    def tune(self, X, y, sample_weight=None, search='grid'):
+        """
+        Search C and gamma in the parameter grid and keep the best model refitted with all the points.
+
+        :param X: scaled training points
+        :param y: training labels
+        :param sample_weight: optional sample weights
+        :param search: search mode of grid_cv
+        """
+        logging.info('SVM.tune - tunning hyperparameters')
+        logging.info('SVM.tune - parameter grid: {}'.format(self.param_grid))
         scorer = sklearn.metrics.make_scorer(sklearn.metrics.f1_score,average='weighted')
-        self.grid_cv = sklearn.model_selection.GridSearchCV(estimator=self.model, param_grid=self.param_grid, 
-							    scoring=scorer, cv=3, verbose=4, n_jobs=-2)
-        self.grid_cv.fit(X, y, sample_weight=sample_weight)
-        logging.info('SVM.grid_cv - best parameters: {}'.format(self.grid_cv.best_params_))
-        self.model = self.grid_cv.best_estimator_
+        # concurrent fits and libsvm kernel cache of each one within the memory budget
+        plan = self.resources()
+        # each fit of the Gram search copies the kernel block of its training fold
+        task_mb = GramSearchCV.fold_mb(len(y), 3) if search == 'gram' else 0
+        n_jobs,self.model.cache_size = plan.search(len(y), 3*len(sklearn.model_selection.ParameterGrid(self.param_grid)), task_mb)
+        if search == 'gram':
+            self.search_cv = GramSearchCV(estimator=self.model, param_grid=self.param_grid, cv=3, n_jobs=n_jobs, max_mb=plan.gram_mb())
+        elif search == 'halving':
+            self.search_cv = HalvingSearchCV(estimator=self.model, param_grid=self.param_grid, cv=3, n_jobs=n_jobs)
+        else:
+            self.search_cv = sklearn.model_selection.GridSearchCV(estimator=self.model, param_grid=self.param_grid, 
+						    scoring=scorer, cv=3, n_jobs=n_jobs, verbose=4)
+        with get_executor().parallel():
+            self.search_cv.fit(X, y, sample_weight=sample_weight)
+        logging.info('SVM.tune - best parameters: {}'.format(self.search_cv.best_params_))
+        self.model = self.search_cv.best_estimator_
+
+    def update(self, X, y, sample_weight=None, radius=3.):
+        """
+        Update the fitted model with new points, refitting only a working set made of the previous
+        support vectors, the new points and the training history close to the new points. 
+        The scaling is extended if the new points fall outside of the previous domain.
+
+        :param X: new points (lon,lat,time)
+        :param y: new labels
+        :param sample_weight: optional sample weights of the new points
+        :param radius: radius of the history around the new points in kernel widths
+        """
+        logging.info('SVM.update - updating the model with {} new points'.format(len(y)))
+        gamma_factor = self.model._gamma/self.gamma
+        nold = len(self.y_train)
+        work_support = self.model.support_ if self.support_history_ is None else self.support_history_
+        Xs,y_all,sw_all = self.extend(X, y, sample_weight)
+        # working set: previous support vectors, new points and close history
+        sigma = 1/np.sqrt(2*self.gamma*gamma_factor)
+        dist,_ = cKDTree(Xs[nold:]).query(Xs[:nold], distance_upper_bound=radius*sigma)
+        work = np.zeros(len(y_all), dtype=bool)
+        work[work_support] = True
+        work[:nold][np.isfinite(dist)] = True
+        work[nold:] = True
+        logging.info('SVM.update - refitting working set of {} points from {} points'.format(work.sum(),len(y_all)))
+        self.model.gamma = self.gamma*gamma_factor
+        self.model.fit(Xs[work], y_all[work], sample_weight=None if sw_all is None else sw_all[work])
+        # support vectors referred to the whole training data, support_ stays referred to the working set
+        self.support_history_ = np.where(work)[0][self.model.support_]
+        self.compress()
+        self.affected_region(X, radius*sigma)
+
+    def extend(self, X, y, sample_weight=None):
+        """
+        Append new points to the training history and extend the scaling to the new domain. The
+        scaling does not change if the new points are inside the previous domain.
+
+        :param X: new points (lon,lat,time)
+        :param y: new labels
+        :param sample_weight: optional sample weights of the new points
+        :return Xs,y_all,sw_all: scaled points, labels and sample weights of the whole training data
+        """
+        if getattr(self, 'X_train', None) is None:
+            raise ValueError('SVM.extend - no training history, it is not saved with the model')
+        X_all = np.r_[self.X_train, X]
+        y_all = np.r_[self.y_train, y]
+        if self.sw_train is None and sample_weight is None:
+            sw_all = None
+        else:
+            sw_old = np.ones(len(self.y_train)) if self.sw_train is None else self.sw_train
+            sw_new = np.ones(len(y)) if sample_weight is None else sample_weight
+            sw_all = np.r_[sw_old, sw_new]
+        bounds = np.array([np.minimum(self.scaler.data_min_, X.min(axis=0)), np.maximum(self.scaler.data_max_, X.max(axis=0))])
+        # models saved before the scaling bounds were kept extend the bounds of the training history
+        self.scaling(np.r_[getattr(self, 'scaling_bounds', bounds), X])
+        self.scaler = sklearn.preprocessing.MinMaxScaler().fit(bounds)
+        self.X_train, self.y_train, self.sw_train = X_all, y_all, sw_all
+        return self.scaler.transform(X_all)*self.scale_dims, y_all, sw_all
+
+    def affected_region(self, X, dist):
+        """
+        Set the lon-lat bounds of the region affected by an update with new points X.
+
+        :param X: new points (lon,lat,time)
+        :param dist: distance of influence of the new points in the scaled space
+        """
+        margin = dist/self.scale_dims[:2]/self.scaler.scale_[:2]
+        self.update_bounds = (X[:,0].min()-margin[0], X[:,0].max()+margin[0],
+                                X[:,1].min()-margin[1], X[:,1].max()+margin[1])
+        logging.info('SVM.update - affected region {}'.format(self.update_bounds))
+
+    def update_tign_points(self, lon, lat, tign, nz=40):
+        """
+        Re-estimate tign_g only at the points inside the region affected by the last update.
+
+        :param lon: longitudes of the target points, any shape
+        :param lat: latitudes of the target points, same shape than lon
+        :param tign: previous fire arrival time at the target points
+        :param nz: number of time levels of each column
+        :return tign: updated fire arrival time with the same shape than lon
+        """
+        lon = np.asarray(lon)
+        lat = np.asarray(lat)
+        tign = np.array(tign, dtype=float)
+        b = self.update_bounds
+        mask = np.logical_and(np.logical_and(lon >= b[0], lon <= b[1]), np.logical_and(lat >= b[2], lat <= b[3]))
+        logging.info('SVM.update_tign_points - re-estimating {} of {} points'.format(mask.sum(),mask.size))
+        if mask.any():
+            tign[mask] = self.estimate_tign_points(lon[mask], lat[mask], nz)
+        return tign
+
+    def compress(self):
+        """
+        Reduce the number of support vectors of the fitted model within the maximum error 
+        self.max_error on the decision function. The reduced model is used by decision_function.
+        """
+        if self.max_error is None:
+            self.reduced = None
+            return
+        nsv = len(self.model.support_vectors_)
+        logging.info('SVM.compress - reducing {} support vectors with max_error={}'.format(nsv,self.max_error))
+        self.reduced = reduce_svc(self.model, self.max_error, max_mb=self.resources().memory_mb)
+        logging.info('SVM.compress - {} support vectors reduced to {}'.format(nsv,len(self.reduced)))
+
+    def expansion(self, reduced=True):
+        """
+        Kernel expansion of the fitted model.
 
-    def decision_function(self, G, mthreads=True):
+        :param reduced: use the reduced support vectors if available
+        :return: RBFExpansion object
+        """
+        return self.reduced if reduced and self.reduced is not None else RBFExpansion.from_svc(self.model)
+
+    @timed('decision_function')
+    def decision_function(self, G, mthreads=True, blas=True, dtype=np.float64):
+        """
+        Evaluate the decision function of the model.
+
+        :param G: scaled points to evaluate
+        :param mthreads: split the libsvm evaluation between the workers of the executor
+        :param blas: evaluate with the blocked BLAS evaluator (multi-threaded by the BLAS backend)
+        :param dtype: floating point type of the BLAS evaluator, np.float64 or np.float32, which
+                      is within 1e-5 times the sum of the absolute dual coefficients of libsvm
+        :return Z: decision function at each point of G
+        """
         logging.info('SVM.decision_function - evaluating the decision function for {} points'.format(len(G)))
+        if blas:
+            model = self.expansion()
+            logging.info('SVM.decision_function - using blocked BLAS evaluator with {} support vectors'.format(len(model)))
+            return rbf_decision(G, model.support_vectors_, model.dual_coef_, model.intercept_, model.gamma, dtype)
+        model = self.model
         if mthreads:
-            self.nsplits = [c for c in range(1,self.nproc+1) if len(G) % c == 0][-1]
-            if len(G)/self.nsplits > 10.:
+            executor = get_executor()
+            self.nsplits = min(executor.workers, max(1, len(G)//10))
+            if self.nsplits > 1:
                 logging.info('SVM.decision_function - using parallel strategy with {} splits'.format(self.nsplits))
-                iterator = list(np.split(G,self.nsplits))
-                with Pool(self.nsplits) as pool:
-                    Z = pool.map(self.model.decision_function, iterator)
+                Z = executor.map(model.decision_function, np.array_split(G,self.nsplits))
                 Z = np.concatenate(tuple(Z))
             else:
                 logging.info('SVM.decision_function - using no parallelization')
-                Z = self.model.decision_function(G)
+                Z = model.decision_function(G)
         else:
             logging.info('SVM.decision_function - using no parallelization')
-            Z = self.model.decision_function(G)
+            Z = model.decision_function(G)
         return Z
 
-    def estimate_tign_g(self, n=(400,400,40)):
+    def estimate_tign_g(self, n=(400,400,40), tile=None):
+        """
+        Estimate tign_g in a regular grid of the domain.
+
+        :param n: grid size (nx,ny,nz)
+        :param tile: optional tile size (tx,ty) to stream the grid evaluation with bounded memory,
+                     the tiles of the resource plan if None
+        :return Fx,Fy,Fz: longitude, latitude and fire arrival time arrays
+        """
         logging.info('SVM.estimate_tign_g - estimating tign_g')
-        gx,gy,gz = make_meshgrid(n)
-        G = np.c_[np.ravel(gx), np.ravel(gy), np.ravel(gz)]
-        G *= self.scale_dims
-        Z = self.decision_function(G)
-        Zg = np.reshape(Z,gx.shape)
-        Fx = gx[:,:,0]
-        Fy = gy[:,:,0]
-        zr = gz[0,0]
-        Fz = find_roots(Fx,Fy,zr,Zg)
-        Fz[np.isnan(Fz)] = max(np.nanmax(Fz),self.scale_dims[-1])
-        F = np.c_[np.ravel(Fx), np.ravel(Fy), np.ravel(Fz)]
-        F /= self.scale_dims
-        F = self.scaler.inverse_transform(F)
-        return np.reshape(F[:,0],Fx.shape), np.reshape(F[:,1],Fx.shape), np.reshape(F[:,2],Fx.shape)
+        tile = tile or get_plan().grid_tile(n)
+        return estimate_tign(self.decision_function, self.scale_dims, self.scaler.inverse_transform, n, tile)
+
+    def estimate_tign_points(self, lon, lat, nz=40):
+        """
+        Estimate tign_g at arbitrary (lon,lat) points, for instance a WRF fire mesh.
+
+        :param lon: longitudes of the target points, any shape
+        :param lat: latitudes of the target points, same shape than lon
+        :param nz: number of time levels of each column
+        :return tign: fire arrival time with the same shape than lon
+        """
+        logging.info('SVM.estimate_tign_points - estimating tign_g at {} points'.format(np.size(lon)))
+        return estimate_tign_points(self.decision_function, self.scale_dims, self.scaler.transform, 
+                                    self.scaler.inverse_transform, lon, lat, nz)
+
+    def estimate_tign_wrf(self, path, nz=40):
+        """
+        Estimate tign_g on the fire mesh FXLONG/FXLAT of a wrfinput or wrfout file.
+
+        :param path: path to the WRF file
+        :param nz: number of time levels of each column
+        :return fxlon,fxlat,tign: fire mesh and fire arrival time on it
+        """
+        from wrf.wrf_file import WRFFile
+        with WRFFile(path) as wrf:
+            fxlon,fxlat = wrf.fire_grid()
+        return fxlon, fxlat, self.estimate_tign_points(fxlon, fxlat, nz)
+
+    def export_model(self, path, reduced=True):
+        """
+        Export the fitted model into a compact npz file that can be loaded with SVMModel.load
+        without sklearn.
+
+        :param path: path of the npz file
+        :param reduced: use the reduced support vectors if available
+        """
+        logging.info('SVM.export_model - exporting the model into {}'.format(path))
+        SVMModel(self.expansion(reduced), self.scale_dims, self.scaler.min_, self.scaler.scale_).save(path)
+
+    def __getstate__(self):
+        # the training history for incremental updates is not saved with the model
+        state = self.__dict__.copy()
+        for k in ('X_train','y_train','sw_train','support_history_','plan'):
+            state[k] = None
+        return state
+
+    def __setstate__(self, state):
+        # models saved when the search was kept in grid_cv, hiding the method
+        if 'grid_cv' in state:
+            state['search_cv'] = state.pop('grid_cv')
+        self.__dict__.update(state)
 
     def save_model(self, path):
         logging.info('SVM.save_model - saving the model into {}'.format(path))
@@ -160,3 +689,42 @@ class SVM(object):
                return pickle.load(f)
         else:
             return None
+
+def benchmark_decision(svm, npts=(10000,100000,1000000), dtypes=(np.float64,np.float32), seed=0):
+    """
+    Compare the time and the maximum absolute error of the blocked BLAS evaluator of the full
+    support vectors against the reference evaluation of a fitted SVM (libsvm, or the members
+    of a BaggedSVM).
+
+    :param svm: fitted SVM object
+    :param npts: numbers of random points of the domain to evaluate
+    :param dtypes: floating point types of the BLAS evaluator
+    :param seed: random seed
+    :return: list of dictionaries with the results
+    """
+    import time
+    full = svm.expansion(reduced=False)
+    rng = np.random.default_rng(seed)
+    results = []
+    for n in npts:
+        G = rng.uniform(size=(n,len(svm.scale_dims)))*svm.scale_dims
+        t = time.time()
+        Z = svm.decision_function(G, mthreads=False, blas=False)
+        t_libsvm = time.time()-t
+        for dtype in dtypes:
+            t = time.time()
+            Zb = rbf_decision(G, full.support_vectors_, full.dual_coef_, full.intercept_, full.gamma, dtype)
+            t_blas = time.time()-t
+            res = {'npts': n, 'nsv': len(full), 'dtype': np.dtype(dtype).name, 'libsvm': t_libsvm, 
+                    'blas': t_blas, 'speedup': t_libsvm/t_blas, 'max_error': np.abs(Zb-Z).max()}
+            logging.info('benchmark_decision - {}'.format(res))
+            results.append(res)
+    return results
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) < 2:
+        print('usage: python ml/svm.py svm_model.pkl')
+        sys.exit(1)
+    benchmark_decision(SVM.load_model(sys.argv[1]))
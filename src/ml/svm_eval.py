@@ -0,0 +1,302 @@
+import numpy as np
+import logging
+import zipfile
+from scipy import interpolate
+from utils.metrics import timed
+
+def make_meshgrid(n):
+    logging.info('making meshgrid with size={}'.format(n))
+    nx, ny, nz = n
+    gx, gy, gz = np.meshgrid(np.linspace(0., 1., ny),
+                         np.linspace(0., 1., nx),
+                         np.linspace(0., 1., nz))
+    return gx, gy, gz
+
+def find_roots(Fx,Fy,zr,Z):
+    logging.info('finding roots of the decision function')
+    return first_roots(zr, np.reshape(Z,(-1,len(zr)))).reshape(Fx.shape)
+
+@timed('find_roots')
+def first_roots(zr,Z):
+    """
+    First root of the cubic spline interpolation of each row of Z inside the interval of zr.
+
+    :param zr: increasing coordinates of shape (nz,)
+    :param Z: values of shape (m,nz)
+    :return Fz: first root of each row or nan if there is no root
+    """
+    Fz = np.zeros(len(Z))
+    for k in range(len(Z)):
+        pz = interpolate.CubicSpline(zr, Z[k])
+        rr = pz.roots()
+        realr = rr.real[np.logical_and(abs(rr.imag) < 1e-5, np.logical_and(rr.real > zr.min(), rr.real < zr.max()))]
+        if len(realr) > 0:
+            Fz[k] = realr.min()
+        else:
+            Fz[k] = np.nan
+    return Fz
+
+def fill_roots(Fz):
+    """
+    Fill the columns without root, not burned in the time interval, with the latest root or the 
+    end of the interval. The roots are in the [0,1] scaled time, like the other coordinates given
+    to the inverse transform of the scaler.
+
+    :param Fz: first roots in [0,1] scaled time, nan where there is no root
+    :return Fz: filled first roots
+    """
+    nan = np.isnan(Fz)
+    Fz[nan] = 1. if nan.all() else max(np.nanmax(Fz),1.)
+    return Fz
+
+def rbf_decision(G, sv, coef, intercept, gamma, dtype=np.float64, block_mb=8):
+    """
+    Evaluate a RBF kernel expansion sum_i coef_i*exp(-gamma*|G-sv_i|^2)+intercept
+
+    The squared distances of a block of points to all the support vectors are computed with one
+    matrix product (BLAS GEMM, multi-threaded by the BLAS backend) plus the norms, and the blocks 
+    are sized so that the kernel block of block_mb MB stays in cache. The points are centered at 
+    the mean support vector before to limit the cancellation of the norm expansion, so float32 
+    results match float64 within 1e-5 times sum(|coef|).
+
+    :param G: points to evaluate of shape (n,d)
+    :param sv: support vectors of shape (m,d)
+    :param coef: dual coefficients of shape (m,)
+    :param intercept: intercept of the decision function
+    :param gamma: RBF kernel parameter
+    :param dtype: floating point type of the computation, np.float64 or np.float32
+    :param block_mb: size in MB of the kernel block computed at once
+    :return Z: decision function at each point of G
+    """
+    dtype = np.dtype(dtype)
+    center = np.mean(sv,axis=0)
+    svc = np.asarray(sv-center,dtype=dtype)
+    coef = np.asarray(coef,dtype=dtype)
+    sv_norm = np.sum(svc**2,axis=1)
+    block = max(1, int(block_mb*(1<<20)/(dtype.itemsize*max(len(svc),1))))
+    Z = np.empty(len(G))
+    for k in range(0,len(G),block):
+        g = np.asarray(G[k:k+block]-center,dtype=dtype)
+        D = np.dot(g,svc.T)
+        D *= -2
+        D += sv_norm[None,:]
+        D += np.sum(g**2,axis=1)[:,None]
+        np.maximum(D,0.,out=D)
+        D *= -gamma
+        np.exp(D,out=D)
+        Z[k:k+block] = np.dot(D,coef)
+    Z += intercept
+    return Z
+
+class RBFExpansion(object):
+    """
+    Lightweight RBF kernel expansion with the same decision function interface than a fitted SVC.
+    """
+
+    def __init__(self, support_vectors, dual_coef, intercept, gamma, dtype=np.float64):
+        """
+        Initialize the kernel expansion.
+
+        :param support_vectors: support vectors of shape (m,d)
+        :param dual_coef: dual coefficients of shape (m,)
+        :param intercept: intercept of the decision function
+        :param gamma: RBF kernel parameter
+        :param dtype: floating point type of the evaluation, np.float64 or np.float32
+        """
+        self.support_vectors_ = np.ascontiguousarray(support_vectors, dtype=float)
+        self.dual_coef_ = np.ravel(np.asarray(dual_coef, dtype=float))
+        self.intercept_ = float(np.ravel(intercept)[0])
+        self.gamma = float(gamma)
+        self.dtype = dtype
+
+    @classmethod
+    def from_svc(cls, model):
+        """
+        Create the kernel expansion from a fitted binary RBF SVC.
+
+        :param model: fitted sklearn.svm.SVC
+        """
+        return cls(model.support_vectors_, model.dual_coef_[0], model.intercept_[0], model._gamma)
+
+    def decision_function(self, G):
+        return rbf_decision(G, self.support_vectors_, self.dual_coef_, self.intercept_, self.gamma, self.dtype)
+
+    def __len__(self):
+        return len(self.dual_coef_)
+
+def grid_tile(n, points=1<<20):
+    """
+    Square (x,y) tile of the grid with at most some points, so the peak memory of the grid
+    evaluation does not grow with the grid resolution.
+
+    :param n: grid size (nx,ny,nz)
+    :param points: maximum number of points of a tile
+    :return: tile size (tx,ty)
+    """
+    nx,ny,nz = n
+    t = max(1, int((points//nz)**.5))
+    return (min(t,nx), min(t,ny))
+
+def estimate_tign(decision_function, scale_dims, inverse_transform, n=(400,400,40), tile=None):
+    """
+    Estimate the fire arrival time as the first root in time of the decision function in a 
+    regular grid of the scaled domain, evaluated by (x,y) tiles with bounded memory.
+
+    :param decision_function: function evaluating the decision function at scaled points
+    :param scale_dims: scale of each dimension of the points
+    :param inverse_transform: function from [0,1] scaled points to (lon,lat,time)
+    :param n: grid size (nx,ny,nz)
+    :param tile: optional tile size (tx,ty), the one of grid_tile if None
+    :return Fx,Fy,Fz: longitude, latitude and fire arrival time arrays
+    """
+    Fx,Fy,Fz = stream_roots(decision_function, scale_dims, n, tile or grid_tile(n))
+    Fz = fill_roots(Fz)
+    F = inverse_transform(np.c_[np.ravel(Fx), np.ravel(Fy), np.ravel(Fz)])
+    return np.reshape(F[:,0],Fx.shape), np.reshape(F[:,1],Fx.shape), np.reshape(F[:,2],Fx.shape)
+
+def stream_roots(decision_function, scale_dims, n, tile=(50,50)):
+    """
+    First root in time of the decision function in the regular grid of make_meshgrid, generating
+    and evaluating the grid points by (x,y) tiles. Peak memory depends only on the tile size.
+
+    :param decision_function: function evaluating the decision function at scaled points
+    :param scale_dims: scale of each dimension of the points
+    :param n: grid size (nx,ny,nz)
+    :param tile: tile size (tx,ty)
+    :return Fx,Fy,Fz: grid coordinates and first roots, nan where there is no root
+    """
+    nx, ny, nz = n
+    tx, ty = tile
+    logging.info('stream_roots - evaluating grid of size={} in tiles of size={}'.format(n,tile))
+    xr = np.linspace(0., 1., ny)
+    yr = np.linspace(0., 1., nx)
+    zr = np.linspace(0., 1., nz)
+    Fx, Fy = np.meshgrid(xr, yr)
+    Fz = np.empty((nx,ny))
+    for i in range(0,nx,tx):
+        for j in range(0,ny,ty):
+            gy,gx,gz = np.meshgrid(yr[i:i+tx], xr[j:j+ty], zr, indexing='ij')
+            G = np.c_[np.ravel(gx), np.ravel(gy), np.ravel(gz)]
+            G *= scale_dims
+            Z = np.reshape(decision_function(G), (-1,nz))
+            Fz[i:i+tx,j:j+ty] = np.reshape(first_roots(zr, Z), gx.shape[:2])
+    return Fx, Fy, Fz
+
+def estimate_tign_points(decision_function, scale_dims, transform, inverse_transform, lon, lat, nz=40, block=None):
+    """
+    Estimate the fire arrival time at arbitrary (lon,lat) points, evaluating the decision function
+    and finding its first root in time only along the columns of these points. The columns are 
+    evaluated by blocks of points, and the result is the same than estimate_tign at the grid points.
+
+    :param decision_function: function evaluating the decision function at scaled points
+    :param scale_dims: scale of each dimension of the points
+    :param transform: function from (lon,lat,time) to [0,1] scaled points
+    :param inverse_transform: function from [0,1] scaled points to (lon,lat,time)
+    :param lon: longitudes of the target points, any shape
+    :param lat: latitudes of the target points, same shape than lon
+    :param nz: number of time levels of each column
+    :param block: number of points evaluated at once, from the resource plan if None
+    :return tign: fire arrival time with the same shape than lon
+    """
+    if block is None:
+        from utils.resources import get_plan
+        block = max(1, get_plan().grid_points()//nz)
+    shape = np.shape(lon)
+    P = transform(np.c_[np.ravel(lon), np.ravel(lat), np.zeros(np.size(lon))])
+    zr = np.linspace(0., 1., nz)
+    Fz = np.empty(len(P))
+    for k in range(0,len(P),block):
+        G = np.c_[np.repeat(P[k:k+block,:2], nz, axis=0), np.tile(zr, len(P[k:k+block]))]
+        G *= scale_dims
+        Fz[k:k+block] = first_roots(zr, np.reshape(decision_function(G), (-1,nz)))
+    P[:,2] = fill_roots(Fz)
+    return np.reshape(inverse_transform(P)[:,2], shape)
+
+def npz_memmap(path):
+    """
+    Memory map the arrays of an uncompressed npz file.
+
+    :param path: path of the npz file
+    :return: dictionary of read-only memory mapped arrays
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path,'rb') as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('npz_memmap - {} is compressed in {}'.format(info.filename,path))
+            f.seek(info.header_offset+26)
+            name_len,extra_len = (int(v) for v in np.frombuffer(f.read(4),dtype='<u2'))
+            f.seek(info.header_offset+30+name_len+extra_len)
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1,0) else np.lib.format.read_array_header_2_0
+            shape,fortran,dtype = read_header(f)
+            arrays[info.filename[:-4]] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), 
+                                                    shape=shape, order='F' if fortran else 'C')
+    return arrays
+
+class SVMModel(object):
+    """
+    Fitted SVM model evaluated with NumPy only: a RBF kernel expansion together with the
+    dimension scaling and the MinMaxScaler parameters of SVM.
+    """
+
+    def __init__(self, expansion, scale_dims, scaler_min, scaler_scale):
+        """
+        Initialize the model.
+
+        :param expansion: RBFExpansion in the scaled space
+        :param scale_dims: scale of each dimension of the points
+        :param scaler_min: MinMaxScaler min_ attribute
+        :param scaler_scale: MinMaxScaler scale_ attribute
+        """
+        self.expansion = expansion
+        self.scale_dims = np.asarray(scale_dims)
+        self.scaler_min = np.asarray(scaler_min)
+        self.scaler_scale = np.asarray(scaler_scale)
+
+    def transform(self, X):
+        return X*self.scaler_scale+self.scaler_min
+
+    def inverse_transform(self, X):
+        return (X-self.scaler_min)/self.scaler_scale
+
+    def decision_function(self, G):
+        return self.expansion.decision_function(G)
+
+    def estimate_tign_g(self, n=(400,400,40), tile=None):
+        logging.info('SVMModel.estimate_tign_g - estimating tign_g')
+        return estimate_tign(self.decision_function, self.scale_dims, self.inverse_transform, n, tile)
+
+    def estimate_tign_points(self, lon, lat, nz=40):
+        logging.info('SVMModel.estimate_tign_points - estimating tign_g at {} points'.format(np.size(lon)))
+        return estimate_tign_points(self.decision_function, self.scale_dims, self.transform, self.inverse_transform, lon, lat, nz)
+
+    def save(self, path):
+        """
+        Save the model into an uncompressed npz file.
+
+        :param path: path of the npz file
+        """
+        e = self.expansion
+        with open(path,'wb') as f:
+            np.savez(f, support_vectors=e.support_vectors_, dual_coef=e.dual_coef_, 
+                    intercept=np.array(e.intercept_), gamma=np.array(e.gamma),
+                    scale_dims=self.scale_dims, scaler_min=self.scaler_min, scaler_scale=self.scaler_scale)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a model saved with SVMModel.save or SVM.export_model.
+
+        :param path: path of the npz file
+        :param mmap: memory map the arrays instead of reading them
+        :return: SVMModel object
+        """
+        logging.info('SVMModel.load - loading the model from {}'.format(path))
+        if mmap:
+            d = npz_memmap(path)
+        else:
+            with np.load(path) as npz:
+                d = dict(npz)
+        expansion = RBFExpansion(d['support_vectors'], d['dual_coef'], d['intercept'], d['gamma'])
+        return cls(expansion, d['scale_dims'], d['scaler_min'], d['scaler_scale'])
@@ -0,0 +1,97 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import utils.saveload as sl
+from utils.general import make_dir
+
+import hashlib, json, logging, os, tempfile
+import os.path as osp
+
+def hash_inputs(*args):
+    """
+    Hash of the inputs of a stage, which have to be JSON serializable or convertible to strings.
+
+    :param args: inputs of the stage
+    :return: hexadecimal SHA-1 hash
+    """
+    return hashlib.sha1(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()
+
+def retrieve_key(js):
+    """
+    Hash of the inputs of the retrieval stage of a job.
+
+    :param js: job with bounds, start_utc, end_utc and sat_sources
+    """
+    return hash_inputs('retrieve', js.bounds, js.start_utc, js.end_utc, sorted(js.get('sat_sources',[])))
+
+def file_identity(path):
+    """
+    Identity of a file from its path, size and modification time.
+
+    :param path: path to the file
+    :return: list with path, size and modification time, or None values if it does not exist
+    """
+    if osp.exists(path):
+        st = os.stat(path)
+        return [osp.abspath(path), st.st_size, st.st_mtime]
+    return [path, None, None]
+
+class Checkpoint(object):
+    """
+    Store of stage outputs keyed by a hash of the stage inputs, so identical stages are not re-run.
+    """
+
+    def __init__(self, root, enabled=True):
+        """
+        Initialize the checkpoint store.
+
+        :param root: directory of the checkpoints
+        :param enabled: if False, nothing is loaded but outputs are still saved
+        """
+        self.root = make_dir(root)
+        self.enabled = enabled
+
+    def path(self, stage, key):
+        return osp.join(self.root, '{0}_{1}'.format(stage, key))
+
+    def load(self, stage, key):
+        """
+        Load the output of a stage if it was completed with the same inputs.
+
+        :param stage: name of the stage
+        :param key: hash of the stage inputs
+        :return: output of the stage or None if not available
+        """
+        path = self.path(stage, key)
+        if not self.enabled or not osp.exists(path):
+            return None
+        try:
+            logging.info('Checkpoint.load - resuming stage {} from {}'.format(stage, path))
+            return sl.load(path)
+        except Exception as e:
+            logging.warning('Checkpoint.load - cannot load {} with exception {}'.format(path, e))
+            return None
+
+    def save(self, stage, key, obj):
+        """
+        Save the output of a completed stage. The file is written into a unique temporary file
+        and moved atomically, so a crashed run never leaves a partial checkpoint and concurrent
+        jobs saving the same key do not write into the same file.
+
+        :param stage: name of the stage
+        :param key: hash of the stage inputs
+        :param obj: output of the stage
+        """
+        path = self.path(stage, key)
+        fd,tmp = tempfile.mkstemp(dir=self.root, prefix=osp.basename(path)+'.', suffix='.tmp')
+        os.close(fd)
+        try:
+            sl.save(obj, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if osp.exists(tmp):
+                os.remove(tmp)
+            raise
+        logging.info('Checkpoint.save - stage {} saved as {}'.format(stage, path))
+        return obj
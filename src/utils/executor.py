@@ -0,0 +1,159 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from utils.general import load_json
+from utils.metrics import metrics
+from utils.resources import get_plan
+
+from contextlib import contextmanager
+import logging, os
+
+class ExecutorError(Exception):
+    """
+    Raised when the executor backend cannot be started.
+    """
+    pass
+
+# joblib backend of each executor backend
+backends = {'serial': 'sequential', 'threads': 'threading', 'processes': 'loky', 'cluster': 'dask'}
+
+# environment variable marking the worker processes of an executor and their children
+worker_env = 'ML_TIGN_EXECUTOR_WORKER'
+
+def mark_worker():
+    """
+    Mark the process as a worker of an executor, so the parallel code of its tasks runs in a
+    serial executor instead of starting pools nested in the workers.
+    """
+    global executor
+    os.environ[worker_env] = '1'
+    if executor is None or executor.backend != 'serial':
+        executor = Executor('serial')
+
+def call(state, func, args):
+    """
+    Run a task in a worker with the metrics configuration of the process submitting it, so
+    the records of the tasks go to the metrics file of the job. Tasks running in another
+    process mark it as a worker.
+
+    :param state: (path,profile,pid) of the metrics and the process submitting the task
+    :param func: function to run
+    :param args: arguments of the function
+    :return: result of the function
+    """
+    path,profile,pid = state
+    if pid != os.getpid():
+        mark_worker()
+    if path != metrics.path:
+        metrics.configure(path, profile)
+    return func(*args)
+
+class Executor(object):
+    """
+    Pool of warm workers shared by all the parallel stages: ingest, decoding and ML.
+
+    The backend can be 'serial', 'threads', 'processes' (persistent loky workers reused by all
+    the stages until they are idle for idle_timeout seconds) or 'cluster' (workers of a dask
+    distributed scheduler, local or multi-node). The joblib parallel code (grid searches and
+    OneSidedSelection) runs in the same workers inside the parallel context, and each process
+    worker limits its BLAS threads so the workers do not oversubscribe the cores.
+    """
+
+    def __init__(self, backend='processes', workers=None, idle_timeout=600, address=None):
+        """
+        Initialize the executor, the workers are started on first use.
+
+        :param backend: 'serial', 'threads', 'processes' or 'cluster'
+        :param workers: number of workers, the workers of the resource plan if None
+        :param idle_timeout: seconds an idle process worker is kept alive
+        :param address: address of the dask scheduler of the cluster backend, a local cluster if None
+        """
+        if backend not in backends:
+            raise ExecutorError('Executor - unknown backend {0}, available: {1}'.format(backend,list(backends.keys())))
+        self.backend = backend
+        self.workers = 1 if backend == 'serial' else workers or get_plan().executor_workers
+        self.idle_timeout = idle_timeout
+        self.address = address
+        self.client = None
+
+    def start(self):
+        if self.backend == 'cluster' and self.client is None:
+            try:
+                from dask.distributed import Client
+            except ImportError:
+                raise ExecutorError('Executor.start - the cluster backend needs dask.distributed')
+            self.client = Client(self.address) if self.address else Client(n_workers=self.workers)
+            logging.info('Executor.start - connected to dask scheduler {}'.format(self.client.scheduler.address))
+        return self
+
+    @contextmanager
+    def parallel(self):
+        """
+        Context where joblib runs with the backend and workers of the executor.
+        """
+        import joblib
+        self.start()
+        kwargs = {'idle_worker_timeout': self.idle_timeout} if self.backend == 'processes' else {}
+        with joblib.parallel_backend(backends[self.backend], n_jobs=self.workers, **kwargs):
+            yield self
+
+    def map(self, func, *iterables, threads=None, workers=None):
+        """
+        Apply a function to the items of some iterables in the workers.
+
+        :param func: function to apply, picklable for the process and cluster backends
+        :param iterables: iterables with the arguments of each call
+        :param threads: run in this number of threads of this process instead of the workers,
+                        for tasks waiting on I/O or sharing the memory of the process
+        :param workers: maximum number of tasks running at once in the workers, all the workers if None
+        :return: list of results in the order of the items
+        """
+        import joblib
+        tasks = list(zip(*iterables))
+        if not tasks:
+            return []
+        state = (metrics.path, sorted(metrics.profile), os.getpid())
+        if threads and self.backend != 'serial':
+            kwargs = {'n_jobs': threads, 'require': 'sharedmem'}
+        else:
+            kwargs = {'n_jobs': min(workers, self.workers)} if workers else {}
+        with self.parallel():
+            return joblib.Parallel(**kwargs)(joblib.delayed(call)(state, func, args) for args in tasks)
+
+    def shutdown(self):
+        # the idle process workers stop by themselves after idle_timeout
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+# executor shared by the stages of the process, created on first use
+executor=None
+
+def configure(**settings):
+    """
+    Set the executor of the process, replacing the settings of the system configuration.
+
+    :param settings: arguments of Executor
+    :return: the Executor object
+    """
+    global executor
+    if executor is not None:
+        executor.shutdown()
+    executor = Executor(**settings)
+    logging.info('configure - {0} executor with {1} workers'.format(executor.backend,executor.workers))
+    return executor
+
+def get_executor():
+    """
+    Executor of the process, configured on first use from the executor settings of etc/sys.json,
+    or a serial executor in the worker processes of an executor.
+
+    :return: the Executor object
+    """
+    if executor is None:
+        if os.environ.get(worker_env):
+            configure(backend='serial')
+        else:
+            configure(**load_json('etc/sys.json').get('executor',{}))
+    return executor
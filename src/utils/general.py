@@ -2,9 +2,9 @@
 # Angel Farguell, CU Denver
 #
 
-import os, sys, logging, json, collections
+import os, sys, logging, json, collections, fcntl
+from contextlib import contextmanager
 import os.path as osp
-from wrf.wrf_file import WRFFile
 
 class Dict(dict):
     """
@@ -50,6 +50,40 @@ def make_dir(dir):
         os.makedirs(dir)
     return dir
 
+def make_unique_dir(path):
+    """
+    Create a new directory, adding a numeric suffix to path if it already exists. The creation
+    is atomic, so processes creating the same path at the same time get different directories.
+
+    :param path: the directory to be created
+    :return: path of the directory created
+    """
+    make_dir(osp.dirname(osp.abspath(path)))
+    k = 0
+    while True:
+        new = path if k == 0 else '{0}_{1}'.format(path,k)
+        try:
+            os.mkdir(new)
+            return new
+        except FileExistsError:
+            k += 1
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Exclusive lock of a file across processes, for instance to avoid two jobs downloading
+    the same file at the same time.
+
+    :param path: path of the lock file
+    :param blocking: wait for the lock, otherwise raise BlockingIOError if it is taken
+    """
+    with open(ensure_dir(path),'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
 def remove(tgt):
     """
     os.remove wrapper
@@ -149,8 +183,9 @@ def process_bounds(bbox):
     """
     if isinstance(bbox,str):
         if osp.exists(bbox):    
-            fxlon,fxlat = WRFFile(bbox).fire_grid()
-            return (fxlon.min(),fxlon.max(),fxlat.min(),fxlat.max())
+            from wrf.wrf_file import WRFFile
+            with WRFFile(bbox) as wrf:
+                return wrf.bounds()
         else:
             return None
     else:
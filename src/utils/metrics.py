@@ -0,0 +1,150 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from contextlib import contextmanager
+from functools import wraps
+import os.path as osp
+import cProfile, json, logging, os, resource, threading, time
+
+class Metrics(object):
+    """
+    Performance telemetry of the stages of a job.
+
+    Each timed stage appends a JSON line record (stage, item, wall and CPU time, peak RSS and
+    extra fields like bytes) to a metrics file, so processes forked after configure also
+    record into it. An optional cProfile capture can be saved for some stages.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.profile = set()
+        self.profile_dir = None
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def configure(self, path, profile=[]):
+        """
+        Start recording into a metrics file.
+
+        :param path: path of the JSON lines metrics file
+        :param profile: list of stage names to capture with cProfile
+        """
+        self.path = path
+        self.profile = set(profile)
+        self.profile_dir = osp.join(osp.dirname(path),'profiles')
+
+    def record(self, stage, **fields):
+        """
+        Append a record of a stage to the metrics file, if configured.
+
+        :param stage: name of the stage
+        :param fields: fields of the record
+        """
+        if self.path is None:
+            return
+        fields.update({'stage': stage, 'pid': os.getpid(), 'time': time.time()})
+        line = json.dumps(fields, default=str)+'\n'
+        with self.lock:
+            with open(self.path,'a') as f:
+                f.write(line)
+
+    @contextmanager
+    def timer(self, stage, item=None, **extra):
+        """
+        Measure the wall and CPU time and the peak RSS of a block of code.
+
+        :param stage: name of the stage
+        :param item: optional name of the item processed, for instance a file or URL
+        :param extra: extra fields of the record, they can be updated inside the block
+        """
+        prof = None
+        if self.path is not None and stage in self.profile and not getattr(self.local,'profiling',False):
+            prof = cProfile.Profile()
+            self.local.profiling = True
+            prof.enable()
+        wall,cpu = time.perf_counter(),time.process_time()
+        status = 'SUCCESS'
+        try:
+            yield extra
+        except Exception:
+            status = 'FAILURE'
+            raise
+        finally:
+            wall,cpu = time.perf_counter()-wall,time.process_time()-cpu
+            if prof is not None:
+                prof.disable()
+                self.local.profiling = False
+                if not osp.exists(self.profile_dir):
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                prof.dump_stats(osp.join(self.profile_dir,'{0}_{1}_{2}.prof'.format(stage,os.getpid(),int(time.time()*1e3))))
+            self.record(stage, item=item, wall=wall, cpu=cpu, status=status, peak_rss=peak_rss(), 
+                        peak_rss_children=peak_rss(True), **extra)
+
+    def timed(self, stage):
+        """
+        Decorator recording each call of a function as a stage.
+
+        :param stage: name of the stage
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """
+        Aggregate the records of the metrics file per stage and per data center.
+
+        :return: dictionary with the summary
+        """
+        stages,centers = {},{}
+        if self.path is None or not osp.exists(self.path):
+            return {'stages': stages, 'data_centers': centers}
+        for line in open(self.path):
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue
+            s = stages.setdefault(r['stage'],{'count': 0, 'failures': 0, 'wall': 0., 'cpu': 0., 'peak_rss': 0, 'peak_rss_children': 0})
+            s['count'] += 1
+            s['failures'] += r.get('status') == 'FAILURE'
+            s['wall'] += r.get('wall',0.)
+            s['cpu'] += r.get('cpu',0.)
+            s['peak_rss'] = max(s['peak_rss'],r.get('peak_rss',0))
+            s['peak_rss_children'] = max(s['peak_rss_children'],r.get('peak_rss_children',0))
+            if r.get('bytes'):
+                c = centers.setdefault(str(r.get('data_center')),{'count': 0, 'bytes': 0, 'wall': 0.})
+                c['count'] += 1
+                c['bytes'] += r['bytes']
+                c['wall'] += r.get('wall',0.)
+        for c in centers.values():
+            c['throughput'] = c['bytes']/c['wall'] if c['wall'] > 0 else None
+        return {'stages': stages, 'data_centers': centers, 'peak_rss': max([s['peak_rss'] for s in stages.values()]+[peak_rss()])}
+
+    def write_summary(self, path):
+        """
+        Write the summary of the metrics file into a JSON file.
+
+        :param path: path of the JSON file
+        """
+        summary = self.summary()
+        json.dump(summary, open(path,'w'), indent=4, separators=(',', ': '))
+        logging.info('Metrics.write_summary - metrics summary saved as {}'.format(path))
+        return summary
+
+def peak_rss(children=False):
+    """
+    Peak resident set size in bytes of the current process, or of its largest finished child.
+
+    :param children: peak of the children instead of the current process
+    """
+    return 1024*resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+
+# metrics of the current job, shared by all the modules
+metrics = Metrics()
+timer = metrics.timer
+timed = metrics.timed
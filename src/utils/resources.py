@@ -0,0 +1,176 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from utils.general import load_json
+
+import copy, logging, os
+
+class ResourcePlan(object):
+    """
+    Memory budget of a job and the resources of each stage derived from it.
+
+    The budget (a share of the memory of the node if the job runs with other jobs) is split
+    into the workers of each stage: the number of granules decoded at once, the number of
+    concurrent SVM fits of the hyperparameter search and their libsvm kernel cache, the size
+    of the matrices of the Gram search kept in memory and the tiles of the tign_g grid
+    evaluation. Each process worker costs worker_mb plus the memory of its task, and the
+    workers never exceed the cores of the job.
+    """
+
+    def __init__(self, memory_gb=None, cpus=None, jobs=1, worker_mb=250, granule_mb=600, min_cache_mb=200,
+                    max_cache_mb=4096, point_bytes=128, max_grid_points=1<<20):
+        """
+        Initialize the resource plan.
+
+        :param memory_gb: memory budget in GB of all the jobs of the node, 80% of the available memory if None
+        :param cpus: cores of all the jobs of the node, number of CPUs if None
+        :param jobs: number of jobs running at the same time, sharing the memory budget and the cores
+        :param worker_mb: memory in MB of an idle process worker
+        :param granule_mb: peak memory in MB of decoding a granule
+        :param min_cache_mb: minimum libsvm kernel cache in MB of a fit
+        :param max_cache_mb: maximum libsvm kernel cache in MB of a fit
+        :param point_bytes: bytes of each point of the tign_g grid evaluation
+        :param max_grid_points: maximum number of points of the tign_g grid evaluation at once
+        """
+        if memory_gb is None:
+            import psutil
+            memory_mb = .8*psutil.virtual_memory().available/float(1<<20)
+        else:
+            memory_mb = memory_gb*1024.
+        self.jobs = max(1, int(jobs))
+        self.memory_mb = memory_mb/self.jobs
+        self.cpus = max(1, (cpus or os.cpu_count() or 1)//self.jobs)
+        self.worker_mb = worker_mb
+        self.granule_mb = granule_mb
+        self.min_cache_mb = min_cache_mb
+        self.max_cache_mb = max_cache_mb
+        self.point_bytes = point_bytes
+        self.max_grid_points = max_grid_points
+
+    def workers(self, task_mb=0):
+        """
+        Number of process workers running tasks of task_mb MB at once within the budget.
+
+        :param task_mb: peak memory in MB of each task
+        """
+        fit = int(self.memory_mb//(self.worker_mb+task_mb))
+        return max(1, min(self.cpus, fit))
+
+    @property
+    def executor_workers(self):
+        # one core is left for the process of the job
+        return min(max(1, self.cpus-1), self.workers(self.granule_mb))
+
+    def decode_workers(self):
+        """
+        Number of granules decoded at once.
+        """
+        return self.workers(self.granule_mb)
+
+    def data_mb(self, n_points, n_features=3):
+        # training data of a fit and its copies in libsvm
+        return 3*n_points*(n_features+2)*8/float(1<<20)
+
+    def kernel_mb(self, n_points):
+        # full kernel matrix, libsvm does not use more cache than that
+        return n_points*n_points*8/float(1<<20)
+
+    def cache_mb(self, n_points, fits=1, task_mb=0):
+        """
+        libsvm kernel cache in MB of each of some concurrent fits.
+
+        :param n_points: number of training points of each fit
+        :param fits: number of fits running at the same time
+        :param task_mb: memory in MB of each fit besides its training data and its cache
+        """
+        free = self.memory_mb/fits-self.worker_mb-self.data_mb(n_points)-task_mb
+        cache = min(free, self.max_cache_mb, max(self.kernel_mb(n_points), self.min_cache_mb))
+        return int(max(self.min_cache_mb, cache))
+
+    def search(self, n_points, n_tasks, task_mb=0):
+        """
+        Concurrent fits and kernel cache of a hyperparameter search.
+
+        :param n_points: number of training points of each fit
+        :param n_tasks: number of fits of the search (candidates times folds)
+        :param task_mb: memory in MB of each fit besides its training data and its cache,
+                        like the kernel blocks of the folds of the Gram search
+        :return jobs,cache_mb: number of concurrent fits and libsvm kernel cache in MB of each one
+        """
+        jobs = max(1, min(n_tasks, self.workers(self.data_mb(n_points)+self.min_cache_mb+task_mb)))
+        cache = self.cache_mb(n_points, jobs, task_mb)
+        logging.info('ResourcePlan.search - {0} concurrent fits with {1} MB of kernel cache'.format(jobs,cache))
+        return jobs, cache
+
+    def share(self, tasks):
+        """
+        Resource plan of each of some tasks running at the same time, like the fits of the tiles.
+
+        :param tasks: number of tasks running at the same time
+        :return: ResourcePlan with the share of the memory budget and the cores of each task
+        """
+        tasks = max(1, int(tasks))
+        plan = copy.copy(self)
+        plan.jobs = self.jobs*tasks
+        plan.memory_mb = self.memory_mb/tasks
+        plan.cpus = max(1, self.cpus//tasks)
+        return plan
+
+    def gram_mb(self):
+        """
+        Maximum size in MB of the distance and Gram matrices of the Gram search kept in memory.
+        """
+        # the distance and the Gram matrices are in memory at the same time
+        return int(self.memory_mb//4)
+
+    def grid_points(self):
+        """
+        Number of points of the tign_g evaluation at once within half of the budget, at most
+        max_grid_points whatever the budget, so the peak memory does not grow with the grid.
+        """
+        # plans saved before max_grid_points existed use the default cap
+        cap = getattr(self, 'max_grid_points', 1<<20)
+        return min(cap, int(.5*self.memory_mb*(1<<20)//self.point_bytes))
+
+    def grid_tile(self, n):
+        """
+        Tile size of the tign_g grid evaluation with at most grid_points points.
+
+        :param n: grid size (nx,ny,nz)
+        :return: tile size (tx,ty)
+        """
+        nx,ny,nz = n
+        t = max(1, int((self.grid_points()//nz)**.5))
+        tile = (min(t,nx), min(t,ny))
+        logging.info('ResourcePlan.grid_tile - evaluating grid {0} in tiles of size {1}'.format(n,tile))
+        return tile
+
+    def __repr__(self):
+        return 'ResourcePlan(memory_mb={0:.0f}, cpus={1}, jobs={2})'.format(self.memory_mb,self.cpus,self.jobs)
+
+# resource plan of the process, created on first use
+plan=None
+
+def configure(**settings):
+    """
+    Set the resource plan of the process, replacing the settings of the system configuration.
+
+    :param settings: arguments of ResourcePlan
+    :return: the ResourcePlan object
+    """
+    global plan
+    plan = ResourcePlan(**settings)
+    logging.info('configure - {}'.format(plan))
+    return plan
+
+def get_plan():
+    """
+    Resource plan of the process, configured on first use from the resources settings of etc/sys.json.
+    Only the file is read, the directories of load_sys_cfg are not created.
+
+    :return: the ResourcePlan object
+    """
+    if plan is None:
+        configure(**load_json('etc/sys.json').get('resources',{}))
+    return plan
@@ -0,0 +1,244 @@
+from utils.checkpoint import hash_inputs
+from utils.general import file_lock, make_dir
+from utils.times import num_to_dt
+
+import numpy as np
+import os.path as osp
+import json, logging, os, uuid
+
+# columns of the per-pixel records and their types
+columns = {'lon': np.float32, 'lat': np.float32, 'time': np.float64, 'class': np.uint8,
+           'conf': np.float32, 'frp': np.float32, 'scan': np.float32, 'track': np.float32}
+
+def granule_id(granule):
+    """
+    Identifier of a granule from the names of its files, which are unique product names, so a
+    granule downloaded again after being evicted from the ingest directory keeps its records.
+
+    :param granule: granule information from manifest
+    """
+    return hash_inputs('granule', osp.basename(granule['geo_local_path']), osp.basename(granule['fire_local_path']))
+
+def granule_records(granule, granule_class):
+    """
+    Per-pixel records of a decoded granule inside its granule mask. Confidence and FRP are
+    matched from the fire detections by swath line and sample, and are nan for the other pixels.
+
+    :param granule: dictionary from SatGranule.read_granule
+    :param granule_class: SatGranule class of the granule, for the pixel dimensions
+    :return: dictionary of column arrays, None if the granule has no fire mask
+    """
+    fire = np.asarray(granule.get('fire',[]))
+    mask = np.asarray(granule.get('granule_mask',[]))
+    if fire.size == 0 or fire.size != mask.size:
+        return None
+    lon = np.ravel(granule['lon'])[mask]
+    lat = np.ravel(granule['lat'])[mask]
+    sample = np.nonzero(mask)[0] % fire.shape[-1]
+    with np.errstate(invalid='ignore'):
+        _,scan,track = granule_class.pixel_dims(np.arange(fire.shape[-1]))
+    rec = {'lon': lon, 'lat': lat, 'time': np.full(len(lon), granule['time_num']), 'class': np.ravel(fire)[mask],
+            'conf': np.full(len(lon), np.nan), 'frp': np.full(len(lon), np.nan), 'scan': scan[sample], 'track': track[sample]}
+    # detections are matched by their swath line and sample, the window starts at first_line
+    detect = np.asarray(granule.get('detect_mask',[]), dtype=bool)
+    conf,frp = np.ravel(granule.get('conf_fire',[])),np.ravel(granule.get('frp_fire',[]))
+    line,samp = np.ravel(granule.get('line_fire',[])),np.ravel(granule.get('sample_fire',[]))
+    n = detect.sum()
+    if n and len(conf) == n and len(frp) == n and len(line) == n and len(samp) == n:
+        pix = np.nonzero(rec['class'] >= 7)[0]
+        lines = np.nonzero(mask)[0][pix]//fire.shape[-1]+granule.get('first_line',0)
+        shape = (max(lines.max(initial=0),line.max())+1, fire.shape[-1])
+        keys = np.ravel_multi_index((line.astype(np.int64),samp.astype(np.int64)), shape)
+        order = np.argsort(keys, kind='stable')
+        pkeys = np.ravel_multi_index((lines,sample[pix]), shape)
+        k = np.minimum(np.searchsorted(keys, pkeys, sorter=order), n-1)
+        found = keys[order[k]] == pkeys
+        rec['conf'][pix[found]] = conf[order[k[found]]]
+        rec['frp'][pix[found]] = frp[order[k[found]]]
+    return {c: np.asarray(v, dtype=columns[c]) for c,v in rec.items()}
+
+def contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] >= inner[1] and outer[2] <= inner[2] and outer[3] >= inner[3]
+
+def intersects(b1, b2):
+    return b1[0] <= b2[1] and b1[1] >= b2[0] and b1[2] <= b2[3] and b1[3] >= b2[2]
+
+def inside(lon, lat, bounds):
+    return np.logical_and(np.logical_and(lon >= bounds[0], lon <= bounds[1]), np.logical_and(lat >= bounds[2], lat <= bounds[3]))
+
+class DetectionStore(object):
+    """
+    Append-only columnar store of per-pixel records (lon, lat, time, fire mask class, confidence,
+    FRP, scan and track pixel sizes) of the decoded granules.
+
+    Each appended granule is a part of memory-mapped .npy columns partitioned by sensor and day,
+    with the records sorted by spatial tile. A JSON index keeps the time, sensor and coverage of
+    each part, so reading a sub-window or sub-region only maps the parts and tiles it needs.
+
+    A part covers the pixels of a granule inside some bounds. Appending a granule again for other
+    bounds only stores the pixels outside of the previous parts of the granule, so each pixel is
+    stored once.
+    """
+
+    def __init__(self, root, tile=.1):
+        """
+        Initialize the store.
+
+        :param root: directory of the store
+        :param tile: size in degrees of the spatial tiles, only used when the store is created
+        """
+        self.root = make_dir(root)
+        self.index_path = osp.join(self.root,'index.json')
+        self.tile = self.load_index().get('tile',tile)
+
+    def load_index(self):
+        if osp.exists(self.index_path):
+            return json.load(open(self.index_path))
+        return {'parts': []}
+
+    def tile_xy(self, lon, lat):
+        ix = np.floor((np.asarray(lon, dtype=float)+180.)/self.tile).astype(np.int64)
+        iy = np.floor((np.asarray(lat, dtype=float)+90.)/self.tile).astype(np.int64)
+        return ix,iy
+
+    def tile_ids(self, lon, lat):
+        ix,iy = self.tile_xy(lon, lat)
+        return ix*int(np.ceil(180./self.tile))+iy
+
+    def covers(self, granule_ids, bounds):
+        """
+        Check if all the granules were appended for bounds containing the given bounds.
+
+        :param granule_ids: identifiers of the granules
+        :param bounds: bounds (lonmin,lonmax,latmin,latmax)
+        """
+        parts = self.load_index()['parts']
+        return all(any(p['granule'] == g and contains(p['coverage'], bounds) for p in parts) for g in granule_ids)
+
+    def append(self, granule_id, sensor, records, bounds):
+        """
+        Append the records of a granule inside some bounds as a new part.
+
+        :param granule_id: identifier of the granule files
+        :param sensor: name of the sensor, ex: 'Terra'
+        :param records: dictionary of column arrays from granule_records, or None for no records
+        :param bounds: bounds (lonmin,lonmax,latmin,latmax) covered by the records
+        :return: number of records appended
+        """
+        bounds = [float(b) for b in bounds]
+        with file_lock(osp.join(self.root,'index.lock')):
+            index = self.load_index()
+            index['tile'] = self.tile
+            previous = [p for p in index['parts'] if p['granule'] == granule_id]
+            if any(contains(p['coverage'], bounds) for p in previous):
+                return 0
+            if records is None:
+                records = {c: np.zeros(0, dtype=t) for c,t in columns.items()}
+            keep = inside(records['lon'], records['lat'], bounds)
+            for p in previous:
+                keep = np.logical_and(keep, ~inside(records['lon'], records['lat'], p['coverage']))
+            tiles = self.tile_ids(records['lon'][keep], records['lat'][keep])
+            order = np.argsort(tiles, kind='stable')
+            tile_list,starts = np.unique(tiles[order], return_index=True)
+            n = int(keep.sum())
+            time = float(records['time'][0]) if len(records['time']) else None
+            day = num_to_dt(time).strftime('%Y-%m-%d') if time is not None else 'none'
+            path = osp.join(sensor, day, uuid.uuid4().hex)
+            part_dir = make_dir(osp.join(self.root, path))
+            for c,t in columns.items():
+                np.save(osp.join(part_dir, c+'.npy'), np.asarray(records[c], dtype=t)[keep][order])
+            np.save(osp.join(part_dir,'tiles.npy'), tile_list)
+            np.save(osp.join(part_dir,'offsets.npy'), np.append(starts, n).astype(np.int64))
+            lon,lat = records['lon'][keep],records['lat'][keep]
+            index['parts'].append({'path': path, 'granule': granule_id, 'sensor': sensor, 'day': day,
+                                   'time': [time,time], 'coverage': bounds, 'size': n,
+                                   'bbox': [float(lon.min()),float(lon.max()),float(lat.min()),float(lat.max())] if n else None})
+            tmp = self.index_path+'.tmp'
+            json.dump(index, open(tmp,'w'), indent=1)
+            os.replace(tmp, self.index_path)
+        logging.info('DetectionStore.append - {0} records of granule {1} appended as {2}'.format(n,granule_id,path))
+        return n
+
+    def parts(self, bounds=None, time=None, sensors=None, granules=None):
+        """
+        Parts of the index with records in a region, time window, sensors and granules.
+
+        :param bounds: optional bounds (lonmin,lonmax,latmin,latmax)
+        :param time: optional time window (tmin,tmax) in seconds since epoch
+        :param sensors: optional list of sensor names
+        :param granules: optional list of granule identifiers
+        :return: list of index entries
+        """
+        parts = [p for p in self.load_index()['parts'] if p['size'] > 0]
+        if bounds is not None:
+            parts = [p for p in parts if intersects(p['bbox'], bounds)]
+        if time is not None:
+            parts = [p for p in parts if p['time'][0] <= time[1] and p['time'][1] >= time[0]]
+        if sensors is not None:
+            parts = [p for p in parts if p['sensor'] in sensors]
+        if granules is not None:
+            parts = [p for p in parts if p['granule'] in granules]
+        return parts
+
+    def read(self, bounds=None, time=None, sensors=None, granules=None, cols=('lon','lat','time','class')):
+        """
+        Read the records in a region, time window, sensors and granules. Only the tiles of the
+        region are read from the memory-mapped columns.
+
+        :param bounds: optional bounds (lonmin,lonmax,latmin,latmax)
+        :param time: optional time window (tmin,tmax) in seconds since epoch
+        :param sensors: optional list of sensor names
+        :param granules: optional list of granule identifiers
+        :param cols: columns to read
+        :return: dictionary of column arrays
+        """
+        cols = list(cols)
+        out = {c: [] for c in cols}
+        for p in self.parts(bounds, time, sensors, granules):
+            part_dir = osp.join(self.root, p['path'])
+            data = {c: np.load(osp.join(part_dir, c+'.npy'), mmap_mode='r') for c in set(cols) | {'lon','lat','time'}}
+            if bounds is not None and not contains(bounds, p['bbox']):
+                tiles = np.load(osp.join(part_dir,'tiles.npy'))
+                offsets = np.load(osp.join(part_dir,'offsets.npy'))
+                ny = int(np.ceil(180./self.tile))
+                (ix0,ix1),(iy0,iy1) = self.tile_xy(bounds[:2], bounds[2:])
+                # the tiles of each longitude column of the region are contiguous
+                rows = []
+                for ix in range(ix0,ix1+1):
+                    a = np.searchsorted(tiles, ix*ny+iy0, side='left')
+                    b = np.searchsorted(tiles, ix*ny+iy1, side='right')
+                    if b > a:
+                        rows.append(np.arange(offsets[a],offsets[b]))
+                rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+                rows = rows[inside(data['lon'][rows], data['lat'][rows], bounds)]
+            else:
+                rows = slice(None)
+            if time is not None:
+                t = data['time'][rows]
+                rows = np.arange(len(data['time']))[rows][np.logical_and(t >= time[0], t <= time[1])]
+            for c in cols:
+                out[c].append(np.asarray(data[c][rows]))
+        return {c: np.concatenate(v) if v else np.zeros(0, dtype=columns[c]) for c,v in out.items()}
+
+    def training_data(self, bounds=None, time=None, sensors=None, granules=None, fire_classes={8: .5, 9: 1.}, ground_classes={5: 1.}):
+        """
+        Build the training points of a region, time window, sensors and granules, like
+        vis.sat_collection.training_data on the decoded granules.
+
+        :param fire_classes: fire mask classes of fire pixels and their sample weights
+        :param ground_classes: fire mask classes of ground pixels and their sample weights
+        :return X: points (lon,lat,time) with time in days since epoch
+        :return y: labels, 1 for fire and -1 for ground
+        :return sample_weight: sample weights
+        """
+        rec = self.read(bounds, time, sensors, granules)
+        label = np.zeros(len(rec['class']), dtype=int)
+        sw = np.zeros(len(rec['class']))
+        for lab,classes in ((1,fire_classes),(-1,ground_classes)):
+            for cl,w in classes.items():
+                label[rec['class'] == cl] = lab
+                sw[rec['class'] == cl] = w
+        m = label != 0
+        X = np.c_[rec['lon'][m], rec['lat'][m], rec['time'][m]/86400.]
+        logging.info('DetectionStore.training_data - {} fire and {} ground points'.format((label == 1).sum(),(label == -1).sum()))
+        return X, label[m], sw[m]
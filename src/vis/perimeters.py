@@ -0,0 +1,345 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from utils.times import dt_to_num
+
+from datetime import datetime
+import numpy as np
+import os.path as osp
+import glob, json, logging, re, zipfile
+
+class PerimeterError(Exception):
+    """
+    Raised when a perimeter file cannot be read.
+    """
+    pass
+
+# extensions of the supported perimeter files
+extensions = ('.kml','.kmz','.geojson','.json','.shp')
+
+def parse_time(t_str):
+    """
+    Parse a time string in ESMF (YYYY-MM-DD_hh:mm:ss), ISO 8601 or YYYYMMDD_hhmm format.
+
+    :param t_str: time string
+    :return: time as seconds since epoch, None if not recognized
+    """
+    t_str = str(t_str).strip().replace('Z','')
+    for fmt in ('%Y-%m-%d_%H:%M:%S','%Y-%m-%dT%H:%M:%S','%Y-%m-%dT%H:%M:%S.%f','%Y-%m-%d %H:%M:%S',
+                '%Y-%m-%dT%H:%M','%Y-%m-%d %H:%M','%Y-%m-%d','%Y%m%d_%H%M','%Y%m%d%H%M'):
+        try:
+            return dt_to_num(datetime.strptime(t_str, fmt))
+        except ValueError:
+            continue
+    return None
+
+def file_time(path):
+    """
+    Time of a perimeter from its file name, like ca_camp_20181108_1600_dd83.kml.
+
+    :param path: path of the perimeter file
+    :return: time as seconds since epoch, None if the name has no time
+    """
+    m = re.search(r'(\d{8})[_-]?(\d{4})', osp.basename(path))
+    return parse_time(m.group(1)+'_'+m.group(2)) if m else None
+
+def parse_coordinates(text):
+    """
+    Ring of a KML coordinates string 'lon,lat[,alt] lon,lat[,alt] ...'.
+    """
+    values = [c.split(',') for c in text.split()]
+    return np.array([[float(v[0]),float(v[1])] for v in values if len(v) >= 2])
+
+def read_kml(path):
+    """
+    Read the polygons of a KML or KMZ perimeter file. The time of each placemark is its
+    TimeStamp, the end of its TimeSpan or the time in the file name.
+
+    :param path: path of the KML or KMZ file
+    :return: list of (time,polygons) with time in seconds since epoch and polygons as lists of rings
+    """
+    import xml.etree.ElementTree as ET
+    if path.endswith('.kmz'):
+        with zipfile.ZipFile(path) as z:
+            names = [n for n in z.namelist() if n.endswith('.kml')]
+            if not names:
+                raise PerimeterError('read_kml - no KML document in {}'.format(path))
+            root = ET.fromstring(z.read(names[0]))
+    else:
+        root = ET.parse(path).getroot()
+    # tags without namespace
+    for e in root.iter():
+        e.tag = e.tag.split('}')[-1]
+    default = file_time(path)
+    perims = []
+    for pm in root.iter('Placemark'):
+        t = pm.find('TimeStamp/when')
+        if t is None:
+            t = pm.find('TimeSpan/end')
+        time = parse_time(t.text) if t is not None and t.text else default
+        polys = [[parse_coordinates(c.text) for c in poly.iter('coordinates') if c.text] for poly in pm.iter('Polygon')]
+        polys = [[r for r in rings if len(r) > 2] for rings in polys]
+        polys = [rings for rings in polys if rings]
+        if polys:
+            perims.append((time,polys))
+    return perims
+
+def geojson_polygons(geom):
+    if geom is None:
+        return []
+    if geom['type'] == 'Polygon':
+        polys = [geom['coordinates']]
+    elif geom['type'] == 'MultiPolygon':
+        polys = geom['coordinates']
+    elif geom['type'] == 'GeometryCollection':
+        return [p for g in geom['geometries'] for p in geojson_polygons(g)]
+    else:
+        return []
+    polys = [[np.array(r, dtype=float)[:,:2] for r in p if len(r) > 2] for p in polys]
+    return [p for p in polys if p]
+
+def feature_time(props, default, time_keys=('time','date','datetime','perimeterdatetime','poly_datecurrent','date_time')):
+    for k,v in props.items():
+        if k.lower() in time_keys and v is not None:
+            if isinstance(v, (int,float)):
+                # milliseconds since epoch in ArcGIS exports
+                return v/1000. if v > 1e11 else float(v)
+            t = parse_time(v)
+            if t is not None:
+                return t
+    return default
+
+def read_geojson(path):
+    """
+    Read the polygons of a GeoJSON perimeter file. The time of each feature is its time or
+    date property, or the time in the file name.
+
+    :param path: path of the GeoJSON file
+    :return: list of (time,polygons) with time in seconds since epoch and polygons as lists of rings
+    """
+    gj = json.load(open(path))
+    features = gj['features'] if gj.get('type') == 'FeatureCollection' else [gj]
+    default = file_time(path)
+    perims = []
+    for f in features:
+        geom = f.get('geometry', f if 'coordinates' in f else None)
+        polys = geojson_polygons(geom)
+        if polys:
+            perims.append((feature_time(f.get('properties') or {}, default),polys))
+    return perims
+
+def read_shp(path):
+    """
+    Read the polygons of a shapefile perimeter, needs pyshp. The time of each record is its
+    time or date field, or the time in the file name.
+
+    :param path: path of the shapefile
+    :return: list of (time,polygons) with time in seconds since epoch and polygons as lists of rings
+    """
+    try:
+        import shapefile
+    except ImportError:
+        raise PerimeterError('read_shp - reading shapefile {} needs pyshp'.format(path))
+    default = file_time(path)
+    perims = []
+    with shapefile.Reader(path) as sf:
+        for sr in sf.iterShapeRecords():
+            pts = np.array(sr.shape.points, dtype=float).reshape(-1,2)
+            parts = list(sr.shape.parts)+[len(pts)]
+            polys = []
+            for a,b in zip(parts[:-1],parts[1:]):
+                if b-a < 3:
+                    continue
+                ring = pts[a:b]
+                # outer rings are clockwise and holes counterclockwise, after their outer ring
+                area = np.sum(ring[:-1,0]*ring[1:,1]-ring[1:,0]*ring[:-1,1])
+                if area < 0 or not polys:
+                    polys.append([ring])
+                else:
+                    polys[-1].append(ring)
+            if polys:
+                perims.append((feature_time(sr.record.as_dict(), default),polys))
+    return perims
+
+def read_perimeters(path):
+    """
+    Read the perimeters of a file, a directory or a list of them. The polygons with the same
+    time are merged into one perimeter.
+    A polygon is a list of rings, arrays (n,2) of lon,lat with the outer ring first and its holes.
+
+    :param path: path or list of paths of perimeter files (KML, KMZ, GeoJSON or shapefile) or directories
+    :return: list of dictionaries with time in seconds since epoch and polygons, sorted by time
+    """
+    paths = []
+    for p in ([path] if isinstance(path, str) else path):
+        if osp.isdir(p):
+            paths += sorted(f for f in glob.glob(osp.join(p,'*')) if f.lower().endswith(extensions))
+        else:
+            paths.append(p)
+    perims = {}
+    for p in paths:
+        ext = osp.splitext(p)[1].lower()
+        if ext in ('.kml','.kmz'):
+            polys = read_kml(p)
+        elif ext in ('.geojson','.json'):
+            polys = read_geojson(p)
+        elif ext == '.shp':
+            polys = read_shp(p)
+        else:
+            raise PerimeterError('read_perimeters - unrecognized perimeter file {}'.format(p))
+        for time,poly in polys:
+            if time is None:
+                logging.warning('read_perimeters - perimeter in {} without time, ignoring'.format(p))
+                continue
+            perims.setdefault(time,[]).extend(poly)
+    return [{'time': t, 'polygons': perims[t]} for t in sorted(perims)]
+
+def scanline_mask(rings, lon, lat):
+    """
+    Points of a regular grid inside a polygon with holes, with the even-odd
+    rule. The edges of all the rings are bucketed by the grid lines they cross, so each edge is
+    only intersected with those lines, and the crossings of each line are accumulated along it.
+    The cost is proportional to the edge-line crossings plus the grid size, without Python loops
+    over the points or the edges.
+
+    :param rings: list of arrays (n,2) of lon,lat of the polygon rings
+    :param lon: increasing longitudes of the grid columns
+    :param lat: increasing latitudes of the grid lines
+    :return: boolean mask of shape (len(lat),len(lon))
+    """
+    mask = np.zeros((len(lat),len(lon)+1), dtype=np.int32)
+    if not rings or not len(lon) or not len(lat):
+        return mask[:,:-1].astype(bool)
+    # edges of the closed rings
+    p0 = np.concatenate(rings)
+    p1 = np.concatenate([np.roll(r,-1,axis=0) for r in rings])
+    x0,y0,x1,y1 = p0[:,0],p0[:,1],p1[:,0],p1[:,1]
+    e = y0 != y1
+    x0,y0,x1,y1 = x0[e],y0[e],x1[e],y1[e]
+    # grid lines crossed by each edge, half-open to count shared vertices once
+    j0 = np.searchsorted(lat, np.minimum(y0,y1), side='left')
+    j1 = np.searchsorted(lat, np.maximum(y0,y1), side='left')
+    n = j1-j0
+    edge = np.repeat(np.arange(len(n)), n)
+    row = np.repeat(j0, n)+np.arange(n.sum())-np.repeat(np.cumsum(n)-n, n)
+    # crossing of each edge with each line and first column at its right
+    x = x0[edge]+(lat[row]-y0[edge])*(x1[edge]-x0[edge])/(y1[edge]-y0[edge])
+    col = np.searchsorted(lon, x, side='right')
+    np.add.at(mask, (row,col), 1)
+    return (np.cumsum(mask[:,:-1], axis=1) % 2).astype(bool)
+
+def grid_index(lon, lat, bounds, res):
+    return np.round((lon-bounds[0])/res).astype(np.int64),np.round((lat-bounds[2])/res).astype(np.int64)
+
+def perimeter_points(perims, bounds, res=.005, buffer=5000.):
+    """
+    Rasterize perimeters on a grid of the domain. The grid points inside each perimeter are
+    burning at the time of the perimeter and the grid points at a distance of the perimeter up 
+    to buffer meters are not burning yet. The distance is the euclidean distance transform of 
+    the grid (with the meters of a degree of longitude at the latitude of the perimeter) to the 
+    burning points and the vertices of the polygons, so it is accurate up to the grid resolution.
+    Each polygon is only rasterized on the window of the grid around its bounding box.
+
+    :param perims: list of perimeters from read_perimeters
+    :param bounds: bounds (lonmin,lonmax,latmin,latmax) of the domain
+    :param res: resolution of the grid in degrees
+    :param buffer: distance in meters around each perimeter of the ground points
+    :return fire,ground: lists of arrays (n,3) of lon,lat,time in seconds since epoch
+    """
+    from scipy.ndimage import distance_transform_edt
+    nx,ny = int(np.floor((bounds[1]-bounds[0])/res))+1,int(np.floor((bounds[3]-bounds[2])/res))+1
+    # meters of a degree of latitude and of longitude in the middle of the domain
+    dy_m = 111320.
+    dx_m = dy_m*np.cos(np.radians(.5*(bounds[2]+bounds[3])))
+    bx,by = buffer/dx_m,buffer/dy_m
+    fire,ground = [],[]
+    for perim in perims:
+        # window of the grid around each polygon
+        windows = []
+        for rings in perim['polygons']:
+            i0,j0 = grid_index(rings[0][:,0].min()-bx,rings[0][:,1].min()-by,bounds,res)
+            i1,j1 = grid_index(rings[0][:,0].max()+bx,rings[0][:,1].max()+by,bounds,res)
+            i0,i1,j0,j1 = max(int(i0),0),min(int(i1),nx-1),max(int(j0),0),min(int(j1),ny-1)
+            if i0 <= i1 and j0 <= j1:
+                windows.append((i0,i1,j0,j1,rings))
+        if not windows:
+            continue
+        # masks of the burning points and the boundary of the polygons on the window of all the polygons
+        I0,J0 = min(w[0] for w in windows),min(w[2] for w in windows)
+        I1,J1 = max(w[1] for w in windows),max(w[3] for w in windows)
+        burning = np.zeros((J1-J0+1,I1-I0+1), dtype=bool)
+        for i0,i1,j0,j1,rings in windows:
+            m = scanline_mask(rings, bounds[0]+np.arange(i0,i1+1)*res, bounds[2]+np.arange(j0,j1+1)*res)
+            # a grid point inside any polygon is burning
+            burning[j0-J0:j1-J0+1,i0-I0:i1-I0+1] |= m
+        # the vertices keep the buffer of the polygons thinner than the grid
+        edge = burning.copy()
+        vi,vj = grid_index(*np.concatenate([r for w in windows for r in w[4]]).T, bounds, res)
+        v = (vi >= I0) & (vi <= I1) & (vj >= J0) & (vj <= J1)
+        edge[vj[v]-J0,vi[v]-I0] = True
+        dist = distance_transform_edt(~edge, sampling=(res*dy_m,res*dx_m))
+        for out,m in ((fire,burning),(ground,(dist <= buffer) & ~burning)):
+            jj,ii = np.nonzero(m)
+            out.append(np.c_[bounds[0]+(ii+I0)*res, bounds[2]+(jj+J0)*res, np.full(len(ii), perim['time'])])
+    return fire,ground
+
+def ignition_points(igns, bounds, res=.005, radius=.005):
+    """
+    Grid points burning at each ignition.
+
+    :param igns: list of ignitions as dictionaries with lon, lat and time or as lists [lon,lat,time],
+                 with time as string (YYYY-MM-DD_hh:mm:ss) or seconds since epoch
+    :param bounds: bounds (lonmin,lonmax,latmin,latmax) of the domain
+    :param res: resolution of the grid in degrees
+    :param radius: radius in degrees of the burning disk of each ignition
+    :return fire: list of arrays (n,3) of lon,lat,time in seconds since epoch
+    """
+    fire = []
+    for ign in igns:
+        lon,lat,time = (ign['lon'],ign['lat'],ign['time']) if isinstance(ign, dict) else ign
+        time = time if isinstance(time, (int,float)) else parse_time(time)
+        if time is None:
+            raise PerimeterError('ignition_points - ignition {} with unrecognized time'.format(ign))
+        off = np.arange(-np.floor(radius/res),np.floor(radius/res)+1)*res
+        dx,dy = np.meshgrid(off,off)
+        m = dx**2+dy**2 <= radius**2
+        x,y = lon+dx[m],lat+dy[m]
+        m = (x >= bounds[0]) & (x <= bounds[1]) & (y >= bounds[2]) & (y <= bounds[3])
+        fire.append(np.c_[x[m], y[m], np.full(m.sum(), time)])
+    return fire
+
+def training_data(perims=None, igns=None, bounds=None, tmax=None, res=.005, buffer=5000., radius=.005,
+                    perim_weight=1., ign_weight=1.):
+    """
+    Build the training points of perimeters and ignitions, like vis.sat_collection.training_data
+    on the satellite data.
+
+    :param perims: list of perimeters from read_perimeters
+    :param igns: list of ignitions, see ignition_points
+    :param bounds: bounds (lonmin,lonmax,latmin,latmax) of the domain
+    :param tmax: optional maximum time of the perimeters in seconds since epoch
+    :param res: resolution of the grid in degrees
+    :param buffer: distance in meters around each perimeter of the ground points
+    :param radius: radius in degrees of the burning disk of each ignition
+    :param perim_weight: sample weight of the perimeter points
+    :param ign_weight: sample weight of the ignition points
+    :return X: points (lon,lat,time) with time in days since epoch
+    :return y: labels, 1 for fire and -1 for ground
+    :return sample_weight: sample weights
+    """
+    perims = [p for p in perims or [] if tmax is None or p['time'] <= tmax]
+    fire,ground = perimeter_points(perims, bounds, res, buffer)
+    ign = ignition_points(igns or [], bounds, res, radius)
+    X,y,sw = [],[],[]
+    for pts,label,w in ((fire,1,perim_weight),(ground,-1,perim_weight),(ign,1,ign_weight)):
+        for p in pts:
+            X.append(np.c_[p[:,:2], p[:,2]/86400.])
+            y.append(np.full(len(p), label))
+            sw.append(np.full(len(p), w))
+    if not X:
+        return np.zeros((0,3)), np.zeros(0), np.zeros(0)
+    X,y,sw = np.concatenate(X), np.concatenate(y), np.concatenate(sw)
+    logging.info('training_data - {} fire and {} ground points from {} perimeters and {} ignitions'.format(
+                    (y == 1).sum(),(y == -1).sum(),len(perims),len(igns or [])))
+    return X,y,sw
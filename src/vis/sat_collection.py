@@ -1,7 +1,14 @@
+from ingest.manager import IngestManager
 from utils.general import json_join
+from utils.checkpoint import hash_inputs, file_identity
+from utils.executor import get_executor
+from utils.metrics import timer
+from utils.resources import get_plan
 import utils.saveload as sl
-from vis.sat_granule import TerraGranule,AquaGranule,SNPPGranule
+from vis.sat_granule import TerraGranule,AquaGranule,SNPPGranule,SNPPHRGranule,NOAA20Granule,NOAA20HRGranule
+from vis.detection_store import granule_id, granule_records
 
+import numpy as np
 import os.path as osp
 import logging,sys
 
@@ -16,41 +23,102 @@ class SatCollection(object):
     The parent class of all satellite collection that implements common functionality
     """
 
-    def __init__(self, js):
+    def __init__(self, js, store=None, detections=None):
         """
         Initialize satellite collection from a job.
 
         :param js: Job object. 
+        :param store: optional Checkpoint object where decoded granules are shared between jobs
+        :param detections: optional DetectionStore object where the per-pixel records of the granules are appended
         """
         self.manifest = js.manifest
         self.job_path = js.job_path
         self.bounds = js.bounds
         self.sat_sources = [key for key in self.manifest.keys() if self.manifest[key]]
+        self.store = store
+        self.detections = detections
+        self.ingest = IngestManager.from_job(js)
+
+    def read_granule(self, granule_class, granule):
+        """
+        Read a granule, or load it from the decoded granule store if it was already read
+        from the same files and bounds. Its records are appended to the detection store.
+
+        :param granule_class: SatGranule class of the granule
+        :param granule: granule information from manifest
+        """
+        self.ingest.touch([granule['geo_local_path'],granule['fire_local_path']])
+        data = None
+        if self.store is not None:
+            key = hash_inputs('granule', granule_class.__name__, self.bounds, 
+                            file_identity(granule['geo_local_path']), file_identity(granule['fire_local_path']))
+            data = self.store.load('granule', key)
+        if data is None:
+            with timer('read_granule', item=granule['fire_local_path']):
+                data = granule_class(granule,self.bounds).read_granule()
+            if self.store is not None:
+                self.store.save('granule', key, data)
+        if self.detections is not None:
+            self.detections.append(granule_id(granule), granule_class.platform, 
+                                    granule_records(data, granule_class), self.bounds)
+        return data
 
     def process_data(self):
-        granules = {}
+        """
+        Read all the granules of the manifest in the workers of the executor.
+        """
+        prefixes = {'Terra': ('MOD_',TerraGranule), 'Aqua': ('MYD_',AquaGranule), 'SNPP': ('VNP_',SNPPGranule),
+                    'SNPPHR': ('VNPHR_',SNPPHRGranule), 'NOAA20': ('VJ1_',NOAA20Granule), 'NOAA20HR': ('VJ1HR_',NOAA20HRGranule)}
+        keys,classes,infos = [],[],[]
         for source in self.sat_sources:
             logging.info('SatCollection.process_data - processing sat source {}'.format(source))
-            sys.stdout.flush()
-            if source == 'Terra':
-                for key,granule in self.manifest[source].items():
-                    logging.info('SatCollection.process_data - processing granule {}'.format(key))
-                    sys.stdout.flush()
-                    granules.update({'MOD_'+key: TerraGranule(granule,self.bounds).read_granule()})
-            elif source == 'Aqua':
-                for key,granule in self.manifest[source].items():
-                    logging.info('SatCollection.process_data - processing granule {}'.format(key))
-                    sys.stdout.flush()
-                    granules.update({'MYD_'+key: AquaGranule(granule,self.bounds).read_granule()})
-            elif source == 'SNPP':
-                for key,granule in self.manifest[source].items():
-                    logging.info('SatCollection.process_data - processing granule {}'.format(key))
-                    sys.stdout.flush()
-                    granules.update({'VNP_'+key: SNPPGranule(granule,self.bounds).read_granule()})
-            else:
+            if source not in prefixes:
                 logging.warning('SatCollection.process_data: sat source {} not existent'.format(source))
+                continue
+            prefix,granule_class = prefixes[source]
+            for key,granule in self.manifest[source].items():
+                logging.info('SatCollection.process_data - processing granule {}'.format(key))
+                keys.append(prefix+key)
+                classes.append(granule_class)
+                infos.append(granule)
+        sys.stdout.flush()
+        # the granules decoded at once are limited by the memory budget
+        granules = dict(zip(keys,get_executor().map(self.read_granule, classes, infos, workers=get_plan().decode_workers())))
         logging.info('SatCollection.process_data: granules proccesed {}'.format(list(granules.keys())))
         sat_file = osp.join(self.job_path,'satdata')
         sl.save(granules,sat_file)
         logging.info('SatCollection.process_data: satellite data processed as {}'.format(sat_file))
         return granules
+
+def training_data(granules, fire_classes={8: .5, 9: 1.}, ground_classes={5: 1.}):
+    """
+    Build the training points from the fire mask of the processed granules.
+
+    :param granules: dictionary of granules from SatCollection.process_data
+    :param fire_classes: fire mask classes of fire pixels and their sample weights
+    :param ground_classes: fire mask classes of ground pixels and their sample weights
+    :return X: points (lon,lat,time) with time in days since epoch
+    :return y: labels, 1 for fire and -1 for ground
+    :return sample_weight: sample weights
+    """
+    X,y,sw = [],[],[]
+    for key,granule in granules.items():
+        fire = np.ravel(granule.get('fire',[]))
+        if fire.size == 0 or fire.size != granule['granule_mask'].size:
+            logging.warning('training_data - granule {} without fire mask, ignoring'.format(key))
+            continue
+        mask = granule['granule_mask']
+        lon = np.ravel(granule['lon'])
+        lat = np.ravel(granule['lat'])
+        time = granule['time_num']/86400.
+        for label,classes in ((1,fire_classes),(-1,ground_classes)):
+            for cl,w in classes.items():
+                m = np.logical_and(mask, fire == cl)
+                X.append(np.c_[lon[m], lat[m], np.full(m.sum(), time)])
+                y.append(np.full(m.sum(), label))
+                sw.append(np.full(m.sum(), w))
+    if not X:
+        return np.zeros((0,3)), np.zeros(0), np.zeros(0)
+    X,y,sw = np.concatenate(X), np.concatenate(y), np.concatenate(sw)
+    logging.info('training_data - {} fire and {} ground points'.format((y == 1).sum(),(y == -1).sum()))
+    return X,y,sw
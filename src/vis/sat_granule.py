@@ -1,10 +1,7 @@
+from ingest.compact import swath_window
 from utils.general import Dict
 from utils.times import str_to_dt,dt_to_num
 
-from pyhdf.SD import SD, SDC
-import h5py
-import netCDF4 as nc4
-
 import os.path as osp
 import numpy as np
 import logging
@@ -43,12 +40,15 @@ class SatGranule(object):
     def read_granule(self):
         geo_ds,geo_ext = open_file(self.manifest.geo_local_path)
         fire_ds,fire_ext = open_file(self.manifest.fire_local_path)
-        granule = {}
+        granule = {'time_num': self.time_num, 'platform': self.platform}
+        # only the swath lines around the bounds are read
+        window = self.swath_window(geo_ds)
+        granule.update({'first_line': 0 if window is None else window[0]})
         for key,field in self.geo_fields:
-            granule.update({key: self.read_geo_field(geo_ds,field)})
+            granule.update({key: self.read_geo_field(geo_ds,field,window)})
         granule.update({'granule_mask': self.compute_mask(np.ravel(granule['lat']),np.ravel(granule['lon']))})  
         key,field = self.fire_mask_field
-        granule.update({key: self.read_field(fire_ds,field)})
+        granule.update({key: self.read_field(fire_ds,field,window=window)})
         for key,field in self.geo_fire_fields:
             granule.update({key: self.read_field(fire_ds,field)})
         granule.update({'detect_mask': self.compute_mask(np.ravel(granule['lat_fire']),np.ravel(granule['lon_fire']))})   
@@ -62,7 +62,8 @@ class SatGranule(object):
         close_file(fire_ds,fire_ext)
         return granule
 
-    def pixel_dims(self,sample):
+    @classmethod
+    def pixel_dims(cls,sample):
         """
         Computes pixel dimensions (along-scan and track pixel sizes)
 
@@ -72,10 +73,10 @@ class SatGranule(object):
         :return track: along-track pixel size in km
         """
         Re = 6378 # approximation of the radius of the Earth in km
-        r = Re+self.sat_altitude
-        M = (self.num_cols-1)*0.5
-        s = np.arctan(self.nadir_pixel_res/self.sat_altitude) # trigonometry (deg/sample)
-        alpha = self.angle_changes
+        r = Re+cls.sat_altitude
+        M = (cls.num_cols-1)*0.5
+        s = np.arctan(cls.nadir_pixel_res/cls.sat_altitude) # trigonometry (deg/sample)
+        alpha = cls.angle_changes
         if not alpha is None:
             Ns = np.array([int((alpha[k]-alpha[k-1])/s[k-1]) for k in range(1,len(alpha)-1)])
             Ns = np.append(Ns,int(M-Ns.sum()))
@@ -97,6 +98,15 @@ class SatGranule(object):
             track = r*s*(np.cos(theta)-np.sqrt((Re/r)**2-np.square(np.sin(theta))))
         return (theta,scan,track)
 
+    def swath_window(self,ds):
+        """
+        Window of the swath lines to read, the whole swath by default.
+
+        :param ds: open geolocation file
+        :return: (first,last+1) lines of the window, or None for the whole swath
+        """
+        return None
+
     def compute_mask(self,lats,lons):
         return np.logical_and(np.logical_and(np.logical_and(lons >= self.bounds[0], lons <= self.bounds[1]), lats >= self.bounds[2]), lats <= self.bounds[3])
 
@@ -124,16 +134,19 @@ class MODISGranule(SatGranule):
     def __init__(self, js, bounds):
         super(MODISGranule, self).__init__(js, bounds)
 
-    def read_geo_field(self,ds,field):
-        return self.read_field(ds,field) 
+    def read_geo_field(self,ds,field,window=None):
+        return self.read_field(ds,field,window=window) 
 
     @staticmethod
-    def read_field(ds,field,mask = None):
+    def read_field(ds,field,mask=None,window=None):
         try: 
-            if mask:
-                return np.array(ds.select(field).get())[mask]
+            sds = ds.select(field)
+            if window is None:
+                data = np.array(sds.get())
             else:
-                return np.array(ds.select(field).get())
+                dims = sds.info()[2]
+                data = np.array(sds.get(start=(window[0],0), count=(window[1]-window[0],dims[1])))
+            return data if mask is None else data[mask]
         except:
             return np.array([])  
 
@@ -144,6 +157,7 @@ class MODISGranule(SatGranule):
     geo_fields=[('lat','Latitude'),
                 ('lon','Longitude')]
     fire_fields=[('brig_fire','FP_T21'),
+                ('line_fire','FP_line'),
                 ('sample_fire','FP_sample'),
                 ('conf_fire','FP_confidence'),
                 ('t31_fire','FP_T31'),
@@ -183,17 +197,36 @@ class VIIRSGranule(SatGranule):
     def __init__(self, js, bounds):
         super(VIIRSGranule, self).__init__(js, bounds)
 
+    def swath_window(self,ds,stride=16):
+        """
+        Window of the swath lines with pixels inside the bounds, found on the geolocation 
+        subsampled every stride lines and pixels.
+
+        :param ds: open geolocation file
+        :param stride: subsampling of the lines and pixels
+        :return: (first,last+1) lines of the window
+        """
+        g = ds.groups['geolocation_data']
+        lines = g.variables['latitude'].shape[0]
+        lon = np.array(g.variables['longitude'][::stride,::stride])
+        lat = np.array(g.variables['latitude'][::stride,::stride])
+        # the pixels between the subsampled ones are at most a few pixel sizes away
+        margin = 2.5*stride*self.nadir_pixel_res[0]/111.
+        first,last = swath_window(lon, lat, [self.bounds], margin)
+        return (max(0,(first-1)*stride),min(lines,(last+1)*stride))
+
     @staticmethod
-    def read_geo_field(ds,field):
-        return np.array(ds.groups['geolocation_data'].variables[field]) 
+    def read_geo_field(ds,field,window=None):
+        var = ds.groups['geolocation_data'].variables[field]
+        # single precision, like in the files
+        return np.asarray(var[:] if window is None else var[window[0]:window[1]], dtype=np.float32)
 
     @staticmethod
-    def read_field(ds,field,mask = None):
+    def read_field(ds,field,mask=None,window=None):
         try: 
-            if mask:
-                return np.array(ds.variables[field][:])[mask]
-            else:
-                return np.array(ds.variables[field][:])
+            var = ds.variables[field]
+            data = np.array(var[:] if window is None else var[window[0]:window[1]])
+            return data if mask is None else data[mask]
         except:
             return np.array([]) 
 
@@ -205,6 +238,7 @@ class VIIRSGranule(SatGranule):
     geo_fields=[('lat','latitude'),
                 ('lon','longitude')]
     fire_fields=[('brig_fire','FP_T13'),
+                ('line_fire','FP_line'),
                 ('sample_fire','FP_sample'),
                 ('conf_fire','FP_confidence'),
                 ('t31_fire','FP_T15'),
@@ -223,6 +257,63 @@ class SNPPGranule(VIIRSGranule):
     prefix='VNP'
     platform='S-NPP'
 
+class NOAA20Granule(VIIRSGranule):
+    """
+    NOAA-20 VIIRS (Visible Infrared Imaging Radiometer Suite) satellite source.
+    """
+    def __init__(self, js, bounds):
+        super(NOAA20Granule, self).__init__(js, bounds)
+    
+    # instance variables
+    info_url='https://www.nesdis.noaa.gov/current-satellite-missions/currently-flying/joint-polar-satellite-system'
+    info='NOAA-20 Visible Infrared Imaging Radiometer Suite (VIIRS)'
+    prefix='VJ1'
+    platform='NOAA-20'
+
+class VIIRSHRGranule(VIIRSGranule):
+    """
+    High resolution VIIRS (Visible Infrared Imaging Radiometer Suite) satellite source, from
+    the 375 m I-band products with four times the pixels of the M-band ones.
+    """
+    def __init__(self, js, bounds):
+        super(VIIRSHRGranule, self).__init__(js, bounds)
+
+    # instance variables
+    num_cols=6400
+    nadir_pixel_res=np.array([0.375,0.375/2,0.375/3])
+    fire_fields=[('brig_fire','FP_T4'),
+                ('line_fire','FP_line'),
+                ('sample_fire','FP_sample'),
+                ('conf_fire','FP_confidence'),
+                ('t31_fire','FP_T5'),
+                ('frp_fire','FP_power')]
+
+class SNPPHRGranule(VIIRSHRGranule):
+    """
+    High resolution S-NPP VIIRS (Visible Infrared Imaging Radiometer Suite) satellite source.
+    """
+    def __init__(self, js, bounds):
+        super(SNPPHRGranule, self).__init__(js, bounds)
+    
+    # instance variables
+    info_url='https://www.nasa.gov/mission_pages/NPP/mission_overview/index.html'
+    info='High Resolution S-NPP Visible Infrared Imaging Radiometer Suite (VIIRS)'
+    prefix='VNPHR'
+    platform='S-NPP'
+
+class NOAA20HRGranule(VIIRSHRGranule):
+    """
+    High resolution NOAA-20 VIIRS (Visible Infrared Imaging Radiometer Suite) satellite source.
+    """
+    def __init__(self, js, bounds):
+        super(NOAA20HRGranule, self).__init__(js, bounds)
+    
+    # instance variables
+    info_url='https://www.nesdis.noaa.gov/current-satellite-missions/currently-flying/joint-polar-satellite-system'
+    info='High Resolution NOAA-20 Visible Infrared Imaging Radiometer Suite (VIIRS)'
+    prefix='VJ1HR'
+    platform='NOAA-20'
+
 
 def open_file(path_file):
     """
@@ -237,17 +328,20 @@ def open_file(path_file):
     ext = osp.splitext(path_file)[1]
     logging.info('open_file: open file %s with extension %s' % (path_file, ext))
     if ext == ".nc":
+        import netCDF4 as nc4
         try:
             d = nc4.Dataset(path_file,'r')
         except Exception as e:
             logging.error('open_file: can not open file %s with exception %s' % (path_file,e))
     elif ext == ".hdf":
+        from pyhdf.SD import SD, SDC
         try:
             d = SD(path_file,SDC.READ)
         except Exception as e:
             logging.error('open_file: can not open file %s with exception %s' % (path_file,e))
             raise SatGranuleError('open_file: can not open file %s with exception %s' % (path_file,e))
     elif ext == ".h5":
+        import h5py
         try:
             d = h5py.File(path_file,'r')
         except Exception as e:
@@ -1,6 +1,8 @@
 import netCDF4 as nc
 import numpy as np
 import os.path as osp
+import logging, json, os, hashlib
+from collections import OrderedDict
 
 class WRFFileError(Exception):
     """
@@ -8,69 +10,243 @@ class WRFFileError(Exception):
     """
     pass
 
+def regrid(Fx, Fy, Fz, fxlon, fxlat):
+    """
+    Interpolate a field on a regular lon/lat grid into a structured grid, vectorized.
+    Points outside of the regular grid take the nearest value.
+
+    :param Fx: longitudes of the regular grid of shape (ny,nx), constant along the columns
+    :param Fy: latitudes of the regular grid of shape (ny,nx), constant along the rows
+    :param Fz: field on the regular grid of shape (ny,nx)
+    :param fxlon: longitudes of the target grid
+    :param fxlat: latitudes of the target grid
+    :return: field interpolated into the target grid
+    """
+    from scipy.interpolate import RegularGridInterpolator
+    x = Fx[0,:]
+    y = Fy[:,0]
+    z = Fz
+    if x[0] > x[-1]:
+        x,z = x[::-1],z[:,::-1]
+    if y[0] > y[-1]:
+        y,z = y[::-1],z[::-1,:]
+    interp = RegularGridInterpolator((y,x), z, method='linear', bounds_error=False, fill_value=None)
+    pts = np.c_[np.clip(np.ravel(fxlat),y[0],y[-1]), np.clip(np.ravel(fxlon),x[0],x[-1])]
+    return np.reshape(interp(pts), np.shape(fxlon))
+
 class WRFFile(object):
     """
     Represents the content of one netCDF WRF file.
+
+    The file is opened lazily on first access and the variables read are cached by
+    (name, time step, window), so repeated reads of grids and fields are free. The cache
+    keeps the last variables read up to cache_mb MB.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, cache_mb=512, sidecar_path=None):
         """
         Initialize WRFFile object
+
+        :param path: path to the WRF file
+        :param cache_mb: maximum size in MB of the variables cached
+        :param sidecar_path: folder of the sidecar JSON files, wrf_sidecar in the workspace if None
         """
         if not osp.exists(path):
             raise WRFFileError('WRFFile: path {} provided does not exist'.format(path))
         self.path = path
-        self.dataset = nc.Dataset(path)
-        self.extra_strip()
+        self._dataset = None
+        self.cache_mb = cache_mb
+        self.sidecar_path = sidecar_path
+        self.clear_cache()
+        self.fm = None
+
+    @property
+    def dataset(self):
+        """
+        netCDF4 Dataset, opened on first access
+        """
+        if self._dataset is None:
+            self._dataset = nc.Dataset(self.path)
+        return self._dataset
+
+    def close(self):
+        """
+        Close the netCDF4 Dataset if open
+        """
+        if self._dataset is not None:
+            self._dataset.close()
+            self._dataset = None
+
+    def clear_cache(self):
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+
+    def cache_put(self, key, value):
+        """
+        Cache a variable read, dropping the least recently used ones over cache_mb MB.
+
+        :param key: (name, time step, window) of the variable
+        :param value: array read
+        """
+        self.cache[key] = value
+        self.cache_bytes += value.nbytes
+        while len(self.cache) > 1 and self.cache_bytes > self.cache_mb*(1<<20):
+            _,old = self.cache.popitem(last=False)
+            self.cache_bytes -= old.nbytes
 
     def extra_strip(self):
         """
         Calculate extra strip dimensions
         """
-        m,n = self.dataset.variables['XLONG'][0,:,:].shape
+        m,n = self.dataset.variables['XLONG'].shape[-2:]
         self.m = m
         self.n = n
-        fm,fn = self.dataset.variables['FXLONG'][0,:,:].shape
+        fm,fn = self.dataset.variables['FXLONG'].shape[-2:]
         self.fm = fm-fm//(m+1) # dimensions corrected for extra strip
         self.fn = fn-fn//(n+1)
 
-    def fire_grid(self):
+    def fire_grid(self, ts=0, window=None):
         """
         Read grid from NetCDF4 file
+
+        :param ts: time step
+        :param window: optional hyperslab (i0,i1,j0,j1) of the fire grid
         """
-        fxlon = np.array(self.dataset.variables['FXLONG'][0,:self.fm,:self.fn]) #  masking  extra strip
-        fxlat = np.array(self.dataset.variables['FXLAT'][0,:self.fm,:self.fn])
-        return fxlon,fxlat 
+        fxlon = self.read_var('FXLONG', ts, window) #  masking  extra strip
+        fxlat = self.read_var('FXLAT', ts, window)
+        return fxlon,fxlat
 
-    def atmph_grid(self):
+    def atmph_grid(self, ts=0, window=None):
         """
         Read grid from NetCDF4 file
+
+        :param ts: time step
+        :param window: optional hyperslab (i0,i1,j0,j1) of the atmospheric grid
         """
-        xlon = np.array(self.dataset.variables['XLONG'][0,:,:])
-        xlat = np.array(self.dataset.variables['XLAT'][0,:,:])
-        return xlon,xlat 
+        xlon = self.read_var('XLONG', ts, window)
+        xlat = self.read_var('XLAT', ts, window)
+        return xlon,xlat
 
-    def read_var(self, var, ts=None):
+    def read_var(self, var, ts=None, window=None):
         """
-        Read grid from NetCDF4 file
-        
+        Read variable from NetCDF4 file, masking the extra strip of the fire subgrid variables
+
         :param var: variable name in netCDF file
-        :param ts: time step
+        :param ts: time step, all the time steps if None
+        :param window: optional hyperslab (i0,i1,j0,j1) of the horizontal dimensions
         """
+        key = (var, ts, None if window is None else tuple(window))
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if self.fm is None:
+            self.extra_strip()
         if not var in self.dataset.variables.keys():
             raise WRFFileError('WRFFile: variable {} not in file'.format(var))
-        nsub = len([dim for dim in d.variables[var].dimensions if 'subgrid' in dim])        
-        if nsub == 2:
-            if ts is None:
-                return np.array(d.variables[var][:,:self.fm,:self.fn])
-            else:
-                return np.array(d.variables[var][ts,:self.fm,:self.fn])
+        v = self.dataset.variables[var]
+        nsub = len([dim for dim in v.dimensions if 'subgrid' in dim])
+        i1,j1 = (self.fm,self.fn) if nsub == 2 else v.shape[-2:]
+        if window is not None:
+            i0,wi1,j0,wj1 = window
+            i1,j1 = min(wi1,i1),min(wj1,j1)
+        else:
+            i0,j0 = 0,0
+        index = (slice(None) if ts is None else ts,)+(slice(None),)*(len(v.dimensions)-3)+(slice(i0,i1),slice(j0,j1))
+        logging.debug('WRFFile.read_var - reading {} with index {}'.format(var,index))
+        self.cache_put(key, np.array(v[index]))
+        return self.cache[key]
+
+    def bounds(self):
+        """
+        Domain bounds (lonmin,lonmax,latmin,latmax) of the fire grid, computed only from the grid
+        edges and cached in a sidecar JSON file of the workspace, so the folder of the WRF file 
+        can be read-only.
+        """
+        sidecar = self.sidecar('bounds')
+        st = os.stat(self.path)
+        try:
+            info = json.load(open(sidecar))
+            if info['size'] == st.st_size and info['mtime'] == st.st_mtime:
+                return tuple(info['bounds'])
+        except Exception:
+            pass
+        if self.fm is None:
+            self.extra_strip()
+        edges = []
+        for var in ('FXLONG','FXLAT'):
+            vals = [self.read_var(var, 0, window) for window in ((0,1,0,self.fn),(self.fm-1,self.fm,0,self.fn),
+                                                                (0,self.fm,0,1),(0,self.fm,self.fn-1,self.fn))]
+            edges.append(np.concatenate([np.ravel(v) for v in vals]))
+        bounds = (float(edges[0].min()),float(edges[0].max()),float(edges[1].min()),float(edges[1].max()))
+        try:
+            from utils.general import ensure_dir
+            json.dump({'size': st.st_size, 'mtime': st.st_mtime, 'bounds': bounds}, open(ensure_dir(sidecar),'w'))
+        except Exception as e:
+            logging.warning('WRFFile.bounds - cannot write sidecar {} with exception {}'.format(sidecar,e))
+        return bounds
+
+    def sidecar(self, name):
+        """
+        Path of a sidecar JSON file of the WRF file, unique for its absolute path.
+
+        :param name: name of the information saved in the sidecar
+        """
+        folder = self.sidecar_path
+        if folder is None:
+            # only the file is read, the directories of load_sys_cfg are not created
+            from utils.general import load_json
+            folder = osp.join(osp.abspath(load_json('etc/sys.json').get('workspace_path','work')), 'wrf_sidecar')
+        path = osp.abspath(self.path)
+        digest = hashlib.sha1(path.encode()).hexdigest()[:16]
+        return osp.join(folder, '{0}.{1}.{2}.json'.format(osp.basename(path),digest,name))
+
+    def write_tign(self, tign, ts=0, out_path=None, var='TIGN_G', complevel=4, chunk=512):
+        """
+        Write a fire arrival time into the fire subgrid, in place or into a new netCDF4 file.
+
+        :param tign: fire arrival time on the fire grid of shape (fm,fn), or a tuple (Fx,Fy,Fz) 
+                     with the output of estimate_tign_g to be regridded into FXLONG/FXLAT
+        :param ts: time step to write, also in the new file
+        :param out_path: path of a new compressed and chunked netCDF4 file, in place if None
+        :param var: variable name to write
+        :param complevel: zlib compression level of the new file
+        :param chunk: maximum chunk size in each horizontal dimension of the new file
+        """
+        # the time step of a new file can be after the last time step of this file
+        nt = len(self.dataset.dimensions['Time'])
+        fxlon,fxlat = self.fire_grid(ts if out_path is None else min(ts,nt-1))
+        if isinstance(tign,tuple):
+            logging.info('WRFFile.write_tign - regridding tign into the fire grid of shape {}'.format(fxlon.shape))
+            tign = regrid(tign[0], tign[1], tign[2], fxlon, fxlat)
+        if np.shape(tign) != fxlon.shape:
+            raise WRFFileError('WRFFile: tign shape {} does not match fire grid shape {}'.format(np.shape(tign),fxlon.shape))
+        if out_path is None:
+            logging.info('WRFFile.write_tign - writing {} in place into {}'.format(var,self.path))
+            self.close()
+            with nc.Dataset(self.path,'a') as d:
+                if not var in d.variables.keys():
+                    raise WRFFileError('WRFFile: variable {} not in file'.format(var))
+                d.variables[var][ts,:self.fm,:self.fn] = tign
+            for key in [k for k in self.cache if k[0] == var]:
+                self.cache_bytes -= self.cache.pop(key).nbytes
         else:
-            if ts is None:
-                return np.array(d.variables[var][:,:,:])
-            else:
-                return np.array(d.variables[var][ts,:,:])
+            logging.info('WRFFile.write_tign - writing {} into new file {}'.format(var,out_path))
+            with nc.Dataset(out_path,'w',format='NETCDF4') as d:
+                d.setncatts({k: self.dataset.getncattr(k) for k in self.dataset.ncattrs()})
+                d.createDimension('Time',None)
+                d.createDimension('south_north_subgrid',self.fm)
+                d.createDimension('west_east_subgrid',self.fn)
+                dims = ('Time','south_north_subgrid','west_east_subgrid')
+                chunks = (1,min(self.fm,chunk),min(self.fn,chunk))
+                for name,values in (('FXLONG',fxlon),('FXLAT',fxlat),(var,tign)):
+                    v = d.createVariable(name,'f4',dims,zlib=True,complevel=complevel,chunksizes=chunks)
+                    if name in self.dataset.variables.keys():
+                        src = self.dataset.variables[name]
+                        v.setncatts({k: src.getncattr(k) for k in src.ncattrs() if k != '_FillValue'})
+                    v[ts,:,:] = values
 
-    def __exit__(self):
-        self.dataset.close()
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,8 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import os.path as osp
+import sys
+
+sys.path.insert(0, osp.join(osp.dirname(osp.dirname(osp.abspath(__file__))), 'src'))
@@ -0,0 +1,85 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+import os
+import os.path as osp
+import pytest
+import threading
+
+import utils.saveload as sl
+from utils.checkpoint import Checkpoint, file_identity, hash_inputs, retrieve_key
+from utils.general import Dict
+
+def test_hash_inputs(tmp_path):
+    js = Dict({'bounds': [-122,-121,39,40], 'start_utc': '2024-01-01', 'end_utc': '2024-01-02', 'sat_sources': ['Terra','Aqua']})
+    key = retrieve_key(js)
+    # the order of the sources does not matter, but any other input does
+    assert retrieve_key(Dict(dict(js, sat_sources=['Aqua','Terra']))) == key
+    assert retrieve_key(Dict(dict(js, end_utc='2024-01-03'))) != key
+    assert retrieve_key(Dict(dict(js, bounds=[-122,-121,39,40.5]))) != key
+    assert hash_inputs('ml', key, {'C': 1, 'search': False}) == hash_inputs('ml', key, {'search': False, 'C': 1})
+    assert hash_inputs('ml', key, {'C': 1}) != hash_inputs('process', key, {'C': 1})
+    # the identity of a file changes with its contents and modification time
+    path = str(tmp_path/'perim.kml')
+    with open(path,'w') as f:
+        f.write('a')
+    key = hash_inputs('ml', file_identity(path))
+    os.utime(path, (1e9,1e9))
+    assert hash_inputs('ml', file_identity(path)) != key
+    key = hash_inputs('ml', file_identity(path))
+    with open(path,'w') as f:
+        f.write('ab')
+    os.utime(path, (1e9,1e9))
+    assert hash_inputs('ml', file_identity(path)) != key
+    assert file_identity(str(tmp_path/'missing'))[1:] == [None, None]
+
+def test_save_load(tmp_path):
+    ckpt = Checkpoint(str(tmp_path/'ckpt'))
+    assert ckpt.load('ml', 'k1') is None
+    assert ckpt.save('ml', 'k1', {'a': 1}) == {'a': 1}
+    assert ckpt.load('ml', 'k1') == {'a': 1}
+    assert ckpt.load('ml', 'k2') is None and ckpt.load('process', 'k1') is None
+    assert Checkpoint(str(tmp_path/'ckpt'), enabled=False).load('ml', 'k1') is None
+
+def test_interrupted_save(tmp_path, monkeypatch):
+    ckpt = Checkpoint(str(tmp_path/'ckpt'))
+    # a temporary file left by a killed run is never loaded
+    with open(ckpt.path('ml','k1')+'.tmp','wb') as f:
+        f.write(b'partial')
+    assert ckpt.load('ml', 'k1') is None
+    def interrupted(obj, file):
+        with open(file,'wb') as f:
+            f.write(b'partial')
+        raise KeyboardInterrupt
+    monkeypatch.setattr(sl, 'save', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        ckpt.save('ml', 'k1', {'a': 1})
+    assert not osp.exists(ckpt.path('ml','k1'))
+    assert ckpt.load('ml', 'k1') is None
+    assert os.listdir(ckpt.root) == [osp.basename(ckpt.path('ml','k1'))+'.tmp']
+    monkeypatch.undo()
+    ckpt.save('ml', 'k1', {'a': 1})
+    assert ckpt.load('ml', 'k1') == {'a': 1}
+
+def test_concurrent_save(tmp_path):
+    ckpt = Checkpoint(str(tmp_path/'ckpt'))
+    obj = {'lon': np.arange(200000.), 'lat': np.ones(200000)}
+    errors = []
+    def job(k):
+        try:
+            for _ in range(10):
+                ckpt.save('granule', 'k1', obj)
+                out = ckpt.load('granule', 'k1')
+                assert np.array_equal(out['lon'], obj['lon'])
+        except BaseException as e:
+            errors.append(e)
+    # two jobs with the same granule and bounds save the same key at the same time
+    threads = [threading.Thread(target=job, args=(k,)) for k in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert os.listdir(ckpt.root) == [osp.basename(ckpt.path('granule','k1'))]
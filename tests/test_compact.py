@@ -0,0 +1,94 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import netCDF4 as nc4
+import numpy as np
+import pytest
+
+from bench.synthetic import write_modis, write_viirs
+from ingest.compact import compact_granule, read_geolocation, swath_window
+
+# the window cuts through the fire at (-121.5,39.75)
+boxes = [(-121.7,-121.3,40.25,41.)]
+
+def read_nc(path):
+    # attributes and variables of each group of a netCDF4 file, by group path
+    def walk(g, name, out):
+        g.set_auto_maskandscale(False)
+        out[name] = ({k: g.getncattr(k) for k in g.ncattrs()},
+                     {k: (np.array(v[:]), {a: v.getncattr(a) for a in v.ncattrs()}) for k,v in g.variables.items()})
+        for k,sub in g.groups.items():
+            walk(sub, name+'/'+k, out)
+        return out
+    with nc4.Dataset(path) as d:
+        return walk(d, '', {})
+
+def check_window(before, after, window, shape):
+    r0,r1 = window
+    keep = None
+    if 'FP_line' in before:
+        keep = (before['FP_line'] >= r0) & (before['FP_line'] < r1)
+        assert keep.any() and not keep.all()
+    for name,data in before.items():
+        if data.shape[:2] == tuple(shape):
+            assert np.array_equal(after[name], data[r0:r1])
+        elif name == 'FP_line':
+            assert np.array_equal(after[name], data[keep]-r0)
+        elif name.startswith('FP_'):
+            assert np.array_equal(after[name], data[keep])
+        else:
+            assert np.array_equal(after[name], data)
+
+def test_compact_nc(tmp_path):
+    geo_path,fire_path = write_viirs(str(tmp_path), shape=(1000,480))
+    with nc4.Dataset(geo_path,'a') as d:
+        d.setncatts({'title': 'VNP03MOD', 'orbit': np.int32(36532)})
+        g = d.groups['geolocation_data']
+        g.setncatts({'group_attr': 'lines'})
+        g.variables['latitude'].setncatts({'units': 'degrees_north', 'valid_range': np.array([-90.,90.], dtype=np.float32)})
+        sub = d.createGroup('navigation_data')
+        sub.createDimension('number_of_scans', 7)
+        sub.createVariable('scan_time', 'f8', ('number_of_scans',))[:] = np.arange(7.)
+    with nc4.Dataset(fire_path,'a') as d:
+        d.setncatts({'DayNightFlag': 'Day'})
+    before = {p: read_nc(p) for p in (geo_path,fire_path)}
+    lon,lat = read_geolocation(geo_path)
+    res = compact_granule(geo_path, fire_path, boxes)
+    assert res['window'] == list(swath_window(lon, lat, boxes, .5)) and res['shape'] == list(lon.shape)
+    assert res['window'][1]-res['window'][0] < lon.shape[0]
+    for path in (geo_path,fire_path):
+        after = read_nc(path)
+        # the same groups and attributes
+        assert set(after) == set(before[path])
+        for grp,(attrs,vars) in before[path].items():
+            assert after[grp][0].keys() == attrs.keys()
+            assert all(np.array_equal(after[grp][0][k], v) for k,v in attrs.items())
+            assert after[grp][1].keys() == vars.keys()
+            for name,(_,vattrs) in vars.items():
+                got = after[grp][1][name][1]
+                assert got.keys() == vattrs.keys() and all(np.array_equal(got[k], v) for k,v in vattrs.items())
+            check_window({k: v[0] for k,v in vars.items()}, {k: v[0] for k,v in after[grp][1].items()}, res['window'], res['shape'])
+
+def test_compact_hdf(tmp_path):
+    pytest.importorskip('pyhdf')
+    from pyhdf.SD import SD, SDC
+    geo_path,fire_path = write_modis(str(tmp_path), shape=(1000,480))
+    def read_hdf(path):
+        sd = SD(path, SDC.READ)
+        try:
+            return sd.attributes(), {k: (np.array(sd.select(k).get()), sd.select(k).attributes()) for k in sd.datasets()}
+        finally:
+            sd.end()
+    sd = SD(geo_path, SDC.WRITE)
+    sd.attr('title').set(SDC.CHAR8, 'MOD03')
+    sd.select('Latitude').attr('units').set(SDC.CHAR8, 'degrees')
+    sd.end()
+    before = {p: read_hdf(p) for p in (geo_path,fire_path)}
+    res = compact_granule(geo_path, fire_path, boxes)
+    for path in (geo_path,fire_path):
+        attrs,fields = read_hdf(path)
+        assert attrs == before[path][0]
+        assert fields.keys() == before[path][1].keys()
+        assert all(fields[k][1] == v[1] for k,v in before[path][1].items())
+        check_window({k: v[0] for k,v in before[path][1].items()}, {k: v[0] for k,v in fields.items()}, res['window'], res['shape'])
@@ -0,0 +1,74 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+import pytest
+
+from bench.synthetic import granule_manifest, write_viirs
+from vis.detection_store import DetectionStore, columns, granule_records
+from vis.sat_granule import SNPPGranule
+
+bounds = (-122.5,-120.5,39.,40.5)
+
+@pytest.fixture(scope='module')
+def granule(tmp_path_factory):
+    geo_path,fire_path = write_viirs(str(tmp_path_factory.mktemp('viirs')), shape=(512,480))
+    data = SNPPGranule(granule_manifest(geo_path, fire_path), bounds).read_granule()
+    return data, granule_records(data, SNPPGranule)
+
+def records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rec = {'lon': rng.uniform(-122,-120,n), 'lat': rng.uniform(39,41,n), 'time': np.full(n, 1.5e9),
+            'class': rng.choice([5,8,9], size=n), 'conf': rng.uniform(0,100,n), 'frp': rng.uniform(0,10,n),
+            'scan': rng.uniform(.4,.8,n), 'track': rng.uniform(.4,.8,n)}
+    return {c: np.asarray(v, dtype=columns[c]) for c,v in rec.items()}
+
+def test_granule_records_match_detections(granule):
+    data,rec = granule
+    # the window of the swath does not start at the first line
+    assert data['first_line'] > 0
+    fire = rec['class'] >= 7
+    assert fire.any() and np.isnan(rec['conf'][~fire]).all()
+    assert np.isfinite(rec['conf'][fire]).all() and np.isfinite(rec['frp'][fire]).all()
+    # each fire pixel has the confidence and FRP of the detection at its location
+    det = {(lo,la): (c,f) for lo,la,c,f in zip(data['lon_fire'][data['detect_mask']], data['lat_fire'][data['detect_mask']],
+                                                data['conf_fire'], data['frp_fire'])}
+    for lo,la,c,f in zip(rec['lon'][fire], rec['lat'][fire], rec['conf'][fire], rec['frp'][fire]):
+        assert (c,f) == det[(lo,la)]
+
+def test_round_trip(granule, tmp_path):
+    _,rec = granule
+    store = DetectionStore(str(tmp_path/'store'))
+    n = store.append('g1', 'S-NPP', rec, bounds)
+    assert n == len(rec['lon'])
+    out = store.read(cols=tuple(columns))
+    order = np.lexsort((rec['lat'],rec['lon']))
+    got = np.lexsort((out['lat'],out['lon']))
+    for c in columns:
+        assert out[c].dtype == columns[c]
+        assert np.array_equal(out[c][got], rec[c][order], equal_nan=True)
+    assert store.covers(['g1'], bounds) and not store.covers(['g1','g2'], bounds)
+
+def test_append_twice(tmp_path):
+    rec = records(5000)
+    store = DetectionStore(str(tmp_path/'store'))
+    assert store.append('g1', 'Terra', rec, (-122,-121,39,41)) > 0
+    assert store.append('g1', 'Terra', rec, (-122,-121,39,41)) == 0
+    # a larger region only adds the pixels outside of the previous part
+    store.append('g1', 'Terra', rec, (-122,-120,39,41))
+    out = store.read(cols=tuple(columns))
+    assert len(out['lon']) == len(rec['lon'])
+    assert len(np.unique(np.c_[out['lon'],out['lat']], axis=0)) == len(rec['lon'])
+
+def test_read_sub_region(tmp_path):
+    store = DetectionStore(str(tmp_path/'store'), tile=.1)
+    recs = [records(4000, seed=k) for k in range(3)]
+    for k,rec in enumerate(recs):
+        store.append('g{}'.format(k), 'Aqua', rec, (-122,-120,39,41))
+    sub = (-121.73,-121.02,39.41,40.27)
+    out = store.read(bounds=sub, cols=('lon','lat','conf'))
+    lon,lat,conf = (np.concatenate([r[c] for r in recs]) for c in ('lon','lat','conf'))
+    m = (lon >= sub[0]) & (lon <= sub[1]) & (lat >= sub[2]) & (lat <= sub[3])
+    assert len(out['lon']) == m.sum()
+    assert sorted(zip(out['lon'],out['lat'],out['conf'])) == sorted(zip(lon[m],lat[m],conf[m]))
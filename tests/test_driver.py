@@ -0,0 +1,46 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+import pytest
+
+from driver import Driver, DriverError
+from ml.ensemble import BaggedSVM, TiledSVM
+from ml.svm import SVM
+from utils.general import Dict
+
+class Detections(object):
+    def training_data(self, bounds=None, granules=None):
+        X = np.random.default_rng(0).uniform(size=(2000,3))
+        return X, np.where(X[:,2] > .5, 1, -1), np.ones(2000)
+
+def driver(**job):
+    dv = Driver.__new__(Driver)
+    dv.job = Dict(dict(bounds=(0,1,0,1), **job))
+    dv.detections = Detections()
+    return dv
+
+@pytest.mark.parametrize('job', [{'svm_model': 'forest'}, {'search': True, 'search_mode': 'random'}])
+def test_fit_svm_rejects_unknown_settings(job):
+    with pytest.raises(DriverError):
+        driver(**job).fit_svm(None)
+
+@pytest.mark.parametrize('kind,cls', [('single',SVM), ('tiled',TiledSVM), ('bagged',BaggedSVM)])
+def test_fit_svm_model(kind, cls, monkeypatch, tmp_path):
+    fitted = []
+    monkeypatch.setattr(SVM, 'fit', lambda self, X, y, sample_weight=None: fitted.append(type(self)))
+    monkeypatch.setattr(BaggedSVM, 'fit', lambda self, X, y, sample_weight=None: fitted.append(type(self)))
+    svm = driver(svm_model=kind, ntiles=[2,2], n_estimators=3).fit_svm(None)
+    assert type(svm) is cls
+    assert len(fitted) == (4 if kind == 'tiled' else 1)
+    svm.save_model(str(tmp_path/'svm.pkl'))
+
+@pytest.mark.parametrize('kind', ['single','tiled','bagged'])
+def test_fit_svm_settings(kind, monkeypatch):
+    fitted = []
+    fit = lambda self, X, y, sample_weight=None: fitted.append((self.max_error,self.model.C))
+    monkeypatch.setattr(SVM, 'fit', fit)
+    monkeypatch.setattr(BaggedSVM, 'fit', fit)
+    driver(svm_model=kind, ntiles=[2,2], max_error=.1, C=4.).fit_svm(None)
+    assert fitted and all(f == (.1,4.) for f in fitted)
@@ -0,0 +1,87 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+import pytest
+
+from bench.synthetic import training_set
+from ml.ensemble import BaggedSVM, TiledSVM
+from ml.svm import SVM, benchmark_decision
+from ml.svm_eval import SVMModel
+from utils import executor, resources
+
+@pytest.fixture(scope='module')
+def data():
+    return training_set(12000, .1, seed=1)
+
+def check_ensemble(bag, tmp_path):
+    G = np.random.default_rng(0).uniform(size=(500,3))*bag.scale_dims
+    Z = bag.decision_function(G)
+    assert np.allclose(bag.decision_function(G, blas=False), Z)
+    path = str(tmp_path/'bag.npz')
+    bag.export_model(path, reduced=False)
+    assert np.allclose(SVMModel.load(path).decision_function(G), Z)
+    res = benchmark_decision(bag, npts=(200,), dtypes=(np.float64,))
+    assert res[0]['max_error'] < 1e-8
+
+def test_bagged_fit(data, tmp_path):
+    X,y = data
+    bag = BaggedSVM(n_estimators=3)
+    bag.fit(X, y)
+    assert len(bag.members) == 3
+    check_ensemble(bag, tmp_path)
+
+def test_bagged_grid_cv_and_update(data, tmp_path):
+    X,y = data
+    bag = BaggedSVM(n_estimators=3, param_grid={'C': np.array([1.]), 'gamma': np.array([.5,1.])})
+    bag.grid_cv(X[:11000], y[:11000], search='gram')
+    assert bag.model.gamma in bag.param_grid['gamma']
+    bag.update(X[11000:], y[11000:])
+    assert len(bag.y_train) == len(bag.sample_indices)+1000
+    check_ensemble(bag, tmp_path)
+    tign = bag.update_tign_points(X[11000:11010,0], X[11000:11010,1], np.zeros(10))
+    assert np.isfinite(tign).all()
+
+def test_tiled_fit_shares_the_plan(monkeypatch):
+    monkeypatch.setattr(resources, 'plan', resources.ResourcePlan(memory_gb=4, cpus=8))
+    monkeypatch.setattr(executor, 'executor', executor.Executor('threads', workers=4))
+    plans = []
+    def fit(self, X, y, sample_weight=None):
+        plans.append(self.resources())
+    monkeypatch.setattr(SVM, 'fit', fit)
+    X = np.random.default_rng(0).uniform(size=(2000,3))
+    y = np.where(X[:,2] > .5, 1, -1)
+    tiled = TiledSVM(ntiles=(2,2))
+    tiled.fit(X, y)
+    # the four tiles fitted at the same time split the budget of the process
+    assert len(plans) == 4
+    assert all(p.memory_mb == 1024 and p.cpus == 2 for p in plans)
+    assert all(m.plan is None for m in tiled.models)
+
+def test_bagged_update_refits_affected_members(data):
+    X,y = data
+    bag = BaggedSVM(n_estimators=3)
+    bag.fit(X, y)
+    members = list(bag.members)
+    # one point of each class inside the domain goes to a single member
+    idx = [np.where(bag.y_train == c)[0][0] for c in np.unique(bag.y_train)]
+    bag.update(bag.X_train[idx]+1e-6, bag.y_train[idx])
+    assert bag.members[0] is not members[0]
+    assert bag.members[1] is members[1] and bag.members[2] is members[2]
+    assert sorted(bag.member_samples_[0][-2:]) == [len(bag.y_train)-2,len(bag.y_train)-1]
+    G = np.random.default_rng(0).uniform(size=(500,3))*bag.scale_dims
+    assert np.allclose(bag.decision_function(G, blas=False), bag.decision_function(G))
+
+def test_tiled_single_class_tiles(monkeypatch):
+    monkeypatch.setattr(executor, 'executor', executor.Executor('threads', workers=2))
+    X = np.random.default_rng(0).uniform(size=(2000,3))
+    X[:,0] = np.where(X[:,0] < .5, .8*X[:,0], .8*X[:,0]+.2)
+    X[:2,0] = 0, 1
+    # fire only in the west tile, ground only in the east one
+    y = np.where(X[:,0] < .5, 1, -1)
+    tiled = TiledSVM(ntiles=(2,1), overlap=0.)
+    tiled.fit(X, y)
+    assert tiled.models == [None, None]
+    tign = tiled.estimate_tign_points([.25,.75], [.5,.5])
+    assert np.allclose(tign, tiled.time_bounds)
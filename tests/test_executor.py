@@ -0,0 +1,29 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import os
+
+from utils import executor as ex
+
+def worker_executor(k):
+    e = ex.get_executor()
+    return os.getpid(), e.backend, e.workers, os.environ.get(ex.worker_env)
+
+def test_serial_executor_in_workers(monkeypatch):
+    monkeypatch.delenv(ex.worker_env, raising=False)
+    monkeypatch.setattr(ex, 'executor', None)
+    executor = ex.configure(backend='processes', workers=2)
+    res = executor.map(worker_executor, range(4))
+    assert all(pid != os.getpid() for pid,_,_,_ in res)
+    assert all(r[1:] == ('serial', 1, '1') for r in res)
+    # the submitting process keeps its executor
+    assert ex.get_executor() is executor and ex.worker_env not in os.environ
+
+def test_threads_are_not_workers(monkeypatch):
+    monkeypatch.delenv(ex.worker_env, raising=False)
+    monkeypatch.setattr(ex, 'executor', None)
+    executor = ex.configure(backend='threads', workers=2)
+    res = executor.map(worker_executor, range(4))
+    assert all(r[:2] == (os.getpid(), 'threads') for r in res)
+    assert ex.worker_env not in os.environ
@@ -0,0 +1,13 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import os.path as osp
+
+from utils.general import make_unique_dir
+
+def test_make_unique_dir(tmp_path):
+    path = str(tmp_path/'work'/'case_2024-01-01_00:00:00')
+    paths = [make_unique_dir(path) for _ in range(3)]
+    assert paths == [path, path+'_1', path+'_2']
+    assert all(osp.isdir(p) for p in paths)
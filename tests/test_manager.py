@@ -0,0 +1,36 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import os
+import os.path as osp
+import time
+
+from ingest.manager import IngestManager
+
+def write(path, size):
+    with open(path,'wb') as f:
+        f.write(b'0'*size)
+
+def test_enforce_keeps_locks(tmp_path):
+    manager = IngestManager(str(tmp_path/'ingest'))
+    root = manager.root
+    for k in range(3):
+        geo,fire = osp.join(root,'geo{}.hdf'.format(k)),osp.join(root,'fire{}.hdf'.format(k))
+        for path in (geo,fire):
+            write(path, 1000)
+            write(path+'.size', 4)
+            open(path+'.lock','w').close()
+        manager.add_granule(geo, fire, (0,1,0,1), pin='job{}'.format(k))
+        manager.release('job{}'.format(k))
+        time.sleep(.01)
+    # lock and info files of a file removed by other means
+    write(osp.join(root,'old.hdf.size'), 4)
+    open(osp.join(root,'old.hdf.lock'),'w').close()
+    assert manager.usage() == 6*1000+7*4
+    evicted = manager.enforce(quota_gb=3000/float(1<<30))
+    assert sorted(osp.basename(p) for p in evicted) == ['fire0.hdf','fire1.hdf','geo0.hdf','geo1.hdf']
+    names = sorted(n for n in os.listdir(root) if not n.startswith('ingest_index'))
+    locks = ['{}{}.hdf.lock'.format(n,k) for n in ('fire','geo') for k in range(3)]+['old.hdf.lock']
+    assert names == sorted(locks+['fire2.hdf','fire2.hdf.size','geo2.hdf','geo2.hdf.size'])
+    assert manager.usage() == 2*1000+2*4
@@ -0,0 +1,43 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import json
+import os
+import os.path as osp
+import pytest
+
+from utils.metrics import Metrics
+
+def test_summary(tmp_path):
+    metrics = Metrics()
+    # nothing is recorded before configure
+    metrics.record('ingest', wall=1.)
+    assert metrics.summary()['stages'] == {}
+    metrics.configure(str(tmp_path/'metrics.jsonl'), profile=['ml'])
+    metrics.record('download', item='a.hdf', wall=2., cpu=.5, bytes=1000, data_center='LAADS', peak_rss=10)
+    metrics.record('download', item='b.hdf', wall=3., cpu=.5, bytes=4000, data_center='LAADS', peak_rss=30)
+    metrics.record('download', item='c.nc', wall=1., cpu=.2, bytes=500, data_center='LANCE', status='FAILURE', peak_rss=20)
+    with metrics.timer('ml') as extra:
+        extra['npts'] = 10
+    with pytest.raises(ValueError):
+        with metrics.timer('process'):
+            raise ValueError
+    with open(metrics.path, 'a') as f:
+        f.write('{"stage": "download", "wall"')
+    summary = metrics.write_summary(str(tmp_path/'summary.json'))
+    assert json.load(open(str(tmp_path/'summary.json'))) == json.loads(json.dumps(summary))
+    stages = summary['stages']
+    assert set(stages) == {'download','ml','process'}
+    assert stages['download']['count'] == 3 and stages['download']['failures'] == 1
+    assert stages['download']['wall'] == pytest.approx(6.) and stages['download']['cpu'] == pytest.approx(1.2)
+    assert stages['download']['peak_rss'] == 30
+    assert stages['process']['failures'] == 1 and stages['ml']['failures'] == 0
+    assert stages['ml']['peak_rss'] > 0 and summary['peak_rss'] >= stages['ml']['peak_rss']
+    centers = summary['data_centers']
+    assert centers['LAADS'] == {'count': 2, 'bytes': 5000, 'wall': 5., 'throughput': 1000.}
+    assert centers['LANCE']['bytes'] == 500 and centers['LANCE']['throughput'] == pytest.approx(500.)
+    # the profiled stage is saved
+    assert any(p.startswith('ml_') for p in os.listdir(osp.join(str(tmp_path),'profiles')))
+    records = [json.loads(l) for l in open(metrics.path) if l.endswith('}\n')]
+    assert [r['npts'] for r in records if r['stage'] == 'ml'] == [10]
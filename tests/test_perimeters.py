@@ -0,0 +1,61 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+
+from vis.perimeters import perimeter_points, scanline_mask
+
+def point_in_rings(x, y, rings):
+    # reference even-odd rule, crossing number of a ray to the right of each point with each edge
+    inside = np.zeros(np.shape(x), dtype=bool)
+    for ring in rings:
+        for (x0,y0),(x1,y1) in zip(ring, np.roll(ring,-1,axis=0)):
+            if y0 == y1:
+                continue
+            cross = ((y0 <= y) & (y < y1)) | ((y1 <= y) & (y < y0))
+            xc = x0+(y-y0)*(x1-x0)/(y1-y0)
+            inside ^= cross & (xc < x)
+    return inside
+
+def star(cx, cy, r0, r1, n, phase=0.):
+    a = phase+np.linspace(0, 2*np.pi, 2*n, endpoint=False)
+    r = np.where(np.arange(2*n) % 2, r0, r1)
+    return np.c_[cx+r*np.cos(a), cy+r*np.sin(a)]
+
+def test_scanline_mask_holes():
+    rng = np.random.default_rng(0)
+    # outer star with two holes, one of them with an island inside, and vertices on grid lines
+    rings = [star(.5, .5, .25, .45, 9), star(.4, .5, .05, .12, 5, .3), star(.65, .55, .08, .13, 7, .1),
+             star(.65, .55, .02, .04, 4)]
+    rings.append(np.array([[.1,.1],[.3,.1],[.3,.2],[.1,.2]]))
+    lon = np.sort(rng.uniform(0, 1, 157))
+    lat = np.r_[np.linspace(0, 1, 101)]
+    m = scanline_mask(rings, lon, lat)
+    gx,gy = np.meshgrid(lon, lat)
+    assert m.shape == gx.shape
+    assert np.array_equal(m, point_in_rings(gx, gy, rings))
+    assert m.sum() > 0 and (~m).sum() > 0
+
+def test_perimeter_buffer_meters():
+    bounds = (-120., -119., 38., 39.)
+    res = .002
+    square = np.array([[-119.6,38.4],[-119.4,38.4],[-119.4,38.6],[-119.6,38.6]])
+    fire,ground = perimeter_points([{'time': 0., 'polygons': [[square]]}], bounds, res=res, buffer=3000.)
+    fire,ground = fire[0],ground[0]
+    assert len(fire) and len(ground)
+    # distance in meters to the square, which is the distance to its boundary outside of it
+    kx,ky = 111320.*np.cos(np.radians(38.5)),111320.
+    dx = np.maximum(np.maximum(-119.6-ground[:,0], ground[:,0]+119.4), 0)*kx
+    dy = np.maximum(np.maximum(38.4-ground[:,1], ground[:,1]-38.6), 0)*ky
+    d = np.hypot(dx, dy)
+    assert d.max() <= 3000.+res*ky
+    # all the grid points in the buffer are ground points
+    gx,gy = np.meshgrid(np.arange(-119.65,-119.35,res), np.arange(38.35,38.65,res))
+    dx = np.maximum(np.maximum(-119.6-gx, gx+119.4), 0)*kx
+    dy = np.maximum(np.maximum(38.4-gy, gy-38.6), 0)*ky
+    near = (np.hypot(dx, dy) > res*ky) & (np.hypot(dx, dy) < 3000.-res*ky)
+    pts = set(map(tuple, np.round(ground[:,:2]/res).astype(int)))
+    assert all(p in pts for p in map(tuple, np.round(np.c_[gx[near],gy[near]]/res).astype(int)))
+    # the buffer is in meters, so it is wider in degrees of longitude than of latitude
+    assert ground[:,0].max()-(-119.4) > ground[:,1].max()-38.6
@@ -0,0 +1,74 @@
+#
+# Angel Farguell, CU Denver
+#
+
+from datetime import datetime, timedelta
+import os.path as osp
+
+from ingest import planner
+from ingest.planner import RetrievalPlanner
+from utils.checkpoint import Checkpoint, retrieve_key
+from utils.general import Dict
+
+def job(path, bounds, start, days, sources=('Terra',)):
+    start = datetime(2024,1,1)+timedelta(days=start)
+    end = start+timedelta(days=days)
+    return Dict({'bounds': bounds, 'from_utc': start, 'to_utc': end, 'start_utc': start.isoformat(), 'end_utc': end.isoformat(),
+                'sat_sources': list(sources), 'workspace_path': str(path)})
+
+class Source(object):
+    queries = []
+
+    def __init__(self, js):
+        self.js = js
+
+    def retrieve_data(self):
+        # one granule every 12 hours of the query window
+        Source.queries.append((self.js.bounds,self.js.from_utc,self.js.to_utc))
+        granules = {}
+        t = self.js.from_utc
+        while t <= self.js.to_utc:
+            fmt = '%Y-%m-%dT%H:%M:%S.000Z'
+            granules[t.isoformat()] = {'time_start_iso': t.strftime(fmt), 'time_end_iso': (t+timedelta(minutes=5)).strftime(fmt)}
+            t += timedelta(hours=12)
+        return granules
+
+def test_union_queries(tmp_path, monkeypatch):
+    monkeypatch.setattr(planner, 'sat_classes', {'Terra': Source, 'Aqua': Source})
+    Source.queries = []
+    rp = RetrievalPlanner.__new__(RetrievalPlanner)
+    # 0 and 2 only overlap through 1, 3 overlaps 0 in space but not in time, 4 does not request Terra
+    rp.jobs = [job(tmp_path/'j0', (-122,-121,39,40), 0, 2),
+               job(tmp_path/'j1', (-121.5,-120.5,39.5,40.5), 1, 2),
+               job(tmp_path/'j2', (-120.8,-120,40.2,41), 2.5, 1),
+               job(tmp_path/'j3', (-122,-121,39,40), 10, 1),
+               job(tmp_path/'j4', (-122,-121,39,40), 0, 2, sources=('Aqua',))]
+    assert sorted(map(sorted, rp.groups('Terra'))) == [[0,1,2],[3]]
+    assert rp.groups('Aqua') == [[4]]
+    plan = {(s,tuple(g)): js for s,js,g in rp.plan()}
+    assert set(plan) == {('Terra',(0,1,2)), ('Terra',(3,)), ('Aqua',(4,))}
+    union = plan[('Terra',(0,1,2))]
+    assert union.bounds == (-122,-120,39,41)
+    assert union.from_utc == rp.jobs[0].from_utc and union.to_utc == rp.jobs[2].to_utc
+    manifests = rp.run(max_workers=2)
+    # one query for each group
+    assert len(Source.queries) == 3
+    for js,manifest in zip(rp.jobs,manifests):
+        source = js.sat_sources[0]
+        granules = manifest[source]
+        assert granules and all(planner.in_window(g, js) for g in granules.values())
+        # the granules of the union query in the window of the job
+        assert len(granules) == int(round((js.to_utc-js.from_utc).total_seconds()/43200.))+1
+        ckpt = Checkpoint(osp.join(js.workspace_path,'checkpoints'))
+        assert ckpt.load('retrieve', retrieve_key(js)) == manifest
+
+def test_failed_union(tmp_path, monkeypatch):
+    class Failed(Source):
+        def retrieve_data(self):
+            raise RuntimeError('CMR is down')
+    monkeypatch.setattr(planner, 'sat_classes', {'Terra': Failed})
+    rp = RetrievalPlanner.__new__(RetrievalPlanner)
+    rp.jobs = [job(tmp_path/'j0', (-122,-121,39,40), 0, 2)]
+    rp.run()
+    # the job is retrieved again by its Driver
+    assert Checkpoint(osp.join(rp.jobs[0].workspace_path,'checkpoints')).load('retrieve', retrieve_key(rp.jobs[0])) is None
@@ -0,0 +1,36 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import json
+import os
+
+from utils import resources
+
+def test_get_plan_without_directories(tmp_path, monkeypatch):
+    os.makedirs(str(tmp_path/'etc'))
+    json.dump({'resources': {'memory_gb': 2, 'cpus': 4}}, open(str(tmp_path/'etc'/'sys.json'),'w'))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(resources, 'plan', None)
+    plan = resources.get_plan()
+    assert plan.memory_mb == 2048 and plan.cpus == 4
+    assert sorted(os.listdir(str(tmp_path))) == ['etc']
+
+def test_share_splits_memory_and_cores():
+    plan = resources.ResourcePlan(memory_gb=4, cpus=8)
+    share = plan.share(4)
+    assert share.memory_mb == 1024 and share.cpus == 2 and share.jobs == 4
+    assert plan.memory_mb == 4096 and plan.cpus == 8
+    assert share.cache_mb(5000) == plan.cache_mb(5000, fits=4)
+
+def test_grid_tile_is_bounded():
+    plan = resources.ResourcePlan(memory_gb=1024, cpus=8)
+    for n in ((50,60,40),(400,400,40),(4000,4000,80)):
+        tx,ty = plan.grid_tile(n)
+        # small grids are a single tile, the others tiles of at most max_grid_points whatever the budget
+        assert tx <= n[0] and ty <= n[1]
+        assert tx*ty*n[2] <= plan.max_grid_points
+    assert plan.grid_tile((50,60,40)) == (50,60)
+    # a small budget gives smaller tiles
+    small = resources.ResourcePlan(memory_gb=.01, cpus=1)
+    assert small.grid_tile((400,400,40))[0] < plan.grid_tile((400,400,40))[0]
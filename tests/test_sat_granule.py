@@ -0,0 +1,58 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import netCDF4 as nc4
+import numpy as np
+import pytest
+
+from bench.synthetic import granule_manifest, write_viirs
+from vis.sat_granule import NOAA20Granule, NOAA20HRGranule, SNPPGranule, SNPPHRGranule, VIIRSGranule, VIIRSHRGranule
+
+@pytest.fixture(scope='module')
+def viirs(tmp_path_factory):
+    return write_viirs(str(tmp_path_factory.mktemp('viirs')), shape=(1000,480))
+
+@pytest.mark.parametrize('granule_class', [SNPPGranule, NOAA20Granule, SNPPHRGranule, NOAA20HRGranule])
+@pytest.mark.parametrize('bounds', [(-122.5,-120.5,39.,40.5), (-125.,-124.,30.,33.), (-140.,-100.,20.,60.)])
+def test_swath_window(viirs, granule_class, bounds):
+    granule = granule_class(granule_manifest(*viirs), bounds)
+    stride = 16
+    with nc4.Dataset(viirs[0]) as d:
+        window = granule.swath_window(d, stride=stride)
+        g = d.groups['geolocation_data']
+        lon,lat = np.array(g.variables['longitude'][:]),np.array(g.variables['latitude'][:])
+    # the window covers all the lines with pixels inside the bounds
+    lines = np.nonzero(granule.compute_mask(lat,lon).any(axis=1))[0]
+    assert len(lines)
+    assert window[0] <= lines[0] and window[1] >= lines[-1]+1
+    # and its edges are on the subsampled lines or the end of the swath
+    assert window[0] % stride == 0
+    assert window[1] % stride == 0 or window[1] == lon.shape[0]
+    assert 0 <= window[0] < window[1] <= lon.shape[0]
+
+def test_window_read(viirs):
+    bounds = (-122.5,-120.5,39.,40.5)
+    granule = SNPPGranule(granule_manifest(*viirs), bounds)
+    data = granule.read_granule()
+    with nc4.Dataset(viirs[0]) as d:
+        window = granule.swath_window(d)
+        lat = np.array(d.groups['geolocation_data'].variables['latitude'][:])
+    assert data['first_line'] == window[0] and window[1]-window[0] < lat.shape[0]
+    assert np.array_equal(data['lat'], lat[window[0]:window[1]])
+    assert data['fire'].shape == data['lat'].shape
+
+def test_iband_geometry():
+    assert VIIRSHRGranule.num_cols == 2*VIIRSGranule.num_cols
+    assert np.allclose(VIIRSHRGranule.nadir_pixel_res, VIIRSGranule.nadir_pixel_res/2)
+    for cls in (VIIRSGranule,VIIRSHRGranule):
+        with np.errstate(invalid='ignore'):
+            _,scan,track = cls.pixel_dims(np.arange(cls.num_cols, dtype=float))
+        # nadir pixels of the nadir resolution, growing towards the symmetric edges of the swath
+        assert scan[cls.num_cols//2] == pytest.approx(cls.nadir_pixel_res[0], rel=1e-3)
+        assert track[cls.num_cols//2] == pytest.approx(cls.nadir_pixel_res[0], rel=1e-3)
+        assert scan[0] == pytest.approx(scan[-1]) and scan[0] > 2.5*scan[cls.num_cols//2]
+    _,scan_m,_ = VIIRSGranule.pixel_dims(np.array([0.,800.]))
+    _,scan_i,_ = VIIRSHRGranule.pixel_dims(np.array([0.,1600.]))
+    # the I-band pixels are half of the M-band pixels at the same scan angle
+    assert np.allclose(scan_i, scan_m/2, rtol=1e-2)
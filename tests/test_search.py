@@ -0,0 +1,73 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+import pytest
+import sklearn.metrics
+import sklearn.model_selection
+import sklearn.svm
+
+from bench.synthetic import training_set
+from ml.svm import GramSearchCV, HalvingSearchCV, stratified_subsample
+
+@pytest.fixture(scope='module')
+def data():
+    X,y = training_set(1500, .3, seed=0)
+    X = (X-X.min(axis=0))/(X.max(axis=0)-X.min(axis=0))
+    return X,y
+
+@pytest.fixture(scope='module')
+def grid_search(data):
+    X,y = data
+    scorer = sklearn.metrics.make_scorer(sklearn.metrics.f1_score, average='weighted')
+    gs = sklearn.model_selection.GridSearchCV(sklearn.svm.SVC(class_weight='balanced'), param_grid, scoring=scorer, cv=3)
+    return gs.fit(X, y)
+
+param_grid = {'C': np.array([.5,1.,2.]), 'gamma': np.array([5.,20.,80.])}
+
+def scores(search):
+    return {(p['C'],p['gamma']): s for p,s in zip(search.cv_results_['params'],search.cv_results_['mean_test_score'])}
+
+@pytest.mark.parametrize('n_jobs,max_mb', [(1,1024), (2,1024), (2,1e-3)])
+def test_gram_search_matches_grid_search(data, grid_search, n_jobs, max_mb):
+    X,y = data
+    gram = GramSearchCV(sklearn.svm.SVC(class_weight='balanced'), param_grid, cv=3, n_jobs=n_jobs, max_mb=max_mb).fit(X, y)
+    expected = scores(grid_search)
+    got = scores(gram)
+    assert set(got) == set(expected)
+    for k in expected:
+        assert got[k] == pytest.approx(expected[k], abs=1e-6)
+    assert gram.best_params_ == grid_search.best_params_
+    assert gram.best_estimator_.get_params() == grid_search.best_estimator_.get_params()
+
+@pytest.fixture(scope='module')
+def separable():
+    # sphere with a margin around its boundary
+    X = np.random.default_rng(0).uniform(size=(6000,3))
+    d = np.sum((X-.5)**2, axis=1)
+    m = np.abs(d-.1) > .02
+    return X[m], np.where(d[m] < .1, 1, -1)
+
+def test_halving_search_matches_grid_search(separable):
+    X,y = separable
+    grid = {'C': np.array([.1,1.,10.]), 'gamma': np.array([.01,.1,1.])}
+    scorer = sklearn.metrics.make_scorer(sklearn.metrics.f1_score, average='weighted')
+    gs = sklearn.model_selection.GridSearchCV(sklearn.svm.SVC(class_weight='balanced'), grid, scoring=scorer, cv=3).fit(X, y)
+    hs = HalvingSearchCV(sklearn.svm.SVC(class_weight='balanced'), grid, cv=3, factor=3, min_resources=300).fit(X, y)
+    assert hs.best_params_ == gs.best_params_
+    assert hs.best_estimator_.get_params() == gs.best_estimator_.get_params()
+    # 9 candidates, then 3, and the last one left is not scored again
+    assert hs.cv_results_['iter'] == [0]*9+[1]*3
+    assert max(hs.cv_results_['n_resources']) < len(y)
+
+def test_stratified_subsample_keeps_classes():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(size=(20000,3))
+    y = np.where(rng.random(20000) < .01, 1, -1)
+    idx = stratified_subsample(X, y, 500)
+    assert len(idx) == len(np.unique(idx)) and abs(len(idx)-500) <= 100
+    # each (tile,class) stratum keeps at least one point, so the rare class is not lost
+    assert set(y[idx]) == {-1,1}
+    assert (y[idx] == 1).sum() >= np.mean(y == 1)*len(idx)
+    assert np.array_equal(stratified_subsample(X, y, len(y)), np.arange(len(y)))
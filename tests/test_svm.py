@@ -0,0 +1,93 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+import os.path as osp
+import pytest
+
+from bench.synthetic import fitted_svm, training_set
+from ml.svm import SVM, HalvingSearchCV
+
+def test_hyper_opt_keeps_grid():
+    X,y = training_set(500, .3, seed=0)
+    grid = {'C': np.array([1.]), 'gamma': np.array([.5,1.,2.])}
+    svm1, svm2 = SVM(grid), SVM(grid)
+    svm1.hyper_opt(X)
+    svm2.hyper_opt(X)
+    assert np.array_equal(grid['gamma'], [.5,1.,2.])
+    assert np.allclose(svm1.param_grid['gamma'], svm1.gamma*grid['gamma'])
+    assert np.allclose(svm2.param_grid['gamma'], svm1.param_grid['gamma'])
+    svm1.hyper_opt(X)
+    assert np.allclose(svm1.param_grid['gamma'], svm2.param_grid['gamma'])
+
+def test_update_predict(tmp_path):
+    X,y = training_set(12000, .1, seed=1)
+    svm = SVM()
+    svm.fit(X[:11000], y[:11000])
+    svm.update(X[11000:], y[11000:])
+    assert len(svm.support_history_) == len(svm.model.support_)
+    assert svm.support_history_.max() < len(svm.y_train)
+    Xs = svm.scaler.transform(X)*svm.scale_dims
+    assert set(np.unique(svm.model.predict(Xs))) <= {-1,1}
+    assert np.allclose(svm.decision_function(Xs, mthreads=False, blas=False), svm.decision_function(Xs))
+    # a second update selects the working set from the history
+    svm.update(X[11500:], y[11500:])
+    Xh = svm.scaler.transform(svm.X_train[svm.support_history_])*svm.scale_dims
+    assert np.allclose(Xh, svm.model.support_vectors_)
+    path = str(tmp_path/'svm.pkl')
+    svm.save_model(path)
+    loaded = SVM.load_model(path)
+    assert loaded.X_train is None and svm.X_train is not None
+    assert np.array_equal(loaded.model.predict(Xs), svm.model.predict(Xs))
+
+def test_reduce_svc_smooth_model():
+    import sklearn.svm
+    from ml.svm import reduce_svc
+    rng = np.random.default_rng(1)
+    X = rng.uniform(size=(4000,3))
+    y = np.where(np.sum((X-.5)**2,axis=1) < .1, 1, -1)
+    model = sklearn.svm.SVC(gamma=1., C=1.).fit(X, y)
+    reduced = reduce_svc(model, 1e-2)
+    assert len(reduced) <= len(model.support_)//4
+    G = rng.uniform(-.1, 1.1, size=(20000,3))
+    assert np.abs(reduced.decision_function(G)-model.decision_function(G)).max() <= 1e-2
+
+def test_compress_fire_model():
+    X,y = training_set(6000, .2, seed=0)
+    svm = SVM(max_error=.3)
+    svm.fit(X, y)
+    nsv = len(svm.model.support_)
+    assert len(svm.reduced) <= nsv//2
+    G = np.random.default_rng(5).uniform(size=(20000,3))*svm.scale_dims
+    assert np.abs(svm.decision_function(G)-svm.model.decision_function(G)).max() <= .3
+
+def test_tune_twice():
+    X,y = training_set(4000, .2, seed=0)
+    svm = SVM({'C': np.array([1.,2.]), 'gamma': np.array([1.])})
+    svm.grid_cv(X, y, search='gram')
+    assert svm.model.C in (1.,2.) and svm.search_cv.best_params_['C'] == svm.model.C
+    svm.grid_cv(X, y, search='halving')
+    assert isinstance(svm.search_cv, HalvingSearchCV)
+    svm.tune(svm.scaler.transform(svm.X_train)*svm.scale_dims, svm.y_train)
+    assert svm.search_cv.best_params_['C'] == svm.model.C
+
+def test_import_without_netcdf():
+    import subprocess, sys
+    import ml.svm
+    src = osp.dirname(osp.dirname(osp.abspath(ml.svm.__file__)))
+    code = 'import sys, ml.svm, ml.ensemble; print("netCDF4" in sys.modules)'
+    out = subprocess.run([sys.executable, '-c', code], cwd=src, capture_output=True, text=True)
+    assert out.stdout.strip() == 'False'
+
+@pytest.fixture(scope='module')
+def svm():
+    return fitted_svm()
+
+@pytest.mark.parametrize('dtype,tol', [(np.float64,1e-10), (np.float32,1e-5)])
+def test_blas_decision_function(svm, dtype, tol):
+    model = svm.model
+    # inside and around the training domain
+    G = np.random.default_rng(0).uniform(-.1, 1.1, size=(20000,3))*svm.scale_dims
+    Z = model.decision_function(G)
+    assert np.abs(svm.decision_function(G, dtype=dtype)-Z).max() <= tol*np.abs(model.dual_coef_).sum()
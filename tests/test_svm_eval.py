@@ -0,0 +1,61 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import numpy as np
+import pytest
+
+from ml.svm_eval import estimate_tign, estimate_tign_points
+
+# domain (lon,lat,time) and scaling of the dimensions
+lo = np.array([-120., 38., 0.])
+hi = np.array([-119.5, 38.4, 10.])
+scale_dims = np.array([1., .8, 2.5])
+
+def transform(X):
+    return (X-lo)/(hi-lo)
+
+def inverse_transform(X):
+    return X*(hi-lo)+lo
+
+def arrival(x, y):
+    # arrival time in [0,1] scaled time, not burned in the corner x+y > 1.37
+    return np.where(x+y > 1.37, 2., .2+.3*x+.2*y)
+
+def decision_function(G):
+    x,y,z = (G/scale_dims).T
+    return arrival(x, y)-z
+
+@pytest.mark.parametrize('tile', [None, (3,4)])
+def test_grid_and_points_agree(tile):
+    n = (9,11,40)
+    Fx,Fy,Fz = estimate_tign(decision_function, scale_dims, inverse_transform, n, tile)
+    tign = estimate_tign_points(decision_function, scale_dims, transform, inverse_transform, Fx, Fy, n[2], block=7)
+    assert np.allclose(tign, Fz)
+    # not burned columns are filled with the end of the time interval
+    P = transform(np.c_[np.ravel(Fx), np.ravel(Fy), np.zeros(Fx.size)])
+    t = arrival(P[:,0], P[:,1])
+    t[t > 1] = 1.
+    expected = np.reshape(inverse_transform(np.c_[P[:,:2], t])[:,2], Fx.shape)
+    assert np.allclose(Fz, expected, atol=1e-6)
+    assert np.allclose(Fx[0], np.linspace(lo[0], hi[0], n[1]))
+    assert np.allclose(Fy[:,0], np.linspace(lo[1], hi[1], n[0]))
+
+def test_points_blocks():
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(lo[0], hi[0], (13,5))
+    lat = rng.uniform(lo[1], hi[1], (13,5))
+    full = estimate_tign_points(decision_function, scale_dims, transform, inverse_transform, lon, lat, 30, block=lon.size)
+    for block in (1,8):
+        tign = estimate_tign_points(decision_function, scale_dims, transform, inverse_transform, lon, lat, 30, block=block)
+        assert tign.shape == lon.shape
+        assert np.array_equal(tign, full)
+
+def test_npz_memmap(tmp_path):
+    from ml.svm_eval import npz_memmap
+    arrays = {'a': np.arange(70000.), 'b': np.ones((3,4), order='F'), 'c': np.array(2.5)}
+    path = str(tmp_path/'arrays.npz')
+    np.savez(path, **arrays)
+    d = npz_memmap(path)
+    for k,v in arrays.items():
+        assert np.array_equal(d[k], v)
@@ -0,0 +1,68 @@
+#
+# Angel Farguell, CU Denver
+#
+
+import json
+import netCDF4 as nc
+import numpy as np
+import os
+import pytest
+
+from wrf.wrf_file import WRFFile
+
+@pytest.fixture
+def wrf_path(tmp_path):
+    # atmospheric grid 4x5 with fire subgrid refinement 2 and its extra strip
+    m,n,sr = 4,5,2
+    path = str(tmp_path/'wrfinput_d01')
+    with nc.Dataset(path,'w') as d:
+        d.createDimension('Time',None)
+        d.createDimension('south_north',m)
+        d.createDimension('west_east',n)
+        d.createDimension('south_north_subgrid',(m+1)*sr)
+        d.createDimension('west_east_subgrid',(n+1)*sr)
+        fy,fx = np.meshgrid(np.linspace(38.,38.4,(m+1)*sr), np.linspace(-120.,-119.5,(n+1)*sr), indexing='ij')
+        for name,values,sub in (('XLONG',fx[::sr,::sr][:m,:n],''),('XLAT',fy[::sr,::sr][:m,:n],''),
+                                ('FXLONG',fx,'_subgrid'),('FXLAT',fy,'_subgrid'),('TIGN_G',np.zeros(fx.shape),'_subgrid')):
+            v = d.createVariable(name,'f4',('Time','south_north'+sub,'west_east'+sub))
+            v[0] = values
+    return path
+
+def test_write_tign_new_file_time_step(wrf_path, tmp_path):
+    out_path = str(tmp_path/'tign.nc')
+    with WRFFile(wrf_path) as wrf:
+        fxlon,fxlat = wrf.fire_grid()
+        tign = fxlon+fxlat
+        wrf.write_tign(tign, ts=1, out_path=out_path)
+    with nc.Dataset(out_path) as d:
+        assert d.variables['TIGN_G'].shape == (2,)+fxlon.shape
+        assert np.allclose(d.variables['TIGN_G'][1], tign)
+        assert np.allclose(d.variables['FXLONG'][1], fxlon)
+
+def test_bounded_cache(wrf_path):
+    with WRFFile(wrf_path, cache_mb=1e-4) as wrf:
+        wrf.fire_grid()
+        wrf.atmph_grid()
+        assert len(wrf.cache) == 1
+        assert wrf.cache_bytes == sum(v.nbytes for v in wrf.cache.values())
+        assert wrf.cache_bytes <= 1e-4*(1<<20)
+
+def test_bounds_sidecar(wrf_path, tmp_path):
+    sidecar_path = str(tmp_path/'sidecar')
+    with WRFFile(wrf_path, sidecar_path=sidecar_path) as wrf:
+        bounds = wrf.bounds()
+    assert np.allclose(bounds, (-120.,-120.+9*.5/11,38.,38.+7*.4/9), atol=1e-4)
+    assert os.listdir(sidecar_path) and not os.path.exists(wrf_path+'.bounds.json')
+    with WRFFile(wrf_path, sidecar_path=sidecar_path) as wrf:
+        assert wrf.bounds() == bounds and wrf._dataset is None
+
+def test_default_sidecar_without_directories(wrf_path, tmp_path, monkeypatch):
+    run = tmp_path/'run'
+    os.makedirs(str(run/'etc'))
+    json.dump({'workspace_path': 'ws'}, open(str(run/'etc'/'sys.json'),'w'))
+    monkeypatch.chdir(run)
+    with WRFFile(wrf_path) as wrf:
+        wrf.bounds()
+    # only the sidecar folder in the workspace is created
+    assert sorted(os.listdir(str(run))) == ['etc','ws']
+    assert os.listdir(str(run/'ws')) == ['wrf_sidecar']